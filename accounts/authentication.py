@@ -0,0 +1,124 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+
+def cache_setting(name, default):
+    return getattr(settings, "JWT_AUTH_CACHE", {}).get(name, default)
+
+
+class LRUCache:
+    """A thread-safe mapping that drops the least recently used entry when full"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# raw token digest -> validated token
+token_cache = LRUCache(cache_setting("TOKEN_CACHE_SIZE", 10000))
+# user id -> (expiry, user)
+user_cache = LRUCache(cache_setting("USER_CACHE_SIZE", 10000))
+
+
+def forget_user(user_id):
+    """Drop a cached user, e.g. because the row changed"""
+    user_cache.pop(str(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+        JWTAuthentication that remembers what it has already checked.
+
+        Verified tokens are kept in a bounded LRU keyed by a hash of the raw
+        token, so a token's signature is checked once and not on every
+        request. Users are kept for JWT_AUTH_CACHE["USER_TTL"] seconds and
+        dropped as soon as their row is saved or deleted in this process,
+        which covers deactivation. Other processes catch up within the TTL.
+    """
+
+    def get_validated_token(self, raw_token):
+        key = hashlib.sha256(raw_token).digest()
+        validated_token = token_cache.get(key)
+        if validated_token is not None:
+            # the cached check does not cover expiry that happened since
+            if validated_token.get("exp", 0) > time.time():
+                return validated_token
+            token_cache.pop(key)
+        validated_token = super().get_validated_token(raw_token)
+        token_cache.set(key, validated_token)
+        return validated_token
+
+    def get_user(self, validated_token):
+        user_id = self.user_id(validated_token)
+        user = self.cached_user(user_id)
+        if user is None:
+            user = self.remember_user(user_id, super().get_user(validated_token))
+        return user
+
+    async def aget_user(self, validated_token):
+        user_id = self.user_id(validated_token)
+        user = self.cached_user(user_id)
+        if user is None:
+            user = self.remember_user(
+                user_id, await sync_to_async(super().get_user)(validated_token))
+        return user
+
+    async def aauthenticate(self, request):
+        """authenticate for async views, only a cache miss leaves the event loop"""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    def user_id(self, validated_token):
+        try:
+            return str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+    def cached_user(self, user_id):
+        entry = user_cache.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            # a copy, so nothing a view sets on its user leaks to other requests
+            return copy.copy(entry[1])
+        return None
+
+    def remember_user(self, user_id, user):
+        user_cache.set(user_id, (time.monotonic() + cache_setting("USER_TTL", 60), user))
+        return copy.copy(user)
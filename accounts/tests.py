@@ -1,3 +1,55 @@
-from django.test import TestCase
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from . import authentication
+from .models import User
+from .tokens import create_jwt_pair_for_user
+
+
+@override_settings(JWT_AUTH_CACHE={"USER_TTL": 60})
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        authentication.token_cache.clear()
+        authentication.user_cache.clear()
+        self.user = User.objects.create_user(
+            email="jwt@example.com", password="jwt-password", username="jwt")
+        self.token = create_jwt_pair_for_user(self.user)["access"]
+
+    def get(self):
+        return self.client.get(reverse("current_user"), HTTP_AUTHORIZATION=f"Bearer {self.token}",
+                               HTTP_ACCEPT="application/json")
+
+    def test_cached(self):
+        self.assertEqual(self.get().status_code, 200)
+        with self.assertNumQueries(1):
+            # only the view's own query, not the user lookup
+            self.assertEqual(self.get().status_code, 200)
+
+    def test_deactivated_within_ttl(self):
+        self.assertEqual(self.get().status_code, 200)
+        # a write that skips the save signals is seen once the entry expires
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.get().status_code, 200)
+        later = time.monotonic() + 61
+        with mock.patch.object(authentication.time, "monotonic", return_value=later):
+            self.assertEqual(self.get().status_code, 401)
+
+    def test_signals_evict(self):
+        self.assertEqual(self.get().status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get().status_code, 401)
+
+        self.user.is_active = True
+        self.user.save()
+        self.assertEqual(self.get().status_code, 200)
+        self.user.delete()
+        self.assertEqual(self.get().status_code, 401)
+
+    def test_invalid_token(self):
+        self.token = self.token[:-2] + ("AA" if not self.token.endswith("AA") else "BB")
+        self.assertEqual(self.get().status_code, 401)
+        self.assertEqual(len(authentication.token_cache.entries), 0)
@@ -0,0 +1,9 @@
+"""
+Benchmarks for the notes API.
+
+Each module is a script run from the repository root, e.g.
+
+    python -m benchmarks.search --notes 100000
+
+They build a throwaway database, so they never touch db.sqlite3.
+"""
@@ -0,0 +1,147 @@
+"""
+Storage and read latency of note bodies stored compressed.
+
+    python -m benchmarks.body_compression --scale 10k --long-share 0.05
+
+Seeds a dataset and gives --long-share of the notes long bodies, of
+1000 to --long-words words. The database is measured twice, with every
+body stored as plain text and with the bodies stored the way
+NOTE_BODY_COMPRESSION says (notes.bodies.compress_stored): the size of the
+bodies and of the vacuumed database file, and the latency of the reads
+that load bodies: a long note, list pages with and without the body, the
+summary view and a search. Bodies are compressed like the migration
+does it, with the triggers dropped, so the search index is not rewritten.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+
+from benchmarks.seed import SCALES, seed_dataset
+from benchmarks.utils import benchmark_database, random_text, setup_django, summarize, timed
+
+
+def lengthen(share, max_words, seed):
+    """Give a share of the notes long bodies, stored as plain text; returns one of their ids"""
+    from django.db import connection
+    from notes import search
+
+    rng = random.Random(seed)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT id FROM notes_note")
+        ids = [row[0] for row in cursor.fetchall()]
+        chosen = rng.sample(ids, max(1, int(len(ids) * share)))
+        cursor.executemany(
+            "UPDATE notes_note SET body = %s WHERE id = %s",
+            [(random_text(rng, rng.randint(1000, max_words)), pk) for pk in chosen])
+        # merge the index segments the updates left behind
+        cursor.execute(f"INSERT INTO {search.FTS_TABLE}({search.FTS_TABLE}) VALUES ('optimize')")
+    return chosen[0]
+
+
+def compress_bodies():
+    """What migration 0015 does"""
+    from django.db import connection
+    from notes import bodies, changes, search
+
+    search.drop_triggers(connection)
+    changes.drop_triggers(connection)
+    report = bodies.compress_stored(connection)
+    search.create_index(connection)
+    changes.create_triggers(connection)
+    return report
+
+
+def database_size() -> int:
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute("VACUUM")
+        cursor.execute("PRAGMA page_count")
+        pages = cursor.fetchone()[0]
+        cursor.execute("PRAGMA page_size")
+        return pages * cursor.fetchone()[0]
+
+
+def reads(dataset, long_note_id):
+    """name -> function that makes the request"""
+    from django.contrib.auth import get_user_model
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    from notes.models import Note
+
+    User = get_user_model()
+    long_author = User.objects.get(notes=long_note_id)
+    clients = {}
+    for user in (long_author, User.objects.get(pk=dataset.heavy_user_id)):
+        client = clients[user.pk] = APIClient()
+        client.defaults["HTTP_HOST"] = "localhost"
+        client.force_authenticate(user)
+
+    def get(user_id, url):
+        def run():
+            response = clients[user_id].get(url, HTTP_ACCEPT="application/json")
+            assert response.status_code == 200, response
+            if response.streaming:
+                b"".join(response.streaming_content)
+        return run
+
+    heavy = dataset.heavy_user_id
+    notes = reverse("list_notes")
+    return {
+        "long note detail": get(long_author.pk, reverse("note_detail", kwargs={"pk": long_note_id})),
+        "model instance body": lambda: Note.objects.get(pk=long_note_id).body,
+        "list_notes page_size=100": get(heavy, notes + "?page_size=100"),
+        "list_notes fields=title,tags": get(heavy, notes + "?page_size=100&fields=title,tags"),
+        "list_notes view=summary": get(heavy, notes + "?page_size=100&view=summary"),
+        "search_keyword": get(heavy, reverse("search_keyword", kwargs={"keyword": "meeting"})),
+    }
+
+
+def measure(name, dataset, long_note_id, repeat):
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT coalesce(sum(length(CAST(body AS BLOB))), 0) FROM notes_note")
+        body_bytes = cursor.fetchone()[0]
+    result = {"body_bytes": body_bytes, "database_bytes": database_size(), "reads": {}}
+    print(f"{name}: bodies {body_bytes / 1e6:8.2f} MB, database {result['database_bytes'] / 1e6:8.2f} MB")
+    for read, run in reads(dataset, long_note_id).items():
+        run()
+        timing = result["reads"][read] = summarize(timed(run, repeat))
+        print(f"    {read:30}  p50 {timing['p50_ms']:8.2f} ms  p95 {timing['p95_ms']:8.2f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=SCALES, default="10k")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--long-share", type=float, default=0.05,
+                        help="Share of the notes that get long bodies")
+    parser.add_argument("--long-words", type=int, default=10_000,
+                        help="Most words in a long body")
+    args = parser.parse_args()
+
+    setup_django()
+    from notes import bodies
+
+    report = {"scale": args.scale, "long_share": args.long_share,
+              "compression": bodies.compression_settings()}
+    database = os.path.join(tempfile.mkdtemp(), "body_compression.sqlite3")
+    with benchmark_database(name=database):
+        dataset = seed_dataset(SCALES[args.scale], seed=args.seed)
+        # seeded bodies are short, they stay plain
+        long_note_id = lengthen(args.long_share, args.long_words, args.seed)
+        report["plain"] = measure("plain", dataset, long_note_id, args.repeat)
+        report["migration"] = compress_bodies()
+        report["compressed"] = measure("compressed", dataset, long_note_id, args.repeat)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Bytes saved and CPU spent by response compression, per endpoint.
+
+    python -m benchmarks.compression --scale 10k
+
+Seeds a dataset and takes the uncompressed bodies of the larger read
+endpoints: note list pages, the admin list, the current user and the NDJSON
+export. Each body is compressed the way CompressionMiddleware does it,
+with every available encoding at the configured level and at --levels,
+and the compressed size and the time it took are reported. The export is
+compressed as a stream, one flushed chunk at a time.
+"""
+import argparse
+import json
+
+from benchmarks.seed import SCALES, seed_dataset
+from benchmarks.utils import benchmark_database, setup_django, summarize, timed
+
+
+def bodies(dataset):
+    """endpoint -> (uncompressed body or list of chunks, streaming)"""
+    from django.contrib.auth import get_user_model
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    User = get_user_model()
+    client = APIClient()
+    client.defaults["HTTP_HOST"] = "localhost"
+
+    def get(user_id, url):
+        client.force_authenticate(User.objects.get(pk=user_id))
+        response = client.get(url, HTTP_ACCEPT="application/json")
+        assert response.status_code == 200, response
+        if response.streaming:
+            return list(response.streaming_content), True
+        return response.content, False
+
+    heavy, admin = dataset.heavy_user_id, dataset.admin_id
+    return {
+        "list_notes page_size=20": get(heavy, reverse("list_notes")),
+        "list_notes page_size=100": get(heavy, reverse("list_notes") + "?page_size=100"),
+        "all_notes page_size=100": get(admin, reverse("all_notes") + "?page_size=100"),
+        "current_user": get(heavy, reverse("current_user")),
+        "export_notes": get(admin, reverse("export_notes")),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=SCALES, default="10k")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--levels", type=int, nargs="*", default=[1, 9],
+                        help="Levels to try besides the configured ones")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from simplenote import compression
+
+    config = {**compression.DEFAULTS, **settings.RESPONSE_COMPRESSION}
+    encodings = [encoding for encoding in config["ENCODINGS"] if compression.available(encoding)]
+    report = {"scale": args.scale, "encodings": encodings, "results": {}}
+    with benchmark_database():
+        dataset = seed_dataset(SCALES[args.scale], seed=args.seed)
+        for name, (body, streaming) in bodies(dataset).items():
+            size = sum(map(len, body)) if streaming else len(body)
+            results = report["results"][name] = {"bytes": size, "encodings": {}}
+            print(f"{name}: {size} bytes")
+            for encoding in encodings:
+                levels = sorted({config["LEVELS"][encoding], *args.levels})
+                for level in levels:
+                    if streaming:
+                        def run():
+                            return b"".join(compression.compress_stream(body, encoding, level))
+                    else:
+                        def run():
+                            return compression.compress(body, encoding, level)
+
+                    compressed = len(run())
+                    timing = summarize(timed(run, args.repeat))
+                    results["encodings"][f"{encoding}:{level}"] = {
+                        "bytes": compressed,
+                        "saved_bytes": size - compressed,
+                        "ratio": compressed / size,
+                        "cpu": timing,
+                        "mb_per_second": size / 1e6 / (timing["p50_ms"] / 1000),
+                    }
+                    default = " (configured)" if level == config["LEVELS"][encoding] else ""
+                    print(f"    {encoding:5} level {level:2}  {compressed:9} bytes ({compressed / size:6.1%})"
+                          f"  saved {size - compressed:9}  cpu p50 {timing['p50_ms']:8.2f} ms{default}")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
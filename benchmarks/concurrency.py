@@ -0,0 +1,193 @@
+"""
+Sync and async note read views under ASGI, at increasing connection counts.
+
+    python -m benchmarks.concurrency --connections 1 10 100 500
+
+Seeds a dataset into a SQLite file, then serves it twice with uvicorn, once
+with the sync DRF views and once with ASYNC_NOTE_VIEWS on. Every connection
+is a keep-alive client that requests the read endpoints (note list, note
+detail, tag filter, keyword search, current user) as one of the users with
+the most notes, back to back, for --duration seconds.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.seed import SCALES, seed_dataset
+from benchmarks.utils import benchmark_database, setup_django, summarize
+
+USERS = 20
+
+
+def serve(args):
+    """Run one uvicorn server, in the process started by main()"""
+    setup_django()
+    import uvicorn
+    from django.conf import settings
+    from django.core.asgi import get_asgi_application
+
+    settings.DATABASES["default"]["NAME"] = args.database
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ["*"]
+    settings.ASYNC_NOTE_VIEWS = args.mode == "async"
+    settings.REQUEST_TIMING = {**settings.REQUEST_TIMING, "SLOW_REQUEST_MS": None}
+    if args.no_cache:
+        settings.NOTE_CACHE_TIMEOUT = 0
+    uvicorn.run(get_asgi_application(), host="127.0.0.1", port=args.port,
+                log_level="warning", access_log=False)
+
+
+def build_requests(rng):
+    """(path, token) pairs for the read endpoints of the heaviest users"""
+    from django.contrib.auth import get_user_model
+    from django.db.models import Count
+    from django.urls import reverse
+    from accounts.tokens import create_jwt_pair_for_user
+    from notes.models import Note
+
+    User = get_user_model()
+    requests = []
+    users = User.objects.annotate(total=Count("notes")).order_by("-total")[:USERS]
+    for user in users:
+        token = create_jwt_pair_for_user(user)["access"]
+        notes = list(Note.objects.filter(author=user).order_by("-created")[:20])
+        tags = list(user.tags.values_list("name", flat=True)[:5]) or ["tag0"]
+        words = [note.body.split()[0] for note in notes[:5]] or ["note"]
+        requests += [(reverse("list_notes"), token), (reverse("current_user"), token)]
+        requests += [(reverse("note_detail", kwargs={"pk": note.pk}), token) for note in notes]
+        requests += [(reverse("filter_tag", kwargs={"tag": tag}), token) for tag in tags]
+        requests += [(reverse("search_keyword", kwargs={"keyword": word}), token)
+                     for word in words]
+    rng.shuffle(requests)
+    return requests
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    await reader.readexactly(length)
+    return status
+
+
+async def client(port, requests, offset, deadline, samples, errors):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    i = offset
+    try:
+        while time.perf_counter() < deadline:
+            path, token = requests[i % len(requests)]
+            i += 1
+            writer.write(
+                f"GET {path} HTTP/1.1\r\nHost: localhost\r\nAccept: application/json\r\n"
+                f"Authorization: Bearer {token}\r\n\r\n".encode())
+            start = time.perf_counter()
+            await writer.drain()
+            status = await read_response(reader)
+            samples.append(time.perf_counter() - start)
+            if status != 200:
+                errors[status] = errors.get(status, 0) + 1
+    except (ConnectionError, asyncio.IncompleteReadError):
+        errors["connection"] = errors.get("connection", 0) + 1
+    finally:
+        writer.close()
+
+
+async def load(port, requests, connections, duration):
+    samples, errors = [], {}
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    # every connection starts at a different place in the request list
+    await asyncio.gather(*(
+        client(port, requests, n * len(requests) // connections, deadline, samples, errors)
+        for n in range(connections)
+    ))
+    elapsed = time.perf_counter() - started
+    result = summarize(samples) if samples else {"runs": 0}
+    result.update(throughput_rps=len(samples) / elapsed, errors=errors)
+    return result
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("the server exited, see its output above")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"the server did not listen on port {port}")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=SCALES, default="10k")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--connections", type=int, nargs="+", default=[1, 10, 50, 200, 500])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Turn the response caches off in the servers")
+    parser.add_argument("--database", help="SQLite file for the dataset (default: a temporary file)")
+    parser.add_argument("--keepdb", action="store_true")
+    # internal: run one server
+    parser.add_argument("--serve", choices=["sync", "async"], dest="mode", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        return serve(args)
+
+    setup_django()
+    from notes.models import Note
+
+    database = args.database or os.path.join(tempfile.mkdtemp(), "concurrency.sqlite3")
+    report = {"scale": args.scale, "duration": args.duration, "no_cache": args.no_cache,
+              "results": {}}
+    with benchmark_database(name=database, keepdb=args.keepdb):
+        if not Note.objects.exists():
+            seed_dataset(SCALES[args.scale], seed=args.seed)
+        requests = build_requests(random.Random(args.seed))
+
+        for mode in ("sync", "async"):
+            port = free_port()
+            command = [sys.executable, "-m", "benchmarks.concurrency", "--serve", mode,
+                       "--port", str(port), "--database", database]
+            if args.no_cache:
+                command.append("--no-cache")
+            server = subprocess.Popen(command)
+            try:
+                wait_for_port(port, server)
+                # warm up the token and response caches
+                asyncio.run(load(port, requests, 10, 2))
+                for connections in args.connections:
+                    result = asyncio.run(load(port, requests, connections, args.duration))
+                    report["results"].setdefault(mode, {})[connections] = result
+                    print(f"{mode:5} {connections:5} connections  {result['throughput_rps']:8.1f} req/s"
+                          f"  p50 {result.get('p50_ms', 0):8.1f} ms  p99 {result.get('p99_ms', 0):8.1f} ms"
+                          f"  errors {result['errors'] or 0}")
+            finally:
+                server.terminate()
+                server.wait()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
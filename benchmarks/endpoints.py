@@ -0,0 +1,295 @@
+"""
+Latency, throughput and SQL queries of every API route.
+
+    python -m benchmarks.endpoints --scale 10k
+    python -m benchmarks.endpoints --scale 1m --database bench-1m.sqlite3 --keepdb
+
+Seeds a dataset (see benchmarks.seed), then requests every route in
+notes/urls.py and accounts/urls.py through the Django test client with
+real JWT headers, as the user who owns the most notes or as an admin.
+Results are printed and saved as JSON under benchmarks/results/ so runs
+can be compared over time.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from pathlib import Path
+from typing import Callable, Optional
+from urllib.parse import urlencode
+
+from benchmarks.seed import PASSWORD, SCALES, load_dataset, seed_dataset
+from benchmarks.utils import benchmark_database, setup_django, summarize
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+@dataclass
+class Route:
+    name: str
+    method: str
+    # called before every request, outside the timing, returns (url, data)
+    prepare: Callable[[], tuple]
+    # "owner", "admin" or None for anonymous requests
+    user: Optional[str] = "owner"
+    expected: tuple = (200,)
+    results: dict = field(default_factory=dict)
+
+
+class QueryCounter:
+    """Counts the SQL statements run on a connection"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def build_routes(dataset):
+    from django.contrib.auth import get_user_model
+    from django.urls import reverse
+    from notes.models import Note
+
+    User = get_user_model()
+    owner = User.objects.get(pk=dataset.heavy_user_id)
+    notes = Note.objects.filter(author=owner)
+    newest = notes.order_by("-created", "-id").first()
+    tag = newest.tags.first() or owner.tags.first()
+    tag_name = tag.name if tag else "tag0"
+    word = newest.body.split()[0]
+    export_after = (Note.objects.order_by("-created").values_list("created", flat=True).first()
+                    - timedelta(days=3)).isoformat()
+    tokens = {}
+
+    def fixed(url, data=None):
+        return lambda: (url, data)
+
+    def detail(name):
+        return reverse(name, kwargs={"pk": newest.pk})
+
+    def scratch_note():
+        # a note to delete, created outside the timed request
+        note = Note.objects.create(author=owner, title="scratch", body="scratch note")
+        return reverse("note_detail", kwargs={"pk": note.pk}), None
+
+    signups = iter(range(10 ** 9))
+
+    def signup():
+        n = next(signups)
+        return reverse("signup"), {
+            "email": f"signup{n}@bench.example", "username": f"signup{n}", "password": PASSWORD}
+
+    def add_tag():
+        Note.objects.get(pk=newest.pk).remove_tag("benchmark")
+        return reverse("add_tag", kwargs={"pk": newest.pk}), {"tag": "benchmark"}
+
+    def remove_tag():
+        Note.objects.get(pk=newest.pk).add_tags(["benchmark"])
+        return reverse("remove_tag", kwargs={"pk": newest.pk}), {"tag": "benchmark"}
+
+    def refresh():
+        return reverse("token_refresh"), {"refresh": tokens["refresh"]}
+
+    def verify():
+        return reverse("token_verify"), {"token": tokens["access"]}
+
+    def deep_page():
+        # follow a few cursors to measure a page far from the top
+        from django.test import Client
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        url = reverse("list_notes")
+        for _ in range(5):
+            next_url = client.get(url).json().get("next")
+            if not next_url:
+                break
+            url = next_url
+        return url, None
+
+    login = {"email": owner.email, "password": PASSWORD}
+    bulk = {"operations": [
+        {"op": "create", "title": f"bulk {i}", "body": "created in a batch", "tags": ["bulk"]}
+        for i in range(50)
+    ]}
+
+    routes = [
+        Route("notes_home", "get", fixed(reverse("notes_home")), user=None),
+        Route("notes_home", "post", fixed(reverse("notes_home"), {"hello": "world"}),
+              user=None, expected=(201,)),
+        Route("list_notes", "get", fixed(reverse("list_notes"))),
+        Route("list_notes (page 6)", "get", deep_page),
+        Route("list_notes", "post", fixed(reverse("list_notes"), {
+            "title": "benchmark", "body": "a new note", "tags": ["benchmark", tag_name]}),
+            expected=(201,)),
+        Route("note_detail", "get", fixed(detail("note_detail"))),
+        Route("note_detail", "put", fixed(detail("note_detail"), {
+            "title": newest.title, "body": newest.body, "public": newest.public})),
+        Route("note_detail", "delete", scratch_note, expected=(204,)),
+        Route("bulk_notes", "post", fixed(reverse("bulk_notes"), bulk)),
+        Route("current_user", "get", fixed(reverse("current_user"))),
+        Route("note_changes", "get", fixed(f"{reverse('note_changes')}?since=0")),
+        Route("all_notes", "get", fixed(reverse("all_notes")), user="admin"),
+        Route("export_notes", "get", fixed(
+            f"{reverse('export_notes')}?{urlencode({'created_after': export_after})}"),
+            user="admin"),
+        Route("note_cache_stats", "get", fixed(reverse("note_cache_stats")), user="admin"),
+        Route("filter_tag", "get", fixed(reverse("filter_tag", kwargs={"tag": tag_name}))),
+        Route("filter_tags", "get", fixed(f"{reverse('filter_tags')}?{urlencode({'all': tag_name})}")),
+        Route("filter_tags (any, not)", "get", fixed(
+            f"{reverse('filter_tags')}?{urlencode({'any': 'tag1,tag2', 'not': 'tag0'})}")),
+        Route("search_keyword", "get", fixed(reverse("search_keyword", kwargs={"keyword": word}))),
+        Route("add_tag", "post", add_tag, expected=(201,)),
+        Route("remove_tag", "delete", remove_tag),
+        Route("tags", "post", fixed(reverse("tags", kwargs={"note_id": newest.pk}),
+                                    {"name": tag_name}), expected=(201,)),
+        Route("signup", "post", signup, user=None, expected=(201,)),
+        Route("login", "post", fixed(reverse("login"), login), user=None),
+        Route("login", "get", fixed(reverse("login"))),
+        Route("jwt_create", "post", fixed(reverse("jwt_create"), login), user=None),
+        Route("token_refresh", "post", refresh, user=None),
+        Route("token_verify", "post", verify, user=None),
+    ]
+    return routes, tokens
+
+
+def run_route(route, clients, repeat, warmup, no_cache):
+    from django.core.cache import cache
+    from django.db import connection
+
+    client = clients[route.user]
+    samples, queries, statuses = [], [], {}
+    started = time.perf_counter()
+    for i in range(warmup + repeat):
+        url, data = route.prepare()
+        if no_cache:
+            cache.clear()
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            start = time.perf_counter()
+            response = getattr(client, route.method)(url, data, content_type="application/json")
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            elapsed = time.perf_counter() - start
+        if i < warmup:
+            continue
+        samples.append(elapsed)
+        queries.append(counter.count)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    total = time.perf_counter() - started
+
+    route.results = summarize(samples)
+    route.results.update(
+        throughput_rps=len(samples) / sum(samples),
+        wall_seconds=total,
+        queries_mean=sum(queries) / len(queries),
+        queries_max=max(queries),
+        statuses=statuses,
+        unexpected_statuses=sum(count for code, count in statuses.items()
+                                if code not in route.expected),
+    )
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=SCALES, default="10k")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--route", action="append",
+                        help="Only run routes with this name (repeatable)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Clear the cache before every request")
+    parser.add_argument("--database", help="SQLite file to seed, instead of an in-memory database")
+    parser.add_argument("--keepdb", action="store_true",
+                        help="Reuse the dataset in --database if it was seeded before")
+    parser.add_argument("--output", help="JSON file to write (default: benchmarks/results/...)")
+    args = parser.parse_args()
+
+    setup_django()
+    import django
+    import rest_framework
+    from django.conf import settings
+    from django.contrib.auth import get_user_model
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from accounts.tokens import create_jwt_pair_for_user
+    from notes.models import Note
+
+    setup_test_environment(debug=False)
+    settings.DEBUG = False
+    User = get_user_model()
+
+    with benchmark_database(name=args.database, keepdb=args.keepdb):
+        seeding = time.perf_counter()
+        if args.keepdb and Note.objects.exists():
+            dataset = load_dataset()
+            print(f"reusing {dataset.notes} notes of {dataset.users} users")
+        else:
+            dataset = seed_dataset(SCALES[args.scale], seed=args.seed, stdout=None)
+            print(f"seeded {dataset.notes} notes of {dataset.users} users "
+                  f"in {time.perf_counter() - seeding:.1f}s")
+
+        routes, tokens = build_routes(dataset)
+        tokens.update(create_jwt_pair_for_user(User.objects.get(pk=dataset.heavy_user_id)))
+        admin_tokens = create_jwt_pair_for_user(User.objects.get(pk=dataset.admin_id))
+        clients = {
+            None: Client(),
+            "owner": Client(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}"),
+            "admin": Client(HTTP_AUTHORIZATION=f"Bearer {admin_tokens['access']}"),
+        }
+        if args.route:
+            routes = [route for route in routes if route.name in args.route]
+
+        print(f"{'route':28} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'queries':>8}")
+        for route in routes:
+            run_route(route, clients, args.repeat, args.warmup, args.no_cache)
+            r = route.results
+            flag = "  unexpected status!" if r["unexpected_statuses"] else ""
+            print(f"{route.method.upper() + ' ' + route.name:28} {r['p50_ms']:9.2f} "
+                  f"{r['p95_ms']:9.2f} {r['p99_ms']:9.2f} {r['throughput_rps']:9.1f} "
+                  f"{r['queries_mean']:8.1f}{flag}")
+
+    report = {
+        "meta": {
+            "scale": args.scale,
+            "notes": dataset.notes,
+            "users": dataset.users,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "warmup": args.warmup,
+            "no_cache": args.no_cache,
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "rest_framework": rest_framework.VERSION,
+            "platform": platform.platform(),
+        },
+        "routes": [
+            {"name": route.name, "method": route.method.upper(), **route.results}
+            for route in routes
+        ],
+    }
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"{args.scale}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Multi-tag filters and facet counts for one user with many notes.
+
+    python -m benchmarks.facets --notes 100000
+
+Seeds one user with --notes notes, tagged like benchmarks.seed does (0-5
+tags each, a few tags on many notes and most on few), and requests
+notes/filter/ with several filters, with the response cache cleared
+before each request. For every filter it also times the facet counts on
+their own, as served (from notes_tagpair where the filter allows it) and
+counted over the matching notes.
+"""
+import argparse
+import json
+import random
+from urllib.parse import urlencode
+
+from benchmarks.seed import CHUNK_SIZE, TAG_POOL, TAG_WEIGHTS, TAGS_PER_NOTE, TAGS_PER_NOTE_WEIGHTS
+from benchmarks.utils import benchmark_database, random_text, setup_django, summarize, timed
+
+
+def seed_user(notes, seed):
+    from django.contrib.auth import get_user_model
+    from django.db import connection, transaction
+    from notes.models import Note, NoteTag, Tag
+
+    rng = random.Random(seed)
+    user = get_user_model().objects.create_user(
+        email="facets@bench.example", username="facets", password="facets-password")
+    for start in range(0, notes, CHUNK_SIZE):
+        with transaction.atomic():
+            created = Note.objects.bulk_create(
+                Note(author=user, title=random_text(rng, 3)[:40], body=random_text(rng, 20))
+                for _ in range(min(CHUNK_SIZE, notes - start)))
+            tags = [set(rng.choices(TAG_POOL, TAG_WEIGHTS, k=rng.choices(
+                TAGS_PER_NOTE, TAGS_PER_NOTE_WEIGHTS)[0])) for _ in created]
+            tag_ids = Tag.objects.resolve((user.pk, name) for names in tags for name in names)
+            NoteTag.objects.bulk_create(
+                NoteTag(note_id=note.pk, tag_id=tag_ids[user.pk, name])
+                for note, names in zip(created, tags) for name in sorted(names))
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    return user
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.cache import cache
+    from django.http import QueryDict
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from notes import facets
+    from notes.models import Note
+
+    filters = {
+        "no filter": {},
+        "all=common": {"all": "tag0"},
+        "all=rare": {"all": "tag400"},
+        "all=two": {"all": "tag0,tag1"},
+        "not=common": {"not": "tag0"},
+        "any=two&not=one": {"any": "tag1,tag2", "not": "tag0"},
+    }
+    report = {"notes": args.notes, "results": {}}
+    with benchmark_database():
+        user = seed_user(args.notes, args.seed)
+        client = APIClient()
+        client.defaults["HTTP_HOST"] = "localhost"
+        client.force_authenticate(user)
+
+        for name, params in filters.items():
+            url = f"{reverse('filter_tags')}?{urlencode(params)}"
+
+            def request():
+                cache.clear()
+                response = client.get(url, HTTP_ACCEPT="application/json")
+                assert response.status_code == 200, response
+                return response.json()
+
+            tags = facets.tag_filter(user, QueryDict(urlencode(params)))
+            notes = facets.filter_notes(Note.objects.filter(author=user), tags, drive_limit=None)
+            page = request()
+            result = report["results"][name] = {
+                "facets": len(page["facets"]),
+                "request": summarize(timed(request, args.repeat)),
+                "facet_counts": summarize(timed(lambda: facets.facet_counts(user, tags), args.repeat)),
+                "live_counts": summarize(timed(lambda: facets.live_counts(notes), args.repeat)),
+            }
+            print(f"{name:18}  request p50 {result['request']['p50_ms']:8.2f} ms"
+                  f"  facets p50 {result['facet_counts']['p50_ms']:8.2f} ms"
+                  f"  (counted live {result['live_counts']['p50_ms']:8.2f} ms)")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Size and speed of the response formats: JSON, MessagePack and CBOR.
+
+    python -m benchmarks.formats --scale 10k
+
+Seeds a dataset and takes the data of real responses: note list pages of
+20 and 100 notes, the current user's note links, and the results of a bulk
+request. Each one is encoded with every renderer the settings offer and
+decoded again as a client would, and the encoded and gzipped sizes are
+reported next to the encode and decode times.
+"""
+import argparse
+import gzip
+import json
+
+from benchmarks.seed import SCALES, seed_dataset
+from benchmarks.utils import benchmark_database, setup_django, summarize, timed
+
+
+def decoders():
+    import cbor2
+    import msgpack
+    import orjson
+
+    return {
+        "application/json": orjson.loads,
+        "application/msgpack": msgpack.unpackb,
+        "application/cbor": cbor2.loads,
+    }
+
+
+def payloads(dataset):
+    """name -> the data of a response, as the views produce it"""
+    from django.contrib.auth import get_user_model
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    user = get_user_model().objects.get(pk=dataset.heavy_user_id)
+    client = APIClient()
+    client.force_authenticate(user)
+    client.defaults["HTTP_HOST"] = "localhost"
+
+    def get(url):
+        response = client.get(url, HTTP_ACCEPT="application/json")
+        assert response.status_code == 200, response.content
+        return response.data
+
+    operations = [{"op": "create", "title": f"bulk {i}", "body": "created in one request",
+                   "tags": ["bulk"]} for i in range(100)]
+    bulk = client.post(reverse("bulk_notes"), {"operations": operations}, format="json")
+    return {
+        "list page of 20": get(reverse("list_notes")),
+        "list page of 100": get(reverse("list_notes") + "?page_size=100"),
+        "summary page of 100": get(reverse("list_notes") + "?page_size=100&view=summary"),
+        "current user": get(reverse("current_user")),
+        "bulk results": bulk.data,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=SCALES, default="10k")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.settings import api_settings
+
+    renderers = [renderer_class() for renderer_class in api_settings.DEFAULT_RENDERER_CLASSES
+                 if renderer_class.format != "api"]
+    decode = decoders()
+    report = {"scale": args.scale, "results": {}}
+    with benchmark_database():
+        dataset = seed_dataset(SCALES[args.scale], seed=args.seed)
+        for name, data in payloads(dataset).items():
+            results = report["results"][name] = {}
+            for renderer in renderers:
+                content = renderer.render(data)
+                loads = decode[renderer.media_type]
+                results[renderer.format] = {
+                    "bytes": len(content),
+                    "gzip_bytes": len(gzip.compress(content, 6)),
+                    "encode": summarize(timed(lambda: renderer.render(data), args.repeat)),
+                    "decode": summarize(timed(lambda: loads(content), args.repeat)),
+                }
+            json_bytes = results["json"]["bytes"]
+            for format, result in results.items():
+                print(f"{name:20} {format:8} {result['bytes']:8} bytes ({result['bytes'] / json_bytes:4.0%})"
+                      f"  gzip {result['gzip_bytes']:7}"
+                      f"  encode p50 {result['encode']['p50_ms'] * 1000:7.1f} us"
+                      f"  decode p50 {result['decode']['p50_ms'] * 1000:7.1f} us")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+PUT versus PATCH with edits for a small change to a large note.
+
+    python -m benchmarks.patch --sizes 10000 100000 2000000
+
+For notes of each body size, changes one word in the middle, once by
+sending the whole body with PUT and once by sending a single edit with
+PATCH, and reports the request size and latency of both.
+"""
+import argparse
+import json
+import random
+
+from benchmarks.utils import benchmark_database, random_text, setup_django, summarize, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 2_000_000],
+                        help="Body sizes in characters")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth import get_user_model
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from notes.models import Note
+
+    rng = random.Random(args.seed)
+    report = {"results": {}}
+    with benchmark_database():
+        user = get_user_model().objects.create_user(
+            email="patch@bench.example", username="patch", password="patch-password")
+        client = APIClient()
+        client.defaults["HTTP_HOST"] = "localhost"
+        client.force_authenticate(user)
+
+        for size in args.sizes:
+            body = random_text(rng, size // 5)[:size]
+            note = Note.objects.create(author=user, title="large", body=body)
+            url = reverse("note_detail", kwargs={"pk": note.pk})
+            middle = len(body) // 2
+
+            def put():
+                data = {"title": "large", "body": body[:middle] + "edited" + body[middle + 6:]}
+                response = client.put(url, data, format="json")
+                assert response.status_code == 200, response
+                return data, response
+
+            def patch():
+                version = Note.objects.values_list("version", flat=True).get(pk=note.pk)
+                data = {"version": version, "edits": [{"offset": middle, "delete": 6, "insert": "edited"}]}
+                response = client.patch(url, data, format="json")
+                assert response.status_code == 200, response
+                return data, response
+
+            result = report["results"][size] = {}
+            for name, run in (("put", put), ("patch", patch)):
+                data, response = run()
+                result[name] = {
+                    "request_bytes": len(json.dumps(data, ensure_ascii=False).encode()),
+                    "response_bytes": len(response.content),
+                    "latency": summarize(timed(run, args.repeat)),
+                }
+                print(f"{size:9} chars  {name:5}  request {result[name]['request_bytes']:9} bytes"
+                      f"  response {result[name]['response_bytes']:9} bytes"
+                      f"  p50 {result[name]['latency']['p50_ms']:8.2f} ms")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Compare the FTS5 search index with the old body__icontains scan.
+
+    python -m benchmarks.search --notes 100000 --users 10
+"""
+import argparse
+import json
+import random
+
+from benchmarks.utils import benchmark_database, random_text, setup_django, summarize, timed
+
+
+def seed(notes, users, rng):
+    from django.contrib.auth import get_user_model
+    from notes.models import Note
+
+    User = get_user_model()
+    authors = User.objects.bulk_create(
+        User(email=f"bench{i}@example.com", username=f"bench{i}") for i in range(users))
+    batch = []
+    for i in range(notes):
+        batch.append(Note(
+            author=authors[i % users],
+            title=random_text(rng, 4),
+            body=random_text(rng, rng.randint(20, 200)),
+        ))
+        if len(batch) == 5000:
+            Note.objects.bulk_create(batch)
+            batch = []
+    Note.objects.bulk_create(batch)
+    return authors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--notes", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    from notes.search import search_notes
+
+    # a common word, a rarer one, a prefix and a multi-word query
+    queries = ["meeting", "python", "kalomi", "kal*", "project deadline"]
+    with benchmark_database():
+        user = seed(args.notes, args.users, random.Random(args.seed))
+        results = {}
+        for keyword in queries:
+            word = keyword.split()[0].rstrip("*")
+
+            # one page of results plus the total, like the paginated view
+            def scan():
+                matches = user.notes.filter(body__icontains=word)
+                matches.count()
+                list(matches[:20])
+
+            def indexed():
+                matches = search_notes(user, keyword)
+                matches.count()
+                list(matches[:20])
+
+            results[keyword] = {
+                "icontains": summarize(timed(scan, args.repeat)),
+                "fts5": summarize(timed(indexed, args.repeat)),
+            }
+            print(f"{keyword!r:26} icontains p50 {results[keyword]['icontains']['p50_ms']:8.2f} ms"
+                  f"   fts5 p50 {results[keyword]['fts5']['p50_ms']:8.2f} ms")
+    print(json.dumps({"notes": args.notes, "users": args.users, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
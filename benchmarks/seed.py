@@ -0,0 +1,111 @@
+"""
+Reproducible datasets of users, notes and tags.
+
+The same scale and seed always produce the same rows. Note counts per user
+follow a Pareto curve, so a few heavy users own most of the notes, and tag
+names are drawn from a Zipf-like distribution, so a few tags are on many
+notes and most are rare.
+"""
+import random
+from dataclasses import dataclass
+
+from benchmarks.utils import random_text
+
+SCALES = {
+    "10k": 10_000,
+    "100k": 100_000,
+    "1m": 1_000_000,
+}
+
+NOTES_PER_USER = 100
+PUBLIC_SHARE = 0.1
+TAG_POOL = [f"tag{i}" for i in range(500)]
+TAG_WEIGHTS = [1 / rank for rank in range(1, len(TAG_POOL) + 1)]
+TAGS_PER_NOTE = [0, 1, 2, 3, 4, 5]
+TAGS_PER_NOTE_WEIGHTS = [30, 30, 20, 10, 6, 4]
+CHUNK_SIZE = 10_000
+PASSWORD = "benchmark-password"
+
+
+@dataclass
+class Dataset:
+    notes: int
+    users: int
+    heavy_user_id: int
+    admin_id: int
+
+
+def seed_dataset(notes, seed=1, stdout=None) -> Dataset:
+    """Fill the current database with a dataset of the given number of notes"""
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.hashers import make_password
+    from django.db import connection, transaction
+    from notes.models import Note, NoteTag, Tag
+
+    User = get_user_model()
+    rng = random.Random(seed)
+    users = max(1, notes // NOTES_PER_USER)
+    password = make_password(PASSWORD)
+
+    with transaction.atomic():
+        admin = User(email="admin@bench.example", username="admin", password=password,
+                     is_staff=True, is_superuser=True)
+        admin.save()
+        authors = User.objects.bulk_create(
+            User(email=f"user{i}@bench.example", username=f"user{i}", password=password)
+            for i in range(users))
+
+    shares = [rng.paretovariate(1.2) for _ in authors]
+    total = sum(shares)
+    counts = [int(notes * share / total) for share in shares]
+    counts[0] += notes - sum(counts)
+    owners = [author.pk for author, count in zip(authors, counts) for _ in range(count)]
+    rng.shuffle(owners)
+
+    for start in range(0, notes, CHUNK_SIZE):
+        chunk = owners[start:start + CHUNK_SIZE]
+        with transaction.atomic():
+            created = Note.objects.bulk_create(
+                Note(author_id=owner,
+                     title=random_text(rng, rng.randint(1, 5))[:40],
+                     body=random_text(rng, int(rng.lognormvariate(4, 1)) + 1),
+                     public=rng.random() < PUBLIC_SHARE)
+                for owner in chunk)
+            tags = [
+                set(rng.choices(TAG_POOL, TAG_WEIGHTS, k=rng.choices(
+                    TAGS_PER_NOTE, TAGS_PER_NOTE_WEIGHTS)[0]))
+                for _ in created
+            ]
+            tag_ids = Tag.objects.resolve(
+                (note.author_id, name) for note, names in zip(created, tags) for name in names)
+            NoteTag.objects.bulk_create(
+                NoteTag(note_id=note.pk, tag_id=tag_ids[note.author_id, name])
+                for note, names in zip(created, tags) for name in sorted(names))
+        if stdout:
+            stdout.write(f"seeded {min(start + CHUNK_SIZE, notes)}/{notes} notes\n")
+
+    # spread the notes over 2024, oldest first, in one statement
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE notes_note SET created = datetime('2024-01-01', "
+            "'+' || (id * 31536000 / (SELECT max(id) FROM notes_note)) || ' seconds')")
+        cursor.execute("ANALYZE")
+
+    heavy = max(zip(counts, authors), key=lambda pair: pair[0])[1]
+    return Dataset(notes=notes, users=users, heavy_user_id=heavy.pk, admin_id=admin.pk)
+
+
+def load_dataset() -> Dataset:
+    """Describe a dataset seeded earlier into the current database"""
+    from django.contrib.auth import get_user_model
+    from django.db.models import Count
+    from notes.models import Note
+
+    User = get_user_model()
+    heavy = User.objects.annotate(total=Count("notes")).order_by("-total").first()
+    return Dataset(
+        notes=Note.objects.count(),
+        users=User.objects.filter(is_staff=False).count(),
+        heavy_user_id=heavy.pk,
+        admin_id=User.objects.get(email="admin@bench.example").pk,
+    )
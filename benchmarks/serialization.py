@@ -0,0 +1,82 @@
+"""
+Compare NoteSerializer with the fast read path of notes/fast.py.
+
+    python -m benchmarks.serialization --page-size 20 100 1000
+
+Loads pages of notes of the heaviest user of a seeded dataset and turns
+them into JSON bytes both ways: with_relations() + NoteSerializer +
+JSONRenderer, and values() rows + one tag query + note_dicts() +
+FastJSONRenderer. Each step is timed on its own as well, and the two
+outputs are checked to be the same bytes.
+"""
+import argparse
+import json
+
+from benchmarks.seed import seed_dataset
+from benchmarks.utils import benchmark_database, setup_django, summarize, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=20_000)
+    parser.add_argument("--page-size", type=int, nargs="+", default=[20, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.renderers import JSONRenderer
+    from notes import fast
+    from notes.models import Note
+    from notes.renderers import FastJSONRenderer
+    from notes.serializers import NoteSerializer
+
+    fields = set(fast.field_order())
+    json_renderer, fast_renderer = JSONRenderer(), FastJSONRenderer()
+    report = {"notes": args.notes, "results": {}}
+    with benchmark_database():
+        dataset = seed_dataset(args.notes, seed=args.seed)
+        notes = Note.objects.filter(author_id=dataset.heavy_user_id).order_by("-created", "-id")
+
+        for size in args.page_size:
+            def serializer_path():
+                page = list(notes.with_relations()[:size])
+                return json_renderer.render(NoteSerializer(page, many=True).data)
+
+            def fast_path():
+                rows = list(fast.note_rows(notes, fields)[:size])
+                tags = fast.tags_by_note(fast.tag_rows([row["id"] for row in rows]))
+                return fast_renderer.render(fast.note_dicts(rows, fields, tags))
+
+            if serializer_path() != fast_path():
+                raise SystemExit(f"the outputs differ at page size {size}")
+
+            # the CPU-only steps, on data that is already loaded
+            instances = list(notes.with_relations()[:size])
+            rows = list(fast.note_rows(notes, fields)[:size])
+            tags = fast.tags_by_note(fast.tag_rows([row["id"] for row in rows]))
+            data = NoteSerializer(instances, many=True).data
+            dicts = fast.note_dicts(rows, fields, tags)
+
+            result = {
+                "rendered_notes": len(rows),
+                "serializer_path": summarize(timed(serializer_path, args.repeat)),
+                "fast_path": summarize(timed(fast_path, args.repeat)),
+                "serialize": summarize(timed(
+                    lambda: NoteSerializer(instances, many=True).data, args.repeat)),
+                "note_dicts": summarize(timed(
+                    lambda: fast.note_dicts(rows, fields, tags), args.repeat)),
+                "json_renderer": summarize(timed(lambda: json_renderer.render(data), args.repeat)),
+                "fast_json_renderer": summarize(timed(lambda: fast_renderer.render(dicts), args.repeat)),
+            }
+            report["results"][size] = result
+            print(f"page of {len(rows):5}  serializer {result['serializer_path']['p50_ms']:8.2f} ms"
+                  f"  fast {result['fast_path']['p50_ms']:8.2f} ms"
+                  f"  (serialize {result['serialize']['p50_ms']:.2f} / {result['note_dicts']['p50_ms']:.2f} ms,"
+                  f" render {result['json_renderer']['p50_ms']:.2f} / {result['fast_json_renderer']['p50_ms']:.2f} ms)")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
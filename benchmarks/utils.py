@@ -0,0 +1,77 @@
+import os
+import random
+import statistics
+import time
+from contextlib import contextmanager
+
+import django
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "simplenote.settings")
+    django.setup()
+
+
+@contextmanager
+def benchmark_database(verbosity=0, name=None, keepdb=False):
+    """
+    Run the block against a freshly migrated test database.
+
+    With keepdb the database named name is reused if it exists and kept
+    afterwards, so a large dataset only has to be seeded once.
+    """
+    from django.db import connection
+
+    old_name = connection.settings_dict["NAME"]
+    if name:
+        connection.settings_dict["TEST"]["NAME"] = name
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, keepdb=keepdb)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity, keepdb=keepdb)
+
+
+def timed(fn, repeat):
+    """Call fn repeat times and return the duration of every call in seconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summarize(samples):
+    """p50/p95/p99 and mean of a list of durations, in milliseconds"""
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "runs": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+    }
+
+
+COMMON_WORDS = (
+    "meeting project plan budget review draft idea todo grocery recipe travel "
+    "flight hotel invoice client deadline report design sprint bug feature "
+    "release backup server python django database index query cache note "
+    "book movie music garden workout doctor school homework birthday gift"
+).split()
+
+SYLLABLES = "ka lo mi ne ru sa ti vo ze bu da fe gi ho ju".split()
+
+# the common words plus a long tail of made-up ones, so that word
+# frequencies follow a Zipf-like curve like real text does
+VOCABULARY = COMMON_WORDS + [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+WEIGHTS = [1 / rank for rank in range(1, len(VOCABULARY) + 1)]
+
+
+def random_text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(VOCABULARY, WEIGHTS, k=words))
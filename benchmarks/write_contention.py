@@ -0,0 +1,156 @@
+"""
+Write throughput of concurrent processes on one SQLite file.
+
+    python -m benchmarks.write_contention --processes 1 2 4 8
+
+Every process acts like a web worker that only writes: it creates notes
+with tags like POST notes/, and sends small batches like POST notes/bulk/,
+for --duration seconds. The same load runs against two database profiles:
+
+    default  what Django does out of the box: rollback journal, full sync,
+             deferred transactions and a new connection per request
+    tuned    DATABASES["default"] from the settings: WAL, synchronous=NORMAL,
+             busy_timeout, immediate transactions and persistent connections
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+import traceback
+
+from benchmarks.seed import seed_dataset
+from benchmarks.utils import benchmark_database, setup_django, summarize
+
+TAGS = [f"tag{i}" for i in range(20)]
+
+
+def profiles(settings_dict):
+    tuned = dict(settings_dict)
+    default = {
+        **settings_dict,
+        "CONN_MAX_AGE": 0,
+        "CONN_HEALTH_CHECKS": False,
+        "OPTIONS": {
+            "transaction_mode": "DEFERRED",
+            "pragmas": {"journal_mode": "DELETE", "synchronous": "FULL"},
+            # the note triggers call them
+            "functions": settings_dict["OPTIONS"].get("functions", {}),
+        },
+    }
+    return {"default": default, "tuned": tuned}
+
+
+def write_once(rng, user, note_ids):
+    from notes.bulk import apply_operations
+    from notes.models import Note
+
+    if rng.random() < 0.7:
+        note = Note.objects.create(author=user, title="contention", body="a new note")
+        note.add_tags(rng.sample(TAGS, 2))
+    else:
+        operations = [{"op": "create", "title": "batch", "body": "from a batch",
+                       "tags": rng.sample(TAGS, 2)} for _ in range(5)]
+        operations += [{"op": "update", "id": pk, "title": "updated"}
+                       for pk in rng.sample(note_ids, min(3, len(note_ids)))]
+        apply_operations(user, operations)
+
+
+def worker(profile, user_id, duration, seed, results):
+    try:
+        results.put(write_for(profile, user_id, duration, seed))
+    except Exception:
+        # the parent waits for one result per worker
+        results.put({"error": traceback.format_exc()})
+
+
+def write_for(profile, user_id, duration, seed):
+    setup_django()
+    from django.db import OperationalError, close_old_connections, connection
+    from django.contrib.auth import get_user_model
+
+    connection.close()
+    connection.settings_dict.update(profile)
+    rng = random.Random(seed)
+    user = get_user_model().objects.get(pk=user_id)
+    note_ids = list(user.notes.values_list("pk", flat=True)[:200])
+    samples, locked = [], 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        # what Django does around every request
+        close_old_connections()
+        start = time.perf_counter()
+        try:
+            write_once(rng, user, note_ids)
+            samples.append(time.perf_counter() - start)
+        except OperationalError as exc:
+            if "locked" not in str(exc):
+                raise
+            locked += 1
+        close_old_connections()
+    return {"samples": samples, "locked": locked}
+
+
+def run(profile, user_ids, processes, duration):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    workers = [
+        context.Process(target=worker, args=(
+            profile, user_ids[i % len(user_ids)], duration, i, results))
+        for i in range(processes)
+    ]
+    for process in workers:
+        process.start()
+    outcomes = [results.get() for _ in workers]
+    for process in workers:
+        process.join()
+    for outcome in outcomes:
+        if "error" in outcome:
+            raise RuntimeError(f"a worker failed:\n{outcome['error']}")
+
+    samples = [sample for outcome in outcomes for sample in outcome["samples"]]
+    result = summarize(samples) if samples else {"runs": 0}
+    result.update(
+        writes_per_second=len(samples) / duration,
+        locked_errors=sum(outcome["locked"] for outcome in outcomes),
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--notes", type=int, default=10_000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+
+    database = os.path.join(tempfile.mkdtemp(), "contention.sqlite3")
+    report = {"duration": args.duration, "results": {}}
+    with benchmark_database(name=database):
+        dataset = seed_dataset(args.notes)
+        user_ids = list(get_user_model().objects.filter(is_staff=False).order_by(
+            "pk").values_list("pk", flat=True)[:max(args.processes)])
+        settings_dict = dict(connection.settings_dict)
+        # the workers connect themselves
+        connection.close()
+
+        for name, profile in profiles(settings_dict).items():
+            for processes in args.processes:
+                result = run(profile, user_ids, processes, args.duration)
+                report["results"].setdefault(name, {})[processes] = result
+                print(f"{name:8} {processes:3} processes  {result['writes_per_second']:8.1f} writes/s"
+                      f"  p50 {result.get('p50_ms', 0):8.1f} ms  p99 {result.get('p99_ms', 0):8.1f} ms"
+                      f"  locked {result['locked_errors']}")
+    report["notes"] = dataset.notes
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Gunicorn settings for serving the API in production.
+
+    gunicorn --config gunicorn.conf.py
+
+The Django app is loaded once in the master and the workers are forked
+from it, so they start fast and share the imported code. The number of
+workers follows the CPUs this process may use, including a container's
+CPU quota, and can be set with WEB_CONCURRENCY. Several workers need the
+shared cache of REDIS_URL, without it there is one worker with as many
+threads instead. On SIGTERM the workers
+stop accepting connections and finish the requests they have, for up to
+graceful_timeout seconds.
+"""
+import math
+import os
+
+
+def available_cpus() -> int:
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    # cgroup v2 quota, e.g. "200000 100000" for 2 CPUs or "max 100000"
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+wsgi_app = "simplenote.wsgi:application"
+bind = os.environ.get("BIND", f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+
+preload_app = True
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "sync")
+# the usual rule of thumb for sync workers that also wait on the database
+concurrency = int(os.environ.get("WEB_CONCURRENCY", 2 * available_cpus() + 1))
+if os.environ.get("REDIS_URL"):
+    workers = concurrency
+else:
+    # Without REDIS_URL the Django cache is a LocMemCache in each process, and
+    # a write would only drop the cached notes and lists of the worker that
+    # served it. So there is one worker, and the concurrency goes to its
+    # threads, which share its cache (gunicorn uses gthread for threads > 1).
+    workers = 1
+    threads = concurrency
+
+timeout = 30
+graceful_timeout = 20
+keepalive = 5
+# restart workers now and then, staggered, to bound slow memory growth
+max_requests = 5000
+max_requests_jitter = 500
+
+accesslog = "-"
+errorlog = "-"
+
+
+def when_ready(server):
+    # import the URLconf, and with it every view, before the workers are
+    # forked, so that their first requests do not pay for it
+    if preload_app:
+        from django.urls import get_resolver
+        get_resolver().url_patterns
+
+
+def post_fork(server, worker):
+    # nothing should have connected before the fork, but a connection
+    # inherited from the master must never be shared between workers
+    from django.db import connections
+    connections.close_all()
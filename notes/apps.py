@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def ensure_triggers(sender, using, **kwargs):
+    from django.db import connections
+    from . import changes, facets, search
+
+    search.ensure_index(connections[using])
+    changes.ensure_triggers(connections[using])
+    facets.ensure_triggers(connections[using])
 
 
 class NotesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'notes'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # schema changes on SQLite drop the search, change and facet triggers, put them back
+        post_migrate.connect(ensure_triggers, sender=self)
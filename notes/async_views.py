@@ -0,0 +1,183 @@
+"""
+Async versions of the note read endpoints, for serving under ASGI.
+
+The sync DRF views hold a worker thread for the whole request, also while
+it waits on the database. These views run on the event loop instead: the
+JWT check and the response caches are in-process, so a cached read never
+leaves the loop, and queries go through Django's async ORM.
+
+They answer GET and HEAD in the format the Accept header asks for, like
+the sync views, with JSON in place of the browsable API. Every other method is passed on to the sync view, so the URLs
+behave the same. notes/urls.py uses them when ASYNC_NOTE_VIEWS is on.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
+from django.http import Http404, HttpResponse
+from django.urls import reverse
+from rest_framework import exceptions, status
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+
+from accounts.authentication import CachedJWTAuthentication
+from . import cache as note_cache
+from . import fast, sparse, views
+from .models import Note
+from .pagination import NoteCursorPagination, SearchResultsPagination
+from .search import search_notes
+from .serializers import NoteSerializer
+
+# the renderers of the sync views but the browsable API, JSON first
+renderers = [renderer_class() for renderer_class in api_settings.DEFAULT_RENDERER_CLASSES
+             if renderer_class.format != "api"]
+negotiator = DefaultContentNegotiation()
+authenticator = CachedJWTAuthentication()
+
+
+def negotiate(request: Request):
+    """The renderer the Accept header asks for, JSON for browsers"""
+    try:
+        renderer, _ = negotiator.select_renderer(request, renderers)
+    except exceptions.NotAcceptable:
+        return renderers[0]
+    return renderer
+
+
+def render(request: Request, data, status=status.HTTP_200_OK, headers=None):
+    renderer = request.accepted_renderer
+    response = HttpResponse(
+        renderer.render(data) if data is not None else b"",
+        status=status, content_type=renderer.media_type, headers=headers)
+    response["Vary"] = "Accept"
+    return response
+
+
+def read_view(sync_view):
+    """
+        Turn an async function into a view that serves reads itself and
+        passes every other method to sync_view.
+
+        The function gets a DRF Request that is already authenticated, and
+        DRF exceptions are turned into the same responses as in the sync views.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return await sync_to_async(sync_view)(request, *args, **kwargs)
+            drf_request = Request(request, authenticators=[])
+            drf_request.accepted_renderer = negotiate(drf_request)
+            try:
+                result = await authenticator.aauthenticate(request)
+                drf_request.user, drf_request.auth = result or (AnonymousUser(), None)
+                return await view(drf_request, *args, **kwargs)
+            except (exceptions.APIException, Http404, PermissionDenied) as exc:
+                if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                    exc.auth_header = authenticator.authenticate_header(request)
+                response = exception_handler(exc, {})
+                headers = {name: value for name, value in response.items() if name != "Content-Type"}
+                return render(drf_request, response.data, response.status_code, headers)
+        # csrf_exempt() would wrap it in a sync function, the flag is all it sets
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+def require_authentication(request):
+    if not request.user.is_authenticated:
+        raise exceptions.NotAuthenticated()
+
+
+async def cached_list(request, queryset, paginator):
+    """
+        One page of queryset, through the same per-user cache as
+        CachedListMixin, with ?fields= and ?view= applied like SparseFieldsMixin.
+    """
+    key = note_cache.list_key(request.user.pk, request.build_absolute_uri())
+    data = note_cache.cache.get(key)
+    if data is not None:
+        return render(request, data, headers={"X-Cache": "HIT"})
+    representation = sparse.representation(request.query_params)
+    queryset = representation.queryset(queryset)
+    if fast.supports(representation) and isinstance(paginator, NoteCursorPagination):
+        # the read path of FastListMixin
+        rows = await paginator.apaginate_queryset(
+            fast.note_rows(queryset, representation.fields), request)
+        tags = {}
+        if "tags" in representation.fields and rows:
+            tags = fast.tags_by_note(
+                [row async for row in fast.tag_rows([row["id"] for row in rows])])
+        results = fast.note_dicts(rows, representation.fields, tags)
+    else:
+        page = await paginator.apaginate_queryset(queryset, request)
+        results = representation.serializer(page, many=True).data
+    data = paginator.get_paginated_response(results).data
+    note_cache.set_list_page(key, data)
+    return render(request, data, headers={"X-Cache": "MISS"})
+
+
+@read_view(views.NoteListCreateView.as_view())
+async def list_notes(request: Request):
+    require_authentication(request)
+    queryset = Note.objects.filter(author=request.user).with_relations()
+    return await cached_list(request, queryset, NoteCursorPagination())
+
+
+@read_view(views.NoteRetrieveUpdateDeleteView.as_view())
+async def note_detail(request: Request, pk):
+    entry = note_cache.get_public_note(pk)
+    hit = entry is not None
+    if not hit:
+        try:
+            note = await Note.objects.with_relations().aget(pk=pk)
+        except ObjectDoesNotExist:
+            raise Http404
+        if not note.public:
+            if not request.user.is_authenticated:
+                raise exceptions.NotAuthenticated()
+            if request.user.pk != note.author_id:
+                raise exceptions.PermissionDenied()
+            return render(request, NoteSerializer(note).data)
+        entry = note_cache.set_public_note(note.pk, NoteSerializer(note).data)
+
+    data, digest = entry
+    etag = f'"{digest}-{request.accepted_renderer.format}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Cache": "HIT" if hit else "MISS"}
+    if note_cache.etag_matches(etag, request.headers.get("If-None-Match")):
+        return render(request, None, status.HTTP_304_NOT_MODIFIED, headers)
+    return render(request, data, headers=headers)
+
+
+@read_view(views.get_notes_for_current_user)
+async def current_user(request: Request):
+    require_authentication(request)
+    user = request.user
+    pks = Note.objects.filter(author=user).values_list("pk", flat=True)
+    # what CurrentUserNotesSerializer renders, without its lazy query
+    return render(request, {
+        "id": user.pk,
+        "username": user.username,
+        "email": user.email,
+        "notes": [request.build_absolute_uri(reverse("note_detail", kwargs={"pk": pk}))
+                  async for pk in pks],
+    })
+
+
+@read_view(views.ListNotesByTagFilter.as_view())
+async def filter_tag(request: Request, tag):
+    require_authentication(request)
+    user = request.user
+    queryset = Note.objects.filter(
+        author=user, tags__owner=user, tags__name=tag).with_relations()
+    return await cached_list(request, queryset, NoteCursorPagination())
+
+
+@read_view(views.ListSearchNotesByKeyWord.as_view())
+async def search_keyword(request: Request, keyword):
+    require_authentication(request)
+    queryset = search_notes(request.user, keyword).with_relations()
+    return await cached_list(request, queryset, SearchResultsPagination())
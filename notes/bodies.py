@@ -0,0 +1,131 @@
+"""
+Note bodies stored compressed.
+
+A few very long notes make up most of the database. CompressedTextField
+stores every body of NOTE_BODY_COMPRESSION["MIN_SIZE"] bytes or more as a
+BLOB: MARKER followed by the zlib stream of its UTF-8 text. Shorter bodies
+stay plain TEXT, so most rows are unchanged and the two kinds can be told
+apart by their type alone.
+
+Rows are loaded with the compressed bytes, and a body is decompressed the
+first time the attribute is read, so lists that never touch the body never
+pay for it. Code that reads the column itself, values() rows or SQL, goes
+through text() or the note_body() SQL function, which the SQLite backend
+registers on every connection (see "functions" in the DATABASES OPTIONS).
+
+Compression only happens on SQLite, which stores a BLOB in any column.
+"""
+import zlib
+
+from django.conf import settings
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+MARKER = b"zlib:"
+SQL_FUNCTION = "note_body"
+
+DEFAULTS = {
+    # bodies of at least this many bytes are compressed, None to turn it off
+    "MIN_SIZE": 4096,
+    "LEVEL": 6,
+}
+
+
+def compression_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "NOTE_BODY_COMPRESSION", {})}
+
+
+def compress(body: str):
+    """The value to store for body: compressed bytes, or body itself"""
+    config = compression_settings()
+    data = body.encode()
+    if config["MIN_SIZE"] is None or len(data) < config["MIN_SIZE"]:
+        return body
+    compressed = MARKER + zlib.compress(data, config["LEVEL"])
+    return compressed if len(compressed) < len(data) else body
+
+
+def text(value):
+    """The body text of a stored value, compressed or not"""
+    if isinstance(value, (bytes, memoryview)):
+        value = bytes(value)
+        if value.startswith(MARKER):
+            return zlib.decompress(value[len(MARKER):]).decode()
+        return value.decode()
+    return value
+
+
+class CompressedBodyAttribute(DeferredAttribute):
+    """Decompresses the stored value the first time it is read"""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, bytes):
+            value = instance.__dict__[self.field.attname] = text(value)
+        return value
+
+    def __set__(self, instance, value):
+        # a data descriptor, so that reads of a loaded value go through __get__
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedTextField(models.TextField):
+    descriptor_class = CompressedBodyAttribute
+
+    def get_db_prep_save(self, value, connection):
+        value = super().get_db_prep_save(value, connection)
+        if isinstance(value, str) and connection.vendor == "sqlite":
+            return compress(value)
+        return value
+
+
+class BodyText(models.Func):
+    """The text of a note body column in SQL, e.g. to cut a preview from it"""
+    function = SQL_FUNCTION
+    output_field = models.TextField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        # only SQLite stores compressed bodies
+        return compiler.compile(self.source_expressions[0])
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, **extra_context)
+
+
+def compress_stored(conn, compressed=True, batch_size=500) -> dict:
+    """
+        Store the body of every row of notes_note the way
+        CompressedTextField would now, or as plain text if not compressed,
+        batch_size rows at a time. Returns how many rows changed and the
+        stored body bytes before and after.
+    """
+    report = {"rows": 0, "compressed": 0, "decompressed": 0, "bytes_before": 0, "bytes_after": 0}
+    last_id = 0
+    with conn.cursor() as cursor:
+        while True:
+            cursor.execute(
+                "SELECT id, body FROM notes_note WHERE id > %s ORDER BY id LIMIT %s",
+                [last_id, batch_size])
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            updates = []
+            for pk, stored in rows:
+                body = text(stored)
+                value = compress(body) if compressed else body
+                if value != stored:
+                    updates.append((value, pk))
+                    report["compressed" if isinstance(value, bytes) else "decompressed"] += 1
+                report["bytes_before"] += stored_size(stored)
+                report["bytes_after"] += stored_size(value)
+            report["rows"] += len(rows)
+            if updates:
+                cursor.executemany("UPDATE notes_note SET body = %s WHERE id = %s", updates)
+    return report
+
+
+def stored_size(value) -> int:
+    return len(value) if isinstance(value, bytes) else len(value.encode())
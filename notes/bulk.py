@@ -0,0 +1,116 @@
+"""
+Batched note writes for sync clients.
+
+A batch is a list of create, update and delete operations. They are
+validated one by one, then applied together in a single transaction with
+one bulk statement per kind of write instead of a round of queries per note.
+"""
+from django.db import transaction
+from django.db.models import F
+from rest_framework import status
+
+from . import cache
+from .models import Note, NoteTag, Tag
+from .serializers import BulkNoteOperationSerializer, NoteSerializer
+
+
+def unique_names(names):
+    """Tag names in their original order, without duplicates"""
+    return list(dict.fromkeys(names))
+
+
+def apply_operations(user, operations):
+    """Apply a batch of operations for user and return one result per operation"""
+    results = [{"index": index} for index in range(len(operations))]
+    creates, updates, deletes = [], {}, {}
+
+    for index, item in enumerate(operations):
+        serializer = BulkNoteOperationSerializer(data=item)
+        if not serializer.is_valid():
+            results[index].update(status=status.HTTP_400_BAD_REQUEST, errors=serializer.errors)
+            continue
+        data = serializer.validated_data
+        results[index]["op"] = data["op"]
+        if data["op"] == "create":
+            creates.append((index, data))
+            continue
+        if data["id"] in updates or data["id"] in deletes:
+            results[index].update(
+                status=status.HTTP_400_BAD_REQUEST,
+                errors={"id": ["This note appears more than once in the batch."]})
+            continue
+        (updates if data["op"] == "update" else deletes)[data["id"]] = (index, data)
+
+    with transaction.atomic():
+        # only the fields an update sends are set and written back, so the
+        # stored body is not loaded (and decompressed) for nothing
+        existing = Note.objects.filter(author=user).only("id").in_bulk(
+            list(updates) + list(deletes))
+        for pk, (index, data) in list(updates.items()) + list(deletes.items()):
+            if pk not in existing:
+                results[index].update(
+                    id=pk, status=status.HTTP_404_NOT_FOUND, errors={"id": ["Note not found."]})
+                updates.pop(pk, None)
+                deletes.pop(pk, None)
+
+        new_notes = Note.objects.bulk_create([
+            Note(author=user, title=data["title"], body=data["body"],
+                 public=data.get("public", False))
+            for _, data in creates
+        ])
+        links = [
+            (note.pk, name)
+            for note, (_, data) in zip(new_notes, creates)
+            for name in unique_names(data.get("tags", []))
+        ]
+
+        # one statement per set of fields sent, so that e.g. toggling public
+        # neither rewrites the body nor fires the search index triggers
+        changed = {}
+        for pk, (_, data) in updates.items():
+            note = existing[pk]
+            fields = tuple(field for field in ("title", "body", "public") if field in data)
+            for field in fields:
+                setattr(note, field, data[field])
+            note.version = F("version") + 1
+            changed.setdefault(fields, []).append(note)
+        for fields, notes in changed.items():
+            Note.objects.bulk_update(notes, [*fields, "version"])
+
+        # updates that carry tags replace the note's tags with that list
+        retagged = {pk: unique_names(data["tags"])
+                    for pk, (_, data) in updates.items() if "tags" in data}
+        for pk, names in retagged.items():
+            links += [(pk, name) for name in names]
+
+        tag_ids = Tag.objects.resolve((user.pk, name) for _, name in links)
+        wanted = dict.fromkeys((note_id, tag_ids[user.pk, name]) for note_id, name in links)
+        if retagged:
+            current = {(note_id, tag_id): pk for pk, note_id, tag_id in NoteTag.objects.filter(
+                note_id__in=retagged).values_list("pk", "note_id", "tag_id")}
+            stale = [pk for link, pk in current.items() if link not in wanted]
+            if stale:
+                NoteTag.objects.filter(pk__in=stale).delete()
+            wanted = [link for link in wanted if link not in current]
+        NoteTag.objects.bulk_create(
+            [NoteTag(note_id=note_id, tag_id=tag_id) for note_id, tag_id in wanted],
+            ignore_conflicts=True)
+
+        if deletes:
+            Note.objects.filter(pk__in=list(deletes)).delete()
+        # bulk_update skips the save signals that drop cached notes
+        cache.invalidate_notes(updates)
+        cache.bump_generation(user.pk)
+
+    written = Note.objects.filter(
+        pk__in=[note.pk for note in new_notes] + list(updates)).with_relations().in_bulk()
+    for note, (index, _) in zip(new_notes, creates):
+        results[index].update(
+            id=note.pk, status=status.HTTP_201_CREATED,
+            note=NoteSerializer(written[note.pk]).data)
+    for pk, (index, _) in updates.items():
+        results[index].update(
+            id=pk, status=status.HTTP_200_OK, note=NoteSerializer(written[pk]).data)
+    for pk, (index, _) in deletes.items():
+        results[index].update(id=pk, status=status.HTTP_204_NO_CONTENT)
+    return results
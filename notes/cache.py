@@ -0,0 +1,161 @@
+"""
+Response caching for note reads.
+
+Public notes are cached by id as their serialized data together with a
+digest of that data, which the detail view turns into a strong ETag.
+Writes drop the affected entries right away and once more when their
+transaction commits, so a reader racing the write cannot put the old
+version back for long.
+
+List pages are cached per user under keys that contain a generation
+counter for that user. Any write to the user's notes or tags bumps the
+counter, after which the old pages are never looked up again and simply
+expire, so nothing has to be scanned or purged.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from simplenote import routers
+
+DETAIL_KEY = "notes:detail:{}"
+HITS_KEY = "notes:detail:hits"
+MISSES_KEY = "notes:detail:misses"
+GENERATION_KEY = "notes:generation:{}"
+LIST_KEY = "notes:list:{}:{}:{}"
+
+
+def cache_timeout() -> int:
+    return getattr(settings, "NOTE_CACHE_TIMEOUT", 300)
+
+
+def digest(data) -> str:
+    """Stable hash of serialized data"""
+    content = json.dumps(data, cls=JSONEncoder, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def get_public_note(pk):
+    """The cached (data, digest) of a public note, or None"""
+    entry = cache.get(DETAIL_KEY.format(pk))
+    # a miss is only counted by set_public_note, once the note turned out to
+    # be public: private and missing notes are never cached to begin with
+    if entry is not None:
+        count(HITS_KEY)
+    return entry
+
+
+def set_public_note(pk, data):
+    """Cache a public note that get_public_note missed"""
+    count(MISSES_KEY)
+    entry = (data, digest(data))
+    # every user reads this entry, including an author who is pinned to the
+    # primary right after a write, so a lagging replica must not fill it
+    if not routers.reading_from_replica():
+        cache.set(DETAIL_KEY.format(pk), entry, cache_timeout())
+    return entry
+
+
+def etag_matches(etag, if_none_match) -> bool:
+    """
+        If-None-Match compares ETags weakly, so a W/ tag from a compressed
+        response still matches the strong one of the view.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    return any(tag.removeprefix("W/") == etag for tag in parse_etags(if_none_match))
+
+
+def invalidate_notes(pks):
+    keys = [DETAIL_KEY.format(pk) for pk in pks]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def generation(user_id) -> int:
+    key = GENERATION_KEY.format(user_id)
+    value = cache.get(key)
+    if value is None:
+        # start from the clock rather than 1, so a counter that was evicted
+        # cannot come back at a value that old pages were stored under
+        cache.add(key, time.time_ns(), timeout=None)
+        value = cache.get(key)
+    return value
+
+
+def bump_generation(user_id):
+    """Make every cached list page of the user unreachable"""
+    def bump():
+        key = GENERATION_KEY.format(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def list_key(user_id, url) -> str:
+    url_digest = hashlib.sha256(url.encode()).hexdigest()
+    return LIST_KEY.format(user_id, generation(user_id), url_digest)
+
+
+def set_list_page(key, data):
+    # a page read from a lagging replica would still be served under this
+    # generation once the replica has caught up, so only the primary fills it
+    if not routers.reading_from_replica():
+        cache.set(key, data, cache_timeout())
+
+
+class CachedListMixin:
+    """
+        Serve the pages of a per-user list view from the cache.
+
+        Pages are keyed on their full URL, so every filter, cursor and page
+        size gets its own entry, and the links in a page stay correct.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        key = list_key(request.user.pk, request.build_absolute_uri())
+        data = cache.get(key)
+        if data is not None:
+            return Response(data, headers={"X-Cache": "HIT"})
+        response = super().list(request, *args, **kwargs)
+        set_list_page(key, response.data)
+        response["X-Cache"] = "MISS"
+        return response
+
+
+def count(key):
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # evicted between add and incr
+            cache.add(key, 1, timeout=None)
+
+
+def stats() -> dict:
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = counts.get(HITS_KEY, 0), counts.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / lookups if lookups else None,
+    }
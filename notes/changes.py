@@ -0,0 +1,177 @@
+"""
+Change tracking for delta sync.
+
+notes_change holds one row per note and tag: its owner, whether it has
+been deleted, and a change sequence number, which is the row's
+AUTOINCREMENT id. Triggers on notes_note, notes_tag and notes_notetag
+replace the row of an object on every write, and the new row gets an id
+higher than any before. So the rows of a user with an id above the
+token of their last sync are exactly what changed since, one row per
+object however often it changed, and deleted objects leave a tombstone.
+
+Like the search index, the triggers see every write, including bulk
+inserts, queryset updates and cascading deletes. Tagging or untagging a
+note counts as a change of the note.
+"""
+from django.db import connection
+
+from . import fast
+from .models import Change, Note, Tag
+from .search import is_supported
+
+CHANGE_TABLE = Change._meta.db_table
+
+# tables whose writes are tracked -> (kind, owner column)
+TRACKED = {
+    "notes_note": (Change.NOTE, "author_id"),
+    "notes_tag": (Change.TAG, "owner_id"),
+}
+
+
+# The old row is deleted before the new one goes in, rather than replaced
+# with INSERT OR REPLACE: the conflict clause of the statement that fires a
+# trigger overrides the ones inside it, so the INSERT OR IGNORE of
+# bulk_create(ignore_conflicts=True) would keep the old row and its id.
+
+def record(kind, row, owner, deleted):
+    return (f"DELETE FROM {CHANGE_TABLE} WHERE kind = '{kind}' AND object_id = {row}.id; "
+            f"INSERT INTO {CHANGE_TABLE}(owner_id, kind, object_id, deleted) "
+            f"VALUES ({row}.{owner}, '{kind}', {row}.id, {deleted});")
+
+
+def record_note(note_id):
+    # only while the note exists, so that deleting the links of a deleted
+    # note does not bring it back
+    return (f"DELETE FROM {CHANGE_TABLE} WHERE kind = '{Change.NOTE}' AND object_id = {note_id} "
+            f"AND EXISTS (SELECT 1 FROM notes_note WHERE id = {note_id}); "
+            f"INSERT INTO {CHANGE_TABLE}(owner_id, kind, object_id, deleted) "
+            f"SELECT author_id, '{Change.NOTE}', id, 0 FROM notes_note WHERE id = {note_id};")
+
+
+TRIGGERS = {}
+for table, (kind, owner) in TRACKED.items():
+    TRIGGERS.update({
+        f"{table}_change_ai": f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_change_ai AFTER INSERT ON {table} BEGIN
+                {record(kind, "new", owner, 0)}
+            END
+        """,
+        f"{table}_change_au": f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_change_au AFTER UPDATE ON {table} BEGIN
+                {record(kind, "new", owner, 0)}
+            END
+        """,
+        f"{table}_change_ad": f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_change_ad AFTER DELETE ON {table} BEGIN
+                {record(kind, "old", owner, 1)}
+            END
+        """,
+    })
+TRIGGERS.update({
+    "notes_notetag_change_ai": f"""
+        CREATE TRIGGER IF NOT EXISTS notes_notetag_change_ai AFTER INSERT ON notes_notetag BEGIN
+            {record_note("new.note_id")}
+        END
+    """,
+    "notes_notetag_change_ad": f"""
+        CREATE TRIGGER IF NOT EXISTS notes_notetag_change_ad AFTER DELETE ON notes_notetag BEGIN
+            {record_note("old.note_id")}
+        END
+    """,
+})
+
+
+def missing_triggers(conn=connection) -> set:
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        existing = {row[0] for row in cursor.fetchall()}
+    return set(TRIGGERS) - existing
+
+
+def create_triggers(conn=connection):
+    with conn.cursor() as cursor:
+        for sql in TRIGGERS.values():
+            cursor.execute(sql)
+
+
+def drop_triggers(conn=connection):
+    with conn.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def record_all(conn=connection):
+    """Record every note and tag as changed, so every client syncs them again"""
+    with conn.cursor() as cursor:
+        for table, (kind, owner) in TRACKED.items():
+            cursor.execute(
+                f"INSERT OR REPLACE INTO {CHANGE_TABLE}(owner_id, kind, object_id, deleted) "
+                f"SELECT {owner}, '{kind}', id, 0 FROM {table} ORDER BY id")
+
+
+def ensure_triggers(conn=connection) -> bool:
+    """
+        Create the triggers if Django dropped them with a rebuilt table.
+
+        Writes made without them went unrecorded, so every note and tag is
+        recorded again. Returns True if the triggers were missing.
+    """
+    if not is_supported(conn):
+        return False
+    # not migrated that far yet, or migrated back
+    if CHANGE_TABLE not in conn.introspection.table_names():
+        return False
+    if not missing_triggers(conn):
+        return False
+    create_triggers(conn)
+    record_all(conn)
+    return True
+
+
+def changes_since(user, token: int, limit: int) -> dict:
+    """
+        What changed for user after token, at most limit notes and tags.
+
+        Changed notes are rendered like NoteSerializer and changed tags as
+        their id and name, in the order they changed in, and deleted ones as
+        their ids. The token to sync from next comes with them, and more is
+        True when there are further changes after it.
+    """
+    changes = Change.objects.filter(owner=user, id__gt=token)
+    if token == 0:
+        # a first sync only needs what exists
+        changes = changes.filter(deleted=False)
+    rows = list(changes.order_by("id").values_list(
+        "id", "kind", "object_id", "deleted")[:limit + 1])
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    changed = {Change.NOTE: [], Change.TAG: []}
+    deleted = {Change.NOTE: [], Change.TAG: []}
+    for _, kind, object_id, is_deleted in rows:
+        (deleted if is_deleted else changed)[kind].append(object_id)
+
+    # an object deleted after its change was read is left out here, its
+    # tombstone has a higher id and comes with the next sync
+    notes, tags = [], []
+    if changed[Change.NOTE]:
+        fields = set(fast.field_order())
+        note_rows = list(fast.note_rows(
+            Note.objects.filter(pk__in=changed[Change.NOTE]).order_by(), fields))
+        tag_names = fast.tags_by_note(fast.tag_rows([row["id"] for row in note_rows]))
+        notes = in_order(fast.note_dicts(note_rows, fields, tag_names), changed[Change.NOTE])
+    if changed[Change.TAG]:
+        tags = in_order(Tag.objects.filter(pk__in=changed[Change.TAG]).values("id", "name"),
+                        changed[Change.TAG])
+    return {
+        "token": str(rows[-1][0] if rows else token),
+        "more": more,
+        "notes": notes,
+        "tags": tags,
+        "deleted": {"notes": deleted[Change.NOTE], "tags": deleted[Change.TAG]},
+    }
+
+
+def in_order(objects, ids) -> list:
+    by_id = {obj["id"]: obj for obj in objects}
+    return [by_id[pk] for pk in ids if pk in by_id]
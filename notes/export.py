@@ -0,0 +1,72 @@
+"""
+Streaming export of every note as newline-delimited JSON.
+
+Notes are read with a chunked iterator, the authors and tags of each chunk
+are loaded in one query each, and lines are sent as soon as a buffer fills
+up, so memory use stays flat however many notes there are.
+"""
+import datetime
+import zlib
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Note
+from .serializers import NoteSerializer
+
+CHUNK_SIZE = 2000
+# bytes collected before a piece of the response is sent
+BUFFER_SIZE = 64 * 1024
+
+
+def parse_bound(value):
+    """An aware datetime from an ISO 8601 date or datetime, None if invalid"""
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                return None
+            moment = datetime.datetime.combine(day, datetime.time.min)
+    except ValueError:
+        return None
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def export_notes(created_after=None, created_before=None):
+    """Notes to export, oldest first"""
+    notes = Note.objects.with_relations().order_by("created", "id")
+    if created_after is not None:
+        notes = notes.filter(created__gte=created_after)
+    if created_before is not None:
+        notes = notes.filter(created__lt=created_before)
+    return notes
+
+
+def ndjson_lines(notes):
+    encoder = JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    for note in notes.iterator(chunk_size=CHUNK_SIZE):
+        yield (encoder.encode(NoteSerializer(note).data) + "\n").encode()
+
+
+def buffered(lines, compress=False):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if compress else None
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= BUFFER_SIZE:
+            chunk = b"".join(buffer)
+            buffer, size = [], 0
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+    chunk = b"".join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
@@ -0,0 +1,230 @@
+"""
+Filtering notes by several tags, with facet counts.
+
+?all=work,urgent matches notes with every one of the tags, ?any=home,garden
+notes with at least one of them and ?not=done notes with none of them, in
+any combination. The filter is one query, shaped by how many notes the
+tags have. When the rarest tag asked for has at most DRIVE_LIMIT notes,
+its notes lead the query and are sorted, otherwise the author's notes are
+read in page order, and either way every condition is an EXISTS probe of
+the (note, tag) index.
+
+The facets say how many of the matching notes carry each other tag of the
+user. notes_tagpair holds how many notes have each pair of tags, kept up
+to date by triggers on notes_notetag like the change log, so the facets
+of no filter, one tag or one excluded tag are read from it without
+touching the notes. Every other filter would need how many notes have
+three or more tags at once, which pair counts cannot give, and keeping
+counts of larger sets would make each tag change on a note with n tags
+rewrite in the order of n² rows instead of n. Those filters count the
+tags of their matching notes in one grouped query instead, which starts
+from the notes of the rarest tag when there is one.
+"""
+from django.db import connection
+from django.db.models import Count, Exists, F, OuterRef
+from rest_framework.exceptions import ValidationError
+
+from .models import Note, NoteTag, Tag, TagPair
+from .search import is_supported
+
+PARAMS = ("all", "any", "not")
+MAX_TAGS = 20
+# most notes of a tag that are sorted into pages rather than scanned for
+DRIVE_LIMIT = 2000
+
+PAIR_TABLE = TagPair._meta.db_table
+
+TRIGGERS = {
+    # pairs the new tag with every tag of the note, itself included
+    "notes_notetag_facet_ai": f"""
+        CREATE TRIGGER IF NOT EXISTS notes_notetag_facet_ai AFTER INSERT ON notes_notetag BEGIN
+            INSERT INTO {PAIR_TABLE}(tag_id, other_id, notes)
+            SELECT new.tag_id, tag_id, 1 FROM notes_notetag WHERE note_id = new.note_id
+            UNION ALL
+            SELECT tag_id, new.tag_id, 1 FROM notes_notetag
+            WHERE note_id = new.note_id AND tag_id != new.tag_id
+            ON CONFLICT(tag_id, other_id) DO UPDATE SET notes = notes + 1;
+        END
+    """,
+    # the row is gone already, so the note's other tags are what is left
+    "notes_notetag_facet_ad": f"""
+        CREATE TRIGGER IF NOT EXISTS notes_notetag_facet_ad AFTER DELETE ON notes_notetag BEGIN
+            UPDATE {PAIR_TABLE} SET notes = notes - 1
+            WHERE tag_id = old.tag_id AND other_id = old.tag_id;
+            UPDATE {PAIR_TABLE} SET notes = notes - 1
+            WHERE tag_id = old.tag_id
+            AND other_id IN (SELECT tag_id FROM notes_notetag WHERE note_id = old.note_id);
+            UPDATE {PAIR_TABLE} SET notes = notes - 1
+            WHERE other_id = old.tag_id
+            AND tag_id IN (SELECT tag_id FROM notes_notetag WHERE note_id = old.note_id);
+            DELETE FROM {PAIR_TABLE} WHERE tag_id = old.tag_id AND notes = 0;
+            DELETE FROM {PAIR_TABLE}
+            WHERE other_id = old.tag_id AND notes = 0
+            AND tag_id IN (SELECT tag_id FROM notes_notetag WHERE note_id = old.note_id);
+        END
+    """,
+}
+
+
+def missing_triggers(conn=connection) -> set:
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'notes_notetag'")
+        existing = {row[0] for row in cursor.fetchall()}
+    return set(TRIGGERS) - existing
+
+
+def create_triggers(conn=connection):
+    with conn.cursor() as cursor:
+        for sql in TRIGGERS.values():
+            cursor.execute(sql)
+
+
+def drop_triggers(conn=connection):
+    with conn.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def count_pairs(conn=connection):
+    """Count every pair again from notes_notetag"""
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {PAIR_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {PAIR_TABLE}(tag_id, other_id, notes) "
+            "SELECT a.tag_id, b.tag_id, count(*) FROM notes_notetag a "
+            "JOIN notes_notetag b ON b.note_id = a.note_id "
+            "GROUP BY a.tag_id, b.tag_id")
+
+
+def ensure_triggers(conn=connection) -> bool:
+    """
+        Create the triggers if Django dropped them with a rebuilt table, and
+        count the pairs again. Returns True if the triggers were missing.
+    """
+    if not is_supported(conn):
+        return False
+    # not migrated that far yet, or migrated back
+    if PAIR_TABLE not in conn.introspection.table_names():
+        return False
+    if not missing_triggers(conn):
+        return False
+    create_triggers(conn)
+    count_pairs(conn)
+    return True
+
+
+class TagFilter:
+    """The tag ids of ?all=, ?any= and ?not=, and their names"""
+    __slots__ = ("all", "any", "not_", "names", "impossible", "lead", "lead_notes")
+
+    def __init__(self, all_ids, any_ids, not_ids, names, impossible, counts):
+        self.all = all_ids
+        self.any = any_ids
+        self.not_ = not_ids
+        self.names = names
+        # a tag of ?all= or every tag of ?any= does not exist
+        self.impossible = impossible
+        # the fewest tags whose notes hold every match, and how many notes
+        # they have, None when unknown
+        self.lead, self.lead_notes = [], None
+        if all_ids:
+            rarest = min(all_ids, key=lambda tag_id: counts.get(tag_id, 0))
+            self.lead = [rarest]
+            self.lead_notes = counts.get(rarest) if counts else None
+        elif any_ids:
+            self.lead = any_ids
+            self.lead_notes = sum(counts.get(tag_id, 0) for tag_id in any_ids) if counts else None
+
+
+def tag_filter(user, query_params) -> TagFilter:
+    """Parse ?all=, ?any= and ?not=, raising ValidationError for too many tags"""
+    names = {}
+    for param in PARAMS:
+        value = query_params.get(param) or ""
+        names[param] = list(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+        if len(names[param]) > MAX_TAGS:
+            raise ValidationError({param: [f"Give at most {MAX_TAGS} tags."]})
+
+    wanted = {name for param in PARAMS for name in names[param]}
+    tag_ids = dict(Tag.objects.filter(owner=user, name__in=wanted).values_list("name", "pk"))
+
+    def ids(param):
+        return [tag_ids[name] for name in names[param] if name in tag_ids]
+
+    impossible = (len(ids("all")) < len(names["all"])
+                  or bool(names["any"]) and not ids("any"))
+    positive = ids("all") + ids("any")
+    counts = note_counts(positive) if positive and is_supported() else {}
+    return TagFilter(ids("all"), ids("any"), ids("not"), wanted, impossible, counts)
+
+
+def has_tags(tag_ids):
+    return Exists(NoteTag.objects.filter(note_id=OuterRef("pk"), tag_id__in=tag_ids))
+
+
+def filter_notes(queryset, tags: TagFilter, drive_limit=DRIVE_LIMIT):
+    """
+        queryset narrowed to the notes that match tags. The notes of
+        tags.lead lead the query if there are at most drive_limit of them,
+        or any number with None.
+    """
+    if tags.impossible:
+        return queryset.none()
+    if tags.lead and (drive_limit is None
+                      or tags.lead_notes is not None and tags.lead_notes <= drive_limit):
+        queryset = queryset.filter(
+            pk__in=NoteTag.objects.filter(tag_id__in=tags.lead).values("note_id"))
+    for tag_id in tags.all:
+        queryset = queryset.filter(has_tags([tag_id]))
+    if tags.any:
+        queryset = queryset.filter(has_tags(tags.any))
+    if tags.not_:
+        queryset = queryset.exclude(has_tags(tags.not_))
+    return queryset
+
+
+def facet_counts(user, tags: TagFilter) -> dict:
+    """
+        Tag name -> how many of the notes of user matching tags carry it,
+        most common first. The tags of the filter are left out.
+    """
+    if tags.impossible:
+        return {}
+    notes = filter_notes(Note.objects.filter(author=user), tags, drive_limit=None)
+    positive = tags.all + tags.any
+    if not is_supported():
+        counts = live_counts(notes)
+    elif not positive and not tags.not_:
+        counts = tag_counts(user)
+    elif len(positive) == 1 and not tags.not_:
+        counts = pair_counts(positive[0])
+    elif not positive and len(tags.not_) == 1:
+        pairs = pair_counts(tags.not_[0])
+        counts = {name: count - pairs.get(name, 0) for name, count in tag_counts(user).items()}
+    else:
+        counts = live_counts(notes)
+    counts = {name: count for name, count in counts.items()
+              if count > 0 and name not in tags.names}
+    return dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+
+
+def tag_counts(user) -> dict:
+    # a tag paired with itself
+    return dict(TagPair.objects.filter(tag__owner=user, other_id=F("tag_id"))
+                .values_list("tag__name", "notes"))
+
+
+def note_counts(tag_ids) -> dict:
+    """Tag id -> how many notes have it"""
+    return dict(TagPair.objects.filter(tag_id__in=tag_ids, other_id=F("tag_id"))
+                .values_list("tag_id", "notes"))
+
+
+def pair_counts(tag_id) -> dict:
+    return dict(TagPair.objects.filter(tag_id=tag_id).values_list("other__name", "notes"))
+
+
+def live_counts(notes) -> dict:
+    return dict(NoteTag.objects.filter(note__in=notes.order_by().values("pk"))
+                .values("tag__name").annotate(notes=Count("*")).values_list("tag__name", "notes"))
@@ -0,0 +1,171 @@
+import csv
+import json
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from notes import cache
+from notes.export import parse_bound
+from notes.models import Note, NoteTag, Tag
+
+User = get_user_model()
+
+TRUE_VALUES = {"1", "true", "yes", "y", "t"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Import notes from a JSONL or CSV file. Every record needs the author's email, "
+        "a title and a body, and may have public, created and tags."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to read, or - for stdin")
+        parser.add_argument(
+            "--format", choices=["jsonl", "csv"],
+            help="Input format (default: guessed from the file extension)")
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Records written per transaction (default: %(default)s)")
+        parser.add_argument(
+            "--skip", type=int, default=0,
+            help="Number of records to skip, to resume an interrupted import")
+        parser.add_argument(
+            "--tag-separator", default=";",
+            help="Separator of the tags column in CSV files (default: %(default)s)")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        fmt = options["format"] or ("csv" if options["path"].endswith(".csv") else "jsonl")
+
+        stream = sys.stdin if options["path"] == "-" else open(
+            options["path"], newline="", encoding="utf-8")
+        try:
+            self.run(self.read(stream, fmt, options["tag_separator"]), options)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+    def read(self, stream, fmt, tag_separator):
+        """Yield (offset, record) pairs, record is None for unreadable input"""
+        if fmt == "csv":
+            for offset, row in enumerate(csv.DictReader(stream)):
+                tags = row.get("tags") or ""
+                row["tags"] = [tag.strip() for tag in tags.split(tag_separator) if tag.strip()]
+                yield offset, row
+            return
+        offset = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                yield offset, json.loads(line)
+            except ValueError:
+                yield offset, None
+            offset += 1
+
+    def run(self, records, options):
+        self.authors = {}
+        self.imported = self.skipped = 0
+        self.started = time.monotonic()
+        batch = []
+        for offset, record in records:
+            if offset < options["skip"]:
+                continue
+            batch.append((offset, record))
+            if len(batch) == options["batch_size"]:
+                self.write_batch(batch)
+                batch = []
+                self.report(offset + 1)
+        if batch:
+            self.write_batch(batch)
+            self.report(batch[-1][0] + 1)
+
+        elapsed = time.monotonic() - self.started
+        rate = self.imported / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.imported} notes, skipped {self.skipped} records "
+            f"in {elapsed:.1f}s ({rate:.0f} rows/sec)"))
+
+    def report(self, next_offset):
+        elapsed = time.monotonic() - self.started
+        rate = self.imported / elapsed if elapsed else 0
+        self.stderr.write(
+            f"{self.imported} imported, {self.skipped} skipped, {rate:.0f} rows/sec "
+            f"(resume with --skip {next_offset})")
+
+    def skip(self, offset, reason):
+        self.skipped += 1
+        self.stderr.write(f"record {offset}: {reason}, skipped")
+
+    def resolve_authors(self, emails):
+        unknown = set(emails) - self.authors.keys()
+        if unknown:
+            found = dict(User.objects.filter(email__in=unknown).values_list("email", "pk"))
+            for email in unknown:
+                self.authors[email] = found.get(email)
+
+    def write_batch(self, batch):
+        valid = []
+        for offset, record in batch:
+            if not isinstance(record, dict):
+                self.skip(offset, "not a JSON object")
+            elif not record.get("email") or not record.get("title") or record.get("body") is None:
+                self.skip(offset, "email, title and body are required")
+            else:
+                valid.append((offset, record))
+        self.resolve_authors(record["email"] for _, record in valid)
+
+        notes, tags, created = [], [], []
+        for offset, record in valid:
+            author_id = self.authors[record["email"]]
+            if author_id is None:
+                self.skip(offset, f"no user with email {record['email']}")
+                continue
+            moment = None
+            if record.get("created"):
+                moment = parse_bound(str(record["created"]))
+                if moment is None:
+                    self.skip(offset, f"invalid created {record['created']!r}")
+                    continue
+            names = record.get("tags") or []
+            if not isinstance(names, list):
+                self.skip(offset, "tags must be a list of names")
+                continue
+            public = record.get("public", False)
+            if isinstance(public, str):
+                public = public.strip().lower() in TRUE_VALUES
+            note = Note(author_id=author_id, title=str(record["title"])[:40],
+                        body=str(record["body"]), public=bool(public))
+            notes.append(note)
+            tags.append([str(tag)[:20] for tag in names])
+            created.append(moment)
+
+        with transaction.atomic():
+            Note.objects.bulk_create(notes)
+            # created is auto_now_add, the original timestamps are put back after the insert
+            dated = []
+            for note, moment in zip(notes, created):
+                if moment is not None:
+                    note.created = moment
+                    dated.append(note)
+            if dated:
+                Note.objects.bulk_update(dated, ["created"])
+
+            tag_ids = Tag.objects.resolve(
+                (note.author_id, name) for note, names in zip(notes, tags) for name in names)
+            NoteTag.objects.bulk_create(
+                [NoteTag(note_id=note.pk, tag_id=tag_ids[note.author_id, name])
+                 for note, names in zip(notes, tags) for name in dict.fromkeys(names)],
+                ignore_conflicts=True)
+
+        # only reaches the web workers when the cache is shared (REDIS_URL), with
+        # the per-process LocMemCache their cached pages run out after
+        # NOTE_CACHE_TIMEOUT instead
+        for author_id in {note.author_id for note in notes}:
+            cache.bump_generation(author_id)
+        self.imported += len(notes)
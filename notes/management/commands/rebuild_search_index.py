@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS, transaction
+
+from notes import search
+
+
+class Command(BaseCommand):
+    help = "Create the note full-text search index and fill it from existing notes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database", default=DEFAULT_DB_ALIAS,
+            help="Database to index (default: %(default)s)")
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        if not search.is_supported(connection):
+            raise CommandError(
+                f"Full-text search needs SQLite FTS5, '{connection.vendor}' is not supported")
+
+        with transaction.atomic(using=connection.alias):
+            search.drop_index(connection)
+            search.create_index(connection)
+            search.rebuild_index(connection)
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM notes_note")
+            count = cursor.fetchone()[0]
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} notes"))
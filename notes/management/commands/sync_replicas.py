@@ -0,0 +1,36 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database over the read replicas in "
+        "READ_REPLICAS['ALIASES'], to stand in for replication locally."
+    )
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        aliases = settings.READ_REPLICAS.get("ALIASES", [])
+        if primary.vendor != "sqlite":
+            raise CommandError("Replicas can only be copied from a SQLite primary")
+        if not aliases:
+            raise CommandError(
+                "No replicas are configured, list their files in SIMPLENOTE_SQLITE_REPLICAS")
+
+        source = sqlite3.connect(primary.settings_dict["NAME"])
+        try:
+            for alias in aliases:
+                connections[alias].close()
+                target = sqlite3.connect(connections[alias].settings_dict["NAME"])
+                try:
+                    # the backup API copies a consistent snapshot, even while
+                    # the primary is being written to
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(f"{alias}: copied to {connections[alias].settings_dict['NAME']}")
+        finally:
+            source.close()
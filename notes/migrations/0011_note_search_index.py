@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from notes import search
+
+
+def create_search_index(apps, schema_editor):
+    if search.is_supported(schema_editor.connection):
+        search.create_index(schema_editor.connection)
+        search.rebuild_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    if search.is_supported(schema_editor.connection):
+        search.drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("notes", "0010_remove_note_tags_tag_note"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,116 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+BATCH_SIZE = 2000
+
+
+def copy_tags_forward(apps, schema_editor):
+    """Turn per-note tag rows into one tag per user plus note-tag links"""
+    LegacyTag = apps.get_model("notes", "LegacyTag")
+    Tag = apps.get_model("notes", "Tag")
+    NoteTag = apps.get_model("notes", "NoteTag")
+    db = schema_editor.connection.alias
+
+    names = LegacyTag.objects.using(db).values_list(
+        "note__author_id", "name").distinct().order_by()
+    Tag.objects.using(db).bulk_create(
+        (Tag(owner_id=owner_id, name=name) for owner_id, name in names.iterator()),
+        batch_size=BATCH_SIZE, ignore_conflicts=True)
+    tag_ids = {(owner_id, name): pk for pk, owner_id, name
+               in Tag.objects.using(db).values_list("pk", "owner_id", "name").iterator()}
+
+    links = LegacyTag.objects.using(db).values_list(
+        "note_id", "note__author_id", "name").order_by()
+    NoteTag.objects.using(db).bulk_create(
+        (NoteTag(note_id=note_id, tag_id=tag_ids[owner_id, name])
+         for note_id, owner_id, name in links.iterator()),
+        batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def copy_tags_backward(apps, schema_editor):
+    LegacyTag = apps.get_model("notes", "LegacyTag")
+    NoteTag = apps.get_model("notes", "NoteTag")
+    db = schema_editor.connection.alias
+
+    links = NoteTag.objects.using(db).values_list("note_id", "tag__name").order_by("pk")
+    LegacyTag.objects.using(db).bulk_create(
+        (LegacyTag(note_id=note_id, name=name) for note_id, name in links.iterator()),
+        batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("notes", "0011_note_search_index"),
+    ]
+
+    operations = [
+        # keep the old rows around until they are copied
+        migrations.RenameModel(old_name="Tag", new_name="LegacyTag"),
+        migrations.AlterField(
+            model_name="legacytag",
+            name="note",
+            field=models.ForeignKey(
+                blank=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="legacy_tags",
+                to="notes.note",
+            ),
+        ),
+        migrations.CreateModel(
+            name="Tag",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=20)),
+                ("owner", models.ForeignKey(
+                    db_index=False,
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name="tags",
+                    to=settings.AUTH_USER_MODEL,
+                )),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="tag",
+            constraint=models.UniqueConstraint(
+                fields=("owner", "name"), name="unique_tag_name_per_owner"),
+        ),
+        migrations.CreateModel(
+            name="NoteTag",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("note", models.ForeignKey(
+                    db_index=False,
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name="note_tags",
+                    to="notes.note",
+                )),
+                ("tag", models.ForeignKey(
+                    db_index=False,
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name="note_tags",
+                    to="notes.tag",
+                )),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="notetag",
+            constraint=models.UniqueConstraint(
+                fields=("note", "tag"), name="unique_tag_per_note"),
+        ),
+        migrations.AddIndex(
+            model_name="notetag",
+            index=models.Index(
+                fields=["tag", "note"], name="notes_notetag_tag_note_idx"),
+        ),
+        migrations.AddField(
+            model_name="note",
+            name="tags",
+            field=models.ManyToManyField(
+                blank=True, related_name="notes", through="notes.NoteTag", to="notes.tag"),
+        ),
+        migrations.RunPython(copy_tags_forward, copy_tags_backward),
+        migrations.DeleteModel(name="LegacyTag"),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.1.7 on 2026-10-18 02:09
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from notes import changes
+
+
+def create_change_triggers(apps, schema_editor):
+    if changes.is_supported(schema_editor.connection):
+        changes.create_triggers(schema_editor.connection)
+        # what exists now is the first change of every note and tag
+        changes.record_all(schema_editor.connection)
+
+
+def drop_change_triggers(apps, schema_editor):
+    if changes.is_supported(schema_editor.connection):
+        changes.drop_triggers(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('notes', '0013_note_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('note', 'Note'), ('tag', 'Tag')], max_length=4)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('owner', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['owner', 'id'], name='notes_change_owner_id_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='change',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_change_per_object'),
+        ),
+        migrations.RunPython(create_change_triggers, drop_change_triggers),
+    ]
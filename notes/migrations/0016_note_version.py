@@ -0,0 +1,37 @@
+# Generated by Django 4.1.7 on 2026-10-18 02:24
+
+from django.db import migrations, models
+
+from notes import changes, search
+
+
+# adding the column rebuilds notes_note, which fails while the
+# notes_notetag triggers refer to it; the rows keep their ids, so the
+# search index and the change log stay valid without the triggers
+def drop_triggers(apps, schema_editor):
+    if search.is_supported(schema_editor.connection):
+        search.drop_triggers(schema_editor.connection)
+        changes.drop_triggers(schema_editor.connection)
+
+
+def create_triggers(apps, schema_editor):
+    if search.is_supported(schema_editor.connection):
+        search.create_index(schema_editor.connection)
+        changes.create_triggers(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0015_compress_note_bodies'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_triggers, create_triggers),
+        migrations.AddField(
+            model_name='note',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.1.7 on 2026-10-18 02:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from notes import facets
+
+
+def create_facet_triggers(apps, schema_editor):
+    if facets.is_supported(schema_editor.connection):
+        facets.create_triggers(schema_editor.connection)
+        facets.count_pairs(schema_editor.connection)
+
+
+def drop_facet_triggers(apps, schema_editor):
+    if facets.is_supported(schema_editor.connection):
+        facets.drop_triggers(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0016_note_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagPair',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notes', models.PositiveIntegerField()),
+                ('other', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='notes.tag')),
+                ('tag', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='notes.tag')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='tagpair',
+            constraint=models.UniqueConstraint(fields=('tag', 'other'), name='unique_tag_pair'),
+        ),
+        migrations.RunPython(create_facet_triggers, drop_facet_triggers),
+    ]
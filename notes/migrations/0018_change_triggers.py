@@ -0,0 +1,25 @@
+# Generated by Django 4.1.7 on 2026-10-18 03:10
+
+from django.db import migrations
+
+from notes import changes
+
+
+def replace_change_triggers(apps, schema_editor):
+    # the triggers are created IF NOT EXISTS, so the old ones have to go first
+    if changes.is_supported(schema_editor.connection):
+        changes.drop_triggers(schema_editor.connection)
+        changes.create_triggers(schema_editor.connection)
+        # writes made through INSERT OR IGNORE may have gone unrecorded
+        changes.record_all(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0017_tagpair'),
+    ]
+
+    operations = [
+        migrations.RunPython(replace_change_triggers, migrations.RunPython.noop),
+    ]
@@ -1,33 +1,205 @@
 
 from django.db import models
 from django.contrib.auth import get_user_model
+
+from . import cache
+from .bodies import CompressedTextField
 # Create your models here.
 
 User = get_user_model()
 
 
+class TagQuerySet(models.QuerySet):
+    def resolve(self, pairs) -> dict:
+        """
+            Map (owner_id, name) pairs to tag ids, creating the missing tags.
+
+            Takes two queries and one bulk insert however many pairs there
+            are, which is what bulk writes need.
+        """
+        pairs = list(dict.fromkeys(pairs))
+        if not pairs:
+            return {}
+
+        def lookup(wanted):
+            # one IN list per column instead of an OR per owner, which keeps
+            # the SQL flat however many owners a batch has; the few extra
+            # rows the cross product can match are dropped here
+            owners = {owner_id for owner_id, _ in wanted}
+            names = {name for _, name in wanted}
+            rows = self.filter(owner_id__in=owners, name__in=names).values_list(
+                "pk", "owner_id", "name")
+            return {(owner_id, name): pk for pk, owner_id, name in rows
+                    if (owner_id, name) in wanted}
+
+        tag_ids = lookup(set(pairs))
+        missing = [pair for pair in pairs if pair not in tag_ids]
+        if missing:
+            # a concurrent writer may create the same tag, the unique
+            # constraint settles it and the second lookup sees the winner
+            self.bulk_create(
+                [Tag(owner_id=owner_id, name=name) for owner_id, name in missing],
+                ignore_conflicts=True)
+            tag_ids.update(lookup(set(missing)))
+        return tag_ids
+
+
 class Tag(models.Model):
+    """A tag name, stored once per user and shared by all of their notes"""
     name = models.CharField(max_length=20)
-    note = models.ForeignKey(
-        'Note', on_delete=models.CASCADE, blank=True, related_name="tags")
+    # the unique constraint below indexes owner first, no separate index needed
+    owner = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="tags", db_index=False)
+
+    objects = TagQuerySet.as_manager()
 
     def __str__(self) -> str:
         return self.name
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "name"], name="unique_tag_name_per_owner"),
+        ]
+
+
+class NoteTag(models.Model):
+    """Links a note to one of its author's tags"""
+    # (note, tag) and (tag, note) cover both FKs, so they get no index of their own
+    note = models.ForeignKey(
+        'Note', on_delete=models.CASCADE, related_name="note_tags", db_index=False)
+    tag = models.ForeignKey(
+        Tag, on_delete=models.CASCADE, related_name="note_tags", db_index=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["note", "tag"], name="unique_tag_per_note"),
+        ]
+        indexes = [
+            models.Index(fields=["tag", "note"], name="notes_notetag_tag_note_idx"),
+        ]
+
+
+class NoteQuerySet(models.QuerySet):
+    def with_relations(self):
+        """Load the author and tags that NoteSerializer renders up front"""
+        return self.select_related("author").prefetch_related("tags")
+
 
 class Note(models.Model):
+    # (author, created, id) covers the author FK, so it gets no index of its own
     author = models.ForeignKey(
-        User, on_delete=models.CASCADE, blank=True, related_name="notes")
+        User, on_delete=models.CASCADE, blank=True, related_name="notes", db_index=False)
     title = models.CharField(max_length=40)
-    body = models.TextField()
+    # long bodies are stored zlib-compressed, see notes/bodies.py
+    body = CompressedTextField()
     created = models.DateTimeField(auto_now_add=True)
     public = models.BooleanField(default=False)
+    # goes up with every write, so that edits can be checked against the
+    # version they were made on, see notes/patches.py
+    version = models.PositiveIntegerField(default=1, editable=False)
+    tags = models.ManyToManyField(
+        Tag, through=NoteTag, related_name="notes", blank=True)
+
+    objects = NoteQuerySet.as_manager()
 
     def __str__(self) -> str:
         return self.title
 
+    def save(self, *args, update_fields=None, **kwargs):
+        adding = self._state.adding
+        if not adding:
+            # counted up in SQL, so that writes racing this one each get their
+            # own version instead of all writing the one read before them
+            self.version = models.F("version") + 1
+            if update_fields is not None:
+                update_fields = {*update_fields, "version"}
+        super().save(*args, update_fields=update_fields, **kwargs)
+        if not adding:
+            self.refresh_from_db(fields=["version"])
+
     def tag_not_exists(self, tag_name) -> bool:
-        return tag_name not in [tag.name for tag in self.tags.all()]
+        return not NoteTag.objects.filter(
+            note=self, tag__owner_id=self.author_id, tag__name=tag_name).exists()
+
+    def add_tags(self, names):
+        """Tag the note with names, skipping tags it already has"""
+        tag_ids = Tag.objects.resolve((self.author_id, name) for name in names)
+        NoteTag.objects.bulk_create(
+            [NoteTag(note=self, tag_id=tag_id) for tag_id in tag_ids.values()],
+            ignore_conflicts=True)
+        cache.invalidate_notes([self.pk])
+        cache.bump_generation(self.author_id)
+
+    def remove_tag(self, tag_name) -> bool:
+        """Untag the note, returns False if it did not have the tag"""
+        deleted, _ = NoteTag.objects.filter(
+            note=self, tag__in=Tag.objects.filter(owner_id=self.author_id, name=tag_name)).delete()
+        if deleted:
+            cache.invalidate_notes([self.pk])
+            cache.bump_generation(self.author_id)
+        return deleted > 0
 
     class Meta:
         ordering = ["-created"]
+        indexes = [
+            # a user's notes newest first: lists, tag filter, current_user
+            models.Index(fields=["author", "-created", "-id"], name="notes_note_author_created_idx"),
+            # every note newest first (admin list) and created ranges (export)
+            models.Index(fields=["-created", "-id"], name="notes_note_created_idx"),
+        ]
+
+
+class Change(models.Model):
+    """
+        The latest write to a note or tag, for delta sync.
+
+        Written by the SQLite triggers in notes/changes.py, not by Django.
+        Every write replaces the object's row with a new one, so the id is
+        a sequence number that only grows.
+    """
+    NOTE, TAG = "note", "tag"
+    KIND_CHOICES = [(NOTE, "Note"), (TAG, "Tag")]
+
+    # no constraint: the triggers may record a delete while its owner is
+    # being deleted too, signals.py drops the rows of deleted users
+    owner = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+        related_name="+")
+    kind = models.CharField(max_length=4, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "object_id"], name="unique_change_per_object"),
+        ]
+        indexes = [
+            # a user's changes after a token, in order
+            models.Index(fields=["owner", "id"], name="notes_change_owner_id_idx"),
+        ]
+
+
+class TagPair(models.Model):
+    """
+        How many notes have both tags, for facet counts.
+
+        Written by the SQLite triggers in notes/facets.py, not by Django.
+        Every pair is stored both ways round, and a tag paired with itself
+        counts its notes.
+    """
+    # the unique constraint below indexes tag first, no separate index needed
+    tag = models.ForeignKey(
+        Tag, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+        related_name="+")
+    other = models.ForeignKey(
+        Tag, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+        related_name="+")
+    notes = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["tag", "other"], name="unique_tag_pair"),
+        ]
@@ -0,0 +1,160 @@
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, PageNumberPagination
+
+
+class NoteCursorPagination(CursorPagination):
+    """
+        Keyset pagination over (created, id).
+
+        DRF's CursorPagination only keys on the first ordering field and
+        falls back to an OFFSET for ties. Here the cursor carries both the
+        created timestamp and the id, so every page is a plain range query
+        that costs the same no matter how deep it is.
+    """
+    ordering = ("-created", "-id")
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset for async views"""
+        queryset = self.page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page([instance async for instance in queryset])
+
+    def page_queryset(self, queryset, request, view=None):
+        """The unevaluated query of the requested page, or None without paging"""
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (reverse, current_position) = (False, None)
+        else:
+            (_, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by("created", "id")
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            created, pk = self.parse_position(current_position)
+            # the bound on created on its own lets the index seek to the
+            # position instead of scanning every row before it
+            if reverse:
+                queryset = queryset.filter(
+                    Q(created__gte=created), Q(created__gt=created) | Q(id__gt=pk))
+            else:
+                queryset = queryset.filter(
+                    Q(created__lte=created), Q(created__lt=created) | Q(id__lt=pk))
+
+        self.reverse, self.current_position = reverse, current_position
+        # fetch one extra row to find out if there is a following page
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        """Turn the rows of page_queryset into the page and its links"""
+        reverse, current_position = self.reverse, self.current_position
+        self.page = list(results[:self.page_size])
+        has_following_position = len(results) > len(self.page)
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = current_position is not None
+            self.has_previous = has_following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = current_position is not None
+
+        # positions are unique, so the neighbouring pages always start right
+        # after the first/last row of this one and no offset is needed
+        if self.page:
+            self.next_position = self._get_position_from_instance(
+                self.page[-1], self.ordering)
+            self.previous_position = self._get_position_from_instance(
+                self.page[0], self.ordering)
+        else:
+            self.next_position = self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=True, position=self.previous_position))
+
+    def _get_position_from_instance(self, instance, ordering):
+        if isinstance(instance, dict):
+            return f"{instance['created'].isoformat()}|{instance['id']}"
+        return f"{instance.created.isoformat()}|{instance.id}"
+
+    def parse_position(self, position):
+        try:
+            created, pk = position.rsplit("|", 1)
+            created = parse_datetime(created)
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if created is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created, pk
+
+
+class SearchResultsPagination(PageNumberPagination):
+    """
+        Page numbers for ranked search results.
+
+        Search results are ordered by relevance, which is not a stable key
+        to build a cursor from, and the full-text index ranks every match
+        anyway, so an offset into the ranked matches costs little.
+    """
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset for async views"""
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # count ahead, so the paginator does not run the query itself
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(page_number=page_number, message=str(exc))
+            raise NotFound(msg)
+        self.page.object_list = [instance async for instance in self.page.object_list]
+
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
@@ -0,0 +1,32 @@
+"""
+Parsers for request bodies in the binary formats of notes/renderers.py.
+
+Like the renderers they need the msgpack and cbor2 packages, and the
+settings only offer them when those are installed.
+"""
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from .renderers import CBORRenderer, MessagePackRenderer, cbor2, msgpack
+
+
+class MessagePackParser(BaseParser):
+    media_type = MessagePackRenderer.media_type
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError(f"MessagePack parse error - {exc}")
+
+
+class CBORParser(BaseParser):
+    media_type = CBORRenderer.media_type
+    renderer_class = CBORRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return cbor2.loads(stream.read())
+        except (ValueError, cbor2.CBORDecodeError) as exc:
+            raise ParseError(f"CBOR parse error - {exc}")
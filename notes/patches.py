@@ -0,0 +1,144 @@
+"""
+Note body edits for PATCH requests.
+
+Instead of the whole body, a client sends what it changed, made on the
+version of the note it has:
+
+    {"version": 7, "edits": [{"offset": 120, "delete": 3, "insert": "new"}]}
+
+replaces the 3 characters at offset 120 with "new". Offsets count the
+characters (code points) of the body at that version, and the edits come
+in order and do not overlap. A unified diff, as made by `diff -u` or
+difflib, does the same with lines:
+
+    {"version": 7, "diff": "@@ -3,1 +3,1 @@\n-old line\n+new line\n"}
+
+The note is written only if it is still at that version, otherwise the
+request fails with 409 and the current version. Reading the request and
+checking it takes time in proportion to the edit, not the note.
+"""
+import re
+
+from django.db import transaction
+from django.db.models import F
+from rest_framework.validators import ValidationError
+
+from . import cache
+from .models import Note
+
+HUNK_RE = re.compile(r"@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+NO_NEWLINE = "\\ No newline at end of file"
+
+
+class VersionConflict(Exception):
+    def __init__(self, version):
+        super().__init__(f"The note has changed, it is at version {version}.")
+        self.version = version
+
+
+def apply_edits(text: str, edits) -> str:
+    parts, position = [], 0
+    for number, edit in enumerate(edits):
+        offset = edit["offset"]
+        end = offset + edit["delete"]
+        if offset < position:
+            raise ValidationError(
+                {"edits": [f"Edit {number} overlaps the one before it, edits go in order of offset."]})
+        if end > len(text):
+            raise ValidationError({"edits": [f"Edit {number} goes past the end of the body."]})
+        parts += [text[position:offset], edit["insert"]]
+        position = end
+    parts.append(text[position:])
+    return "".join(parts)
+
+
+def split_lines(text: str) -> list:
+    # only "\n" ends a line, unlike str.splitlines()
+    lines = [line + "\n" for line in text.split("\n")]
+    lines[-1] = lines[-1][:-1]
+    return lines if lines[-1] else lines[:-1]
+
+
+def parse_diff(diff: str) -> list:
+    """[(old start, [(" " | "-" | "+", line), ...]), ...] of a unified diff"""
+    hunks = []
+    for line in split_lines(diff):
+        match = HUNK_RE.match(line)
+        if match:
+            old_start, old_count, _, new_count = match.groups()
+            old_count = 1 if old_count is None else int(old_count)
+            new_count = 1 if new_count is None else int(new_count)
+            # an empty old range starts after its line, not at it
+            start = int(old_start) - (1 if old_count else 0)
+            hunks.append((start, old_count, new_count, []))
+        elif not hunks:
+            # "---" and "+++" headers, or anything else before the first hunk
+            continue
+        elif line.rstrip("\n") == NO_NEWLINE:
+            lines = hunks[-1][3]
+            if lines:
+                kind, text = lines[-1]
+                lines[-1] = (kind, text[:-1] if text.endswith("\n") else text)
+        elif line[:1] in (" ", "-", "+"):
+            hunks[-1][3].append((line[0], line[1:]))
+        else:
+            raise ValidationError({"diff": [f"Unexpected line in a hunk: {line[:40]!r}."]})
+
+    if not hunks:
+        raise ValidationError({"diff": ["The diff has no hunks."]})
+    for start, old_count, new_count, lines in hunks:
+        if (sum(kind != "+" for kind, _ in lines) != old_count
+                or sum(kind != "-" for kind, _ in lines) != new_count):
+            raise ValidationError(
+                {"diff": [f"The hunk at line {start + 1} does not match its line counts."]})
+    return [(start, lines) for start, _, _, lines in hunks]
+
+
+def apply_diff(text: str, diff: str) -> str:
+    old = split_lines(text)
+    new, position = [], 0
+    for start, lines in parse_diff(diff):
+        if start < position or start > len(old):
+            raise ValidationError({"diff": [f"The hunk at line {start + 1} is out of order or past the end."]})
+        new += old[position:start]
+        position = start
+        for kind, line in lines:
+            if kind == "+":
+                new.append(line)
+                continue
+            if position >= len(old) or old[position] != line:
+                raise ValidationError(
+                    {"diff": [f"Line {position + 1} of the body does not match the diff."]})
+            if kind == " ":
+                new.append(line)
+            position += 1
+    new += old[position:]
+    return "".join(new)
+
+
+def patch_note(note, data):
+    """
+        Apply validated NotePatchSerializer data to note.
+
+        Raises VersionConflict if the note is no longer at the version the
+        edit was made on. Returns the updated note, without its body.
+    """
+    if "version" in data and data["version"] != note.version:
+        raise VersionConflict(note.version)
+    fields = {name: data[name] for name in ("title", "body", "public") if name in data}
+    if "edits" in data:
+        fields["body"] = apply_edits(note.body, data["edits"])
+    elif "diff" in data:
+        fields["body"] = apply_diff(note.body, data["diff"])
+
+    with transaction.atomic():
+        notes = Note.objects.filter(pk=note.pk)
+        if "version" in data:
+            # another write may have come in since the note was read
+            notes = notes.filter(version=data["version"])
+        if not notes.update(**fields, version=F("version") + 1):
+            raise VersionConflict(Note.objects.values_list("version", flat=True).get(pk=note.pk))
+        # update() skips the save signals that drop cached notes
+        cache.invalidate_notes([note.pk])
+        cache.bump_generation(note.author_id)
+    return Note.objects.with_relations().defer("body").get(pk=note.pk)
@@ -0,0 +1,88 @@
+"""
+Renderers for the API.
+
+FastJSONRenderer renders with orjson when it is installed, and falls back
+to DRF's JSONRenderer without it. It is the default JSON renderer, see
+REST_FRAMEWORK in the settings.
+
+MessagePackRenderer and CBORRenderer send the same data in binary formats
+that are smaller and quicker to parse, for clients that ask for them in
+their Accept header. They need the msgpack and cbor2 packages, and the
+settings only offer them when those are installed. notes/parsers.py reads
+request bodies in the same formats.
+"""
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+        JSONRenderer with the same output, from orjson.
+
+        orjson escapes strings like json.dumps(ensure_ascii=False), and
+        datetimes, decimals and other types it does not know are passed to
+        DRF's encoder, so only the default compact, unicode output needs
+        to be produced here. Floats are the exception: orjson writes
+        1e-05 as 1e-5 and NaN as null, which the API does not send.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {})):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS)
+        except orjson.JSONEncodeError:
+            # e.g. keys that are not strings
+            return super().render(data, accepted_media_type, renderer_context)
+        # JSONRenderer escapes the two line terminators JavaScript does not allow in strings
+        return content.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+
+def plain(obj):
+    """
+        Values the binary formats cannot encode, as JSONRenderer writes them:
+        decimals, lazy translations, UUIDs and the like.
+    """
+    return JSONEncoder().default(obj)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=plain, datetime=False)
+
+
+class CBORRenderer(BaseRenderer):
+    media_type = "application/cbor"
+    format = "cbor"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return cbor2.dumps(data, default=lambda encoder, obj: encoder.encode(plain(obj)))
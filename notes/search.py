@@ -0,0 +1,172 @@
+"""
+Full-text search over note titles and bodies.
+
+On SQLite the notes are indexed in an FTS5 virtual table that uses
+notes_note as its external content table, so the text is not stored twice.
+Triggers on notes_note keep the index in sync for every write, including
+bulk inserts and queryset updates that bypass model signals.
+
+Bodies stored compressed (see notes/bodies.py) are indexed as their text,
+which the triggers read with the note_body() SQL function.
+
+The author id is indexed as a token too. Every search is scoped to one
+author, and matching that token inside FTS5 means only the author's notes
+get ranked, instead of ranking the matches of every user and throwing most
+of them away in a join.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Note
+
+FTS_TABLE = "notes_note_fts"
+
+# title matches weigh more than body matches, the author token is not text
+TITLE_WEIGHT = 5.0
+BODY_WEIGHT = 1.0
+AUTHOR_WEIGHT = 0.0
+
+CREATE_TABLE_SQL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    title, body, author_id,
+    content='notes_note', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+)
+"""
+
+TRIGGERS = {
+    f"{FTS_TABLE}_ai": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON notes_note BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, title, body, author_id)
+            VALUES (new.id, new.title, note_body(new.body), new.author_id);
+        END
+    """,
+    f"{FTS_TABLE}_ad": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON notes_note BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body, author_id)
+            VALUES ('delete', old.id, old.title, note_body(old.body), old.author_id);
+        END
+    """,
+    f"{FTS_TABLE}_au": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, body, author_id ON notes_note BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body, author_id)
+            VALUES ('delete', old.id, old.title, note_body(old.body), old.author_id);
+            INSERT INTO {FTS_TABLE}(rowid, title, body, author_id)
+            VALUES (new.id, new.title, note_body(new.body), new.author_id);
+        END
+    """,
+}
+
+TERM_RE = re.compile(r"\w+\*?")
+
+
+def is_supported(conn=connection) -> bool:
+    return conn.vendor == "sqlite"
+
+
+def missing_triggers(conn=connection) -> set:
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'notes_note'")
+        existing = {row[0] for row in cursor.fetchall()}
+    return set(TRIGGERS) - existing
+
+
+def create_index(conn=connection):
+    with conn.cursor() as cursor:
+        cursor.execute(CREATE_TABLE_SQL)
+        for sql in TRIGGERS.values():
+            cursor.execute(sql)
+
+
+def drop_triggers(conn=connection):
+    with conn.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def drop_index(conn=connection):
+    drop_triggers(conn)
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def rebuild_index(conn=connection):
+    """Re-read every note from notes_note into the index"""
+    # not FTS5's 'rebuild', which would index compressed bodies as they are stored
+    with conn.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, title, body, author_id) "
+            f"SELECT id, title, note_body(body), author_id FROM notes_note")
+
+
+def ensure_index(conn=connection) -> bool:
+    """
+        Repair the index if its triggers are gone.
+
+        Django rebuilds notes_note on SQLite for most schema changes, and
+        dropping the old table drops its triggers with it. Rows written
+        while the triggers were missing are not in the index, so it is
+        rebuilt from scratch. Returns True if the index was rebuilt.
+    """
+    if not is_supported(conn):
+        return False
+    # the index is created by migration 0011, and dropped when it is reversed
+    if FTS_TABLE not in conn.introspection.table_names():
+        return False
+    if not missing_triggers(conn):
+        return False
+    create_index(conn)
+    rebuild_index(conn)
+    return True
+
+
+def build_match_query(keyword: str) -> str:
+    """
+        Turn user input into an FTS5 MATCH expression.
+
+        Every word becomes a quoted term, so FTS5 operators typed by the
+        user are matched literally. All terms must match, and a trailing
+        "*" makes a term a prefix query: "proj* plan" matches notes that
+        contain "plan" and any word starting with "proj".
+    """
+    terms = []
+    for term in TERM_RE.findall(keyword or ""):
+        if term.endswith("*"):
+            terms.append(f'"{term[:-1]}"*')
+        else:
+            terms.append(f'"{term}"')
+    return " ".join(terms)
+
+
+def search_notes(author, keyword: str):
+    """Notes of author that match keyword, best match first"""
+    if not is_supported():
+        notes = Note.objects.filter(author=author)
+        words = [term.rstrip("*") for term in TERM_RE.findall(keyword or "")]
+        for word in words:
+            notes = notes.filter(Q(title__icontains=word) | Q(body__icontains=word))
+        return notes if words else notes.none()
+
+    match = build_match_query(keyword)
+    if not match:
+        return Note.objects.none()
+    # The author is matched inside FTS5 so that the index drives the query,
+    # for the page and for the count. The unary plus on the row check keeps
+    # SQLite from starting at the author_id index and running the MATCH once
+    # per note instead.
+    return Note.objects.extra(
+        tables=[FTS_TABLE],
+        where=[
+            f"{FTS_TABLE} MATCH %s",
+            f"{FTS_TABLE}.rowid = notes_note.id",
+            "+notes_note.author_id = %s",
+        ],
+        params=[f'author_id : "{author.pk}" AND ({match})', author.pk],
+        select={
+            "rank": f"bm25({FTS_TABLE}, {TITLE_WEIGHT}, {BODY_WEIGHT}, {AUTHOR_WEIGHT})"},
+    ).order_by("rank", "-id")
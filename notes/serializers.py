@@ -6,14 +6,24 @@ from rest_framework.validators import ValidationError
 class TagSerializer(serializers.ModelSerializer):
     # replace related string field with id
     name = serializers.CharField(max_length=20)
-    # note = serializers.StringRelatedField(many=False)
+    owner = serializers.StringRelatedField(many=False)
 
     class Meta:
         model = Tag
         fields = '__all__'
 
 
-class NoteSerializer(serializers.ModelSerializer):
+class SparseFieldsSerializer(serializers.ModelSerializer):
+    """Takes a fields argument that leaves out every other field"""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class NoteSerializer(SparseFieldsSerializer):
     title = serializers.CharField(max_length=50)
     # replace id in foreignKey-field with related name
     author = serializers.StringRelatedField(many=False)
@@ -23,3 +33,67 @@ class NoteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Note
         fields = '__all__'
+
+
+class NoteSummarySerializer(NoteSerializer):
+    """A note for index screens: the start of its body instead of all of it"""
+    # annotated by the query, see notes/sparse.py
+    preview = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = Note
+        fields = ['id', 'title', 'author', 'tags', 'preview', 'created', 'public']
+
+
+class NoteEditSerializer(serializers.Serializer):
+    """Replace delete characters of the body at offset with insert"""
+    offset = serializers.IntegerField(min_value=0)
+    delete = serializers.IntegerField(min_value=0, default=0)
+    insert = serializers.CharField(default="", allow_blank=True, trim_whitespace=False)
+
+
+class NotePatchSerializer(serializers.Serializer):
+    """A partial update, with the body as a whole or as edits, see notes/patches.py"""
+    version = serializers.IntegerField(min_value=1, required=False)
+    title = serializers.CharField(max_length=50, required=False)
+    public = serializers.BooleanField(required=False)
+    body = serializers.CharField(required=False)
+    edits = NoteEditSerializer(many=True, required=False, allow_empty=False, max_length=1000)
+    diff = serializers.CharField(required=False, trim_whitespace=False)
+
+    def validate(self, attrs):
+        given = [field for field in ("body", "edits", "diff") if field in attrs]
+        if len(given) > 1:
+            raise ValidationError({given[1]: [f"Send only one of {', '.join(given)}."]})
+        if given and given[0] != "body" and "version" not in attrs:
+            raise ValidationError({"version": [f"The version is required with {given[0]}."]})
+        if not attrs.keys() - {"version"}:
+            raise ValidationError("Nothing to change.")
+        return super().validate(attrs)
+
+
+class BulkNoteOperationSerializer(serializers.Serializer):
+    """One create, update or delete in a bulk request"""
+    op = serializers.ChoiceField(choices=["create", "update", "delete"])
+    id = serializers.IntegerField(required=False)
+    title = serializers.CharField(max_length=50, required=False)
+    body = serializers.CharField(required=False)
+    public = serializers.BooleanField(required=False)
+    tags = serializers.ListField(
+        child=serializers.CharField(max_length=20), required=False)
+
+    def validate(self, attrs):
+        op = attrs["op"]
+        if op == "create":
+            missing = [field for field in ("title", "body") if field not in attrs]
+        else:
+            missing = [] if "id" in attrs else ["id"]
+        if missing:
+            raise ValidationError(
+                {field: [f"This field is required to {op} a note."] for field in missing})
+        return super().validate(attrs)
+
+
+class BulkNoteSerializer(serializers.Serializer):
+    operations = serializers.ListField(
+        child=serializers.DictField(), allow_empty=False, max_length=1000)
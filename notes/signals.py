@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache
+from .models import Change, Note
+
+
+@receiver(post_save, sender=Note)
+@receiver(post_delete, sender=Note)
+def invalidate_note(sender, instance, **kwargs):
+    cache.invalidate_notes([instance.pk])
+    cache.bump_generation(instance.author_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_author_notes(sender, instance, created, update_fields=None, **kwargs):
+    # notes render their author's username
+    if created or (update_fields is not None and "username" not in update_fields):
+        return
+    cache.invalidate_notes(
+        instance.notes.filter(public=True).values_list("pk", flat=True))
+    cache.bump_generation(instance.pk)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def delete_changes(sender, instance, **kwargs):
+    # after the user's notes and tags, whose deletes were recorded as well
+    Change.objects.filter(owner_id=instance.pk).delete()
@@ -0,0 +1,98 @@
+"""
+Sparse fieldsets for the note list endpoints.
+
+?fields=title,tags,created limits every note in a page to those fields,
+plus the id. ?view=summary renders notes without their body and with a
+preview of its first PREVIEW_LENGTH characters instead, and takes
+?fields= as well.
+
+The query follows the fields: the body column is only loaded when the
+body is rendered, and the author and tags are only joined and prefetched
+when they are asked for.
+"""
+from django.db.models.functions import Substr
+from rest_framework.exceptions import ValidationError
+
+from .bodies import BodyText
+from .serializers import NoteSerializer, NoteSummarySerializer
+
+FIELDS_PARAM = "fields"
+VIEW_PARAM = "view"
+PREVIEW_LENGTH = 100
+
+VIEWS = {
+    "full": NoteSerializer,
+    "summary": NoteSummarySerializer,
+}
+
+
+class Representation:
+    """The serializer and fields a list request asks for"""
+    __slots__ = ("serializer_class", "fields")
+
+    def __init__(self, serializer_class, fields):
+        self.serializer_class = serializer_class
+        self.fields = fields
+
+    def queryset(self, queryset):
+        """Load what the fields need, and nothing else"""
+        if "author" not in self.fields:
+            queryset = queryset.select_related(None)
+        if "tags" not in self.fields:
+            queryset = queryset.prefetch_related(None)
+        if "preview" in self.fields:
+            queryset = queryset.annotate(preview=Substr(BodyText("body"), 1, PREVIEW_LENGTH))
+        if "body" not in self.fields:
+            queryset = queryset.defer("body")
+        return queryset
+
+    def serializer(self, *args, **kwargs):
+        return self.serializer_class(*args, fields=self.fields, **kwargs)
+
+
+def representation(query_params) -> Representation:
+    """Parse ?view= and ?fields=, raising ValidationError for unknown ones"""
+    view = query_params.get(VIEW_PARAM) or "full"
+    if view not in VIEWS:
+        raise ValidationError({VIEW_PARAM: f"Choose one of {', '.join(VIEWS)}."})
+    serializer_class = VIEWS[view]
+
+    available = serializer_class().fields
+    value = query_params.get(FIELDS_PARAM)
+    if not value:
+        return Representation(serializer_class, set(available))
+    fields = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = sorted(fields - set(available))
+    if unknown:
+        raise ValidationError(
+            {FIELDS_PARAM: f"Unknown fields: {', '.join(unknown)}. Choose from {', '.join(available)}."})
+    # clients link to notes by id, so it is always there
+    return Representation(serializer_class, fields | {"id"})
+
+
+class SparseFieldsMixin:
+    """
+        Apply ?fields= and ?view= to the reads of a list view.
+
+        Writes keep rendering the full note.
+    """
+
+    def get_representation(self):
+        if not hasattr(self, "_representation"):
+            self._representation = representation(self.request.query_params)
+        return self._representation
+
+    def is_read(self):
+        return self.request.method in ("GET", "HEAD")
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.is_read():
+            queryset = self.get_representation().queryset(queryset)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if not self.is_read():
+            return super().get_serializer(*args, **kwargs)
+        kwargs.setdefault("context", self.get_serializer_context())
+        return self.get_representation().serializer(*args, **kwargs)
@@ -1,3 +1,1302 @@
-from django.test import TestCase
+import datetime
+import decimal
+import difflib
+import gzip
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import zlib
+from unittest import mock
+from urllib.parse import parse_qs, urlencode, urlsplit
 
-# Create your tests here.
+import brotli
+import cbor2
+import msgpack
+import zstandard
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import (
+    AsyncRequestFactory, Client, RequestFactory, TestCase, TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from accounts.tokens import create_jwt_pair_for_user
+from simplenote.middleware import ReplicaRoutingMiddleware
+from simplenote.routers import ReplicaRouter
+from simplenote.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from . import async_views
+from . import cache as note_cache
+from . import bodies, changes, export, facets, fast, search, sparse
+from .apps import ensure_triggers
+from .models import Change, Note, Tag, TagPair
+from .renderers import FastJSONRenderer
+from .serializers import NoteSerializer
+
+
+def create_user(username, **extra):
+    return User.objects.create_user(
+        email=f"{username}@example.com", password=f"{username}-password", username=username,
+        **extra)
+
+
+def create_note(author, title, body="body", tags=(), **fields):
+    note = Note.objects.create(author=author, title=title, body=body, **fields)
+    if tags:
+        note.add_tags(tags)
+    return note
+
+
+class NoteTestCase(TestCase):
+    """
+        Signed in as self.user through self.client, with an empty cache.
+        username names the user and is_staff makes them an admin.
+    """
+    username = "user"
+    is_staff = False
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user(self.username, is_staff=self.is_staff)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class PaginationTests(NoteTestCase):
+    username = "pages"
+
+    def setUp(self):
+        super().setUp()
+        for i in range(7):
+            create_note(self.user, f"note {i}")
+        # five notes written in the same instant, which pages must split by id
+        Note.objects.filter(title__in=[f"note {i}" for i in range(1, 6)]).update(
+            created=datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc))
+        self.expected = list(Note.objects.order_by("-created", "-id").values_list("id", flat=True))
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append([note["id"] for note in data["results"]])
+            url = data[link]
+        return pages
+
+    def test_ties_across_pages(self):
+        for page_size in (1, 2, 3, 5):
+            with self.subTest(page_size=page_size):
+                pages = self.walk(f"{reverse('list_notes')}?page_size={page_size}", "next")
+                self.assertEqual(sum(pages, []), self.expected)
+                self.assertTrue(all(len(page) == page_size for page in pages[:-1]))
+
+    def test_previous_links(self):
+        url = f"{reverse('list_notes')}?page_size=2"
+        forward = self.walk(url, "next")
+        data = self.client.get(url).json()
+        while data["next"]:
+            data = self.client.get(data["next"]).json()
+        self.assertIsNotNone(data["previous"])
+        backward = self.walk(data["previous"], "previous")
+        self.assertEqual(backward, forward[-2::-1])
+        self.assertIsNone(self.client.get(url).json()["previous"])
+
+    def test_page_size(self):
+        Note.objects.bulk_create(Note(author=self.user, title="bulk", body="b") for _ in range(120))
+        self.assertEqual(len(self.client.get(reverse("list_notes")).json()["results"]), 20)
+        response = self.client.get(reverse("list_notes"), {"page_size": 1000})
+        self.assertEqual(len(response.json()["results"]), 100)
+
+
+class SearchTests(NoteTestCase):
+    username = "search"
+
+    def setUp(self):
+        super().setUp()
+        create_note(self.user, "Project planning", "review the budget")
+        create_note(self.user, "Budget", "quarterly numbers")
+        create_note(self.user, "Projector manual", "replace the lamp")
+        create_note(create_user("other"), "Budget secret", "project budget review")
+
+    def search(self, keyword):
+        response = self.client.get(reverse("search_keyword", kwargs={"keyword": keyword}))
+        self.assertEqual(response.status_code, 200, response.content)
+        return [note["title"] for note in response.json()["results"]]
+
+    def test_queries(self):
+        cases = [
+            # title matches rank above body matches
+            ("budget", ["Budget", "Project planning"]),
+            ("proj*", ["Projector manual", "Project planning"]),
+            ("proj", []),
+            ("budget review", ["Project planning"]),
+            ("proj* lamp", ["Projector manual"]),
+            ("secret", []),
+            ('"budget" OR lamp', []),
+        ]
+        for keyword, titles in cases:
+            with self.subTest(keyword=keyword):
+                self.assertEqual(self.search(keyword), titles)
+
+    def test_index_follows_writes(self):
+        note = Note.objects.get(title="Budget")
+        note.title = "Forecast"
+        note.save()
+        self.assertEqual(self.search("budget"), ["Project planning"])
+        self.assertEqual(self.search("forecast"), ["Forecast"])
+        note.delete()
+        self.assertEqual(self.search("forecast"), [])
+
+    def test_ensure_index(self):
+        search.drop_triggers()
+        # migrated back to before the index: nothing to repair
+        with mock.patch.object(connection.introspection, "table_names", return_value=["notes_note"]):
+            self.assertFalse(search.ensure_index())
+        self.assertEqual(search.missing_triggers(), set(search.TRIGGERS))
+        create_note(self.user, "Written meanwhile", "budget")
+        self.assertTrue(search.ensure_index())
+        self.assertFalse(search.ensure_index())
+        self.assertEqual(self.search("meanwhile"), ["Written meanwhile"])
+
+
+class QueryBudgetTests(NoteTestCase):
+    """
+        Every notes endpoint must run a fixed number of queries, no matter
+        how many notes and tags are on the page.
+
+        Each endpoint is requested once with a few notes and once with many,
+        and both runs have to stay within the endpoint's budget and run the
+        same number of queries.
+    """
+    SMALL, LARGE = 2, 20
+
+    # endpoint name -> (url kwargs, query budget)
+    BUDGETS = {
+        "list_notes": ({}, 2),
+        "note_detail": ({"pk": None}, 2),
+        "current_user": ({}, 1),
+        "all_notes": ({}, 2),
+        "filter_tag": ({"tag": "shared"}, 2),
+        "search_keyword": ({"keyword": "shared"}, 3),
+    }
+
+    username, is_staff = "budget", True
+
+    def seed(self, count):
+        notes = [create_note(self.user, f"note {i}", "shared body text", public=True)
+                 for i in range(count)]
+        for note in notes:
+            note.add_tags(["shared", f"tag {note.pk}"])
+        return notes[0]
+
+    def count_queries(self, name, kwargs, note):
+        kwargs = {key: note.pk if value is None else value for key, value in kwargs.items()}
+        # measure the uncached path
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name, kwargs=kwargs))
+        self.assertEqual(response.status_code, 200, f"{name}: {response.content!r}")
+        return len(queries)
+
+    def test_query_budgets(self):
+        note = self.seed(self.SMALL)
+        small = {name: self.count_queries(name, kwargs, note)
+                 for name, (kwargs, _) in self.BUDGETS.items()}
+        self.seed(self.LARGE - self.SMALL)
+        for name, (kwargs, budget) in self.BUDGETS.items():
+            with self.subTest(endpoint=name):
+                large = self.count_queries(name, kwargs, note)
+                self.assertLessEqual(large, budget)
+                self.assertEqual(small[name], large)
+
+
+class BulkNotesTests(NoteTestCase):
+    username = "bulk"
+
+    def setUp(self):
+        super().setUp()
+        self.kept = create_note(self.user, "kept", "k", ["old", "stay"])
+        self.doomed = create_note(self.user, "doomed", "d")
+        self.theirs = create_note(create_user("other"), "theirs", "t")
+
+    def bulk(self, operations):
+        response = self.client.post(reverse("bulk_notes"), {"operations": operations}, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["results"]
+
+    def test_mixed_batch(self):
+        results = self.bulk([
+            {"op": "create", "title": "new", "body": "n", "tags": ["a", "a", "b"]},
+            {"op": "update", "id": self.kept.pk, "title": "edited", "tags": ["stay", "new"]},
+            {"op": "delete", "id": self.doomed.pk},
+            {"op": "create", "title": "no body"},
+        ])
+        self.assertEqual([result["status"] for result in results], [201, 200, 204, 400])
+        self.assertEqual([result["index"] for result in results], [0, 1, 2, 3])
+        self.assertEqual(results[0]["note"]["tags"], ["a", "b"])
+        self.assertEqual((results[1]["note"]["title"], results[1]["note"]["tags"]),
+                         ("edited", ["stay", "new"]))
+        self.assertIn("body", results[3]["errors"])
+        self.assertEqual(sorted(Note.objects.filter(author=self.user).values_list("title", flat=True)),
+                         ["edited", "new"])
+        self.kept.refresh_from_db()
+        self.assertEqual(sorted(self.kept.tags.values_list("name", flat=True)), ["new", "stay"])
+
+    def test_duplicate_and_foreign_ids(self):
+        results = self.bulk([
+            {"op": "update", "id": self.kept.pk, "title": "first"},
+            {"op": "delete", "id": self.kept.pk},
+            {"op": "update", "id": self.theirs.pk, "title": "stolen"},
+            {"op": "delete", "id": 0},
+        ])
+        self.assertEqual([result["status"] for result in results], [200, 400, 404, 404])
+        self.assertIn("id", results[1]["errors"])
+        self.kept.refresh_from_db()
+        self.assertEqual(self.kept.title, "first")
+        self.theirs.refresh_from_db()
+        self.assertEqual(self.theirs.title, "theirs")
+
+    def test_updates_write_only_the_fields_sent(self):
+        with CaptureQueriesContext(connection) as queries:
+            results = self.bulk([
+                {"op": "update", "id": self.kept.pk, "public": True},
+                {"op": "update", "id": self.doomed.pk, "title": "renamed"},
+            ])
+        self.assertEqual([result["status"] for result in results], [200, 200])
+        updates = [query["sql"] for query in queries if query["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 2)
+        self.assertFalse(any('"body"' in sql for sql in updates))
+        self.kept.refresh_from_db()
+        self.assertEqual((self.kept.public, self.kept.title, self.kept.version), (True, "kept", 2))
+
+
+class TagNormalizationMigrationTests(TransactionTestCase):
+    """0012_normalize_tags turns per-note tag rows into shared tags and links"""
+    before = [("notes", "0011_note_search_index")]
+    after = [("notes", "0012_normalize_tags")]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.migrate(self.executor, self.before)
+        self.executor.loader.build_graph()
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        self.migrate(executor, executor.loader.graph.leaf_nodes("notes"))
+
+    def migrate(self, executor, targets):
+        executor.migrate(targets)
+        # what the migrate command does afterwards
+        ensure_triggers(sender=None, using=connection.alias)
+
+    def test_tags_are_shared_per_user(self):
+        apps = self.executor.loader.project_state(self.before).apps
+        OldUser = apps.get_model("accounts", "User")
+        OldNote = apps.get_model("notes", "Note")
+        OldTag = apps.get_model("notes", "Tag")
+        ann = OldUser.objects.create(email="ann@example.com", username="ann")
+        bob = OldUser.objects.create(email="bob@example.com", username="bob")
+        first = OldNote.objects.create(author=ann, title="first", body="b")
+        second = OldNote.objects.create(author=ann, title="second", body="b")
+        theirs = OldNote.objects.create(author=bob, title="theirs", body="b")
+        for note, name in ((first, "work"), (first, "home"), (second, "work"), (theirs, "work")):
+            OldTag.objects.create(note=note, name=name)
+
+        self.migrate(self.executor, self.after)
+        apps = self.executor.loader.project_state(self.after).apps
+        Tag = apps.get_model("notes", "Tag")
+        NoteTag = apps.get_model("notes", "NoteTag")
+        self.assertEqual(sorted(Tag.objects.values_list("owner__username", "name")),
+                         [("ann", "home"), ("ann", "work"), ("bob", "work")])
+        self.assertEqual(
+            sorted(NoteTag.objects.values_list("note__title", "tag__owner__username", "tag__name")),
+            [("first", "ann", "home"), ("first", "ann", "work"),
+             ("second", "ann", "work"), ("theirs", "bob", "work")])
+
+
+class TagOwnershipTests(NoteTestCase):
+    username = "owner"
+
+    def setUp(self):
+        super().setUp()
+        self.other = create_user("other")
+        self.note = create_note(self.user, "mine", tags=["work"])
+        self.theirs = create_note(self.other, "theirs", tags=["work"])
+
+    def test_tags_are_per_user(self):
+        self.assertNotEqual(self.note.tags.get().pk, self.theirs.tags.get().pk)
+        self.assertTrue(self.note.remove_tag("work"))
+        self.assertFalse(self.note.remove_tag("work"))
+        self.assertEqual(list(self.theirs.tags.values_list("name", flat=True)), ["work"])
+
+    def test_only_the_author_removes_tags(self):
+        client = APIClient()
+        client.force_authenticate(self.other)
+        response = client.delete(reverse("remove_tag", kwargs={"pk": self.note.pk}),
+                                 {"tag": "work"}, format="json")
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(list(self.note.tags.values_list("name", flat=True)), ["work"])
+
+
+class PublicNoteCacheTests(NoteTestCase):
+    username = "public"
+
+    def setUp(self):
+        super().setUp()
+        self.note = create_note(self.user, "public", "cached body", ["kept"], public=True)
+        self.anonymous = APIClient()
+
+    def get(self, note=None, **headers):
+        note = note or self.note
+        return self.anonymous.get(reverse("note_detail", kwargs={"pk": note.pk}),
+                                  HTTP_ACCEPT="application/json", **headers)
+
+    def test_hit_and_etag(self):
+        first, second = self.get(), self.get()
+        self.assertEqual((first["X-Cache"], second["X-Cache"]), ("MISS", "HIT"))
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(first["ETag"], second["ETag"])
+        response = self.get(HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual((response.status_code, response.content), (304, b""))
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_writes_invalidate(self):
+        def url(name, note):
+            return reverse(name, kwargs={"pk": note.pk})
+
+        writes = {
+            "put": lambda note: self.client.put(
+                url("note_detail", note), {"title": "put", "body": "cached body", "public": True},
+                format="json"),
+            "patch": lambda note: self.client.patch(
+                url("note_detail", note), {"title": "patched"}, format="json"),
+            "add tag": lambda note: self.client.post(
+                url("add_tag", note), {"tag": "added"}, format="json"),
+            "remove tag": lambda note: self.client.delete(
+                url("remove_tag", note), {"tag": "kept"}, format="json"),
+        }
+        for name, write in writes.items():
+            with self.subTest(write=name):
+                note = create_note(self.user, "public", "cached body", ["kept"], public=True)
+                before = self.get(note)
+                self.assertEqual(self.get(note)["X-Cache"], "HIT")
+                self.assertLess(write(note).status_code, 300)
+                after = self.get(note)
+                self.assertEqual(after["X-Cache"], "MISS")
+                self.assertNotEqual(after.json(), before.json())
+                self.assertNotEqual(after["ETag"], before["ETag"])
+
+    def test_stats_count_public_notes_only(self):
+        private = create_note(self.user, "private")
+        self.get(), self.get()
+        self.assertEqual(self.get(private).status_code, 401)
+        detail = reverse("note_detail", kwargs={"pk": private.pk})
+        self.assertEqual(self.client.get(detail).status_code, 200)
+        self.assertEqual(self.client.get(reverse("note_detail", kwargs={"pk": 0})).status_code, 404)
+        self.assertEqual(note_cache.stats(), {"hits": 1, "misses": 1, "hit_rate": 0.5})
+
+    def test_hidden_notes_are_not_served(self):
+        self.get()
+        self.assertEqual(self.get()["X-Cache"], "HIT")
+        self.client.patch(reverse("note_detail", kwargs={"pk": self.note.pk}),
+                          {"public": False}, format="json")
+        self.assertEqual(self.get().status_code, 401)
+
+        note = create_note(self.user, "doomed", public=True)
+        self.get(note)
+        self.client.delete(reverse("note_detail", kwargs={"pk": note.pk}))
+        self.assertEqual(self.get(note).status_code, 404)
+
+
+class ListCacheTests(NoteTestCase):
+    username, is_staff = "lists", True
+
+    def setUp(self):
+        super().setUp()
+        self.note = create_note(self.user, "first", tags=["shared"])
+        self.other = create_user("other")
+        self.other_note = create_note(self.other, "theirs", tags=["shared"])
+
+    def titles(self, name="list_notes", **kwargs):
+        response = self.client.get(reverse(name, kwargs=kwargs))
+        return response["X-Cache"], [note["title"] for note in response.json()["results"]]
+
+    def test_writes_bump_the_generation(self):
+        def url(name):
+            return reverse(name, kwargs={"pk": self.note.pk})
+
+        # write -> titles of the list and of the "shared" tag after it
+        writes = [
+            ("create", lambda: self.client.post(
+                reverse("list_notes"), {"title": "second", "body": "b"}, format="json"),
+             ["second", "first"], ["first"]),
+            ("update", lambda: self.client.put(
+                url("note_detail"), {"title": "renamed", "body": "b"}, format="json"),
+             ["second", "renamed"], ["renamed"]),
+            ("untag", lambda: self.client.delete(url("remove_tag"), {"tag": "shared"}, format="json"),
+             ["second", "renamed"], []),
+            ("tag", lambda: self.client.post(url("add_tag"), {"tag": "shared"}, format="json"),
+             ["second", "renamed"], ["renamed"]),
+            ("delete", lambda: self.client.delete(url("note_detail")), ["second"], []),
+        ]
+        for name, write, listed, tagged in writes:
+            with self.subTest(write=name):
+                self.titles()
+                self.titles("filter_tag", tag="shared")
+                self.assertEqual(self.titles()[0], "HIT")
+                generation = note_cache.generation(self.user.pk)
+                self.assertLess(write().status_code, 300)
+                self.assertGreater(note_cache.generation(self.user.pk), generation)
+                self.assertEqual(self.titles(), ("MISS", listed))
+                self.assertEqual(self.titles("filter_tag", tag="shared"), ("MISS", tagged))
+
+    def test_other_users_writes(self):
+        self.titles()
+        generation = note_cache.generation(self.user.pk)
+        self.other_note.title = "edited"
+        self.other_note.save()
+        self.other_note.add_tags(["more"])
+        create_note(self.other, "another")
+        self.assertEqual(note_cache.generation(self.user.pk), generation)
+        self.assertEqual(self.titles(), ("HIT", ["first"]))
+
+    def test_stats(self):
+        public = create_note(self.user, "public", public=True)
+        url = reverse("note_detail", kwargs={"pk": public.pk})
+        for _ in range(3):
+            self.client.get(url)
+        stats = self.client.get(reverse("note_cache_stats")).json()
+        self.assertEqual(stats, {"hits": 2, "misses": 1, "hit_rate": 2 / 3})
+
+
+class ExportTests(NoteTestCase):
+    username, is_staff = "export", True
+
+    def setUp(self):
+        super().setUp()
+        days = ["2024-01-01T00:00:00", "2024-01-02T00:00:00", "2024-01-02T23:59:59", "2024-01-03T00:00:00"]
+        for i, day in enumerate(days):
+            note = create_note(self.user if i % 2 else create_user(f"author {i}"), f"note {i}", tags=["x"])
+            Note.objects.filter(pk=note.pk).update(
+                created=datetime.datetime.fromisoformat(day).replace(tzinfo=datetime.timezone.utc))
+
+    def export(self, **params):
+        response = self.client.get(reverse("export_notes"), params)
+        self.assertEqual(response.status_code, 200)
+        content = b"".join(response.streaming_content)
+        if response.get("Content-Encoding") == "gzip":
+            content = gzip.decompress(content)
+        return [json.loads(line) for line in content.decode().splitlines()]
+
+    def test_all_notes_oldest_first(self):
+        notes = self.export()
+        self.assertEqual([note["title"] for note in notes], [f"note {i}" for i in range(4)])
+        self.assertEqual(notes[0]["tags"], ["x"])
+        self.assertEqual(notes[0]["author"], "author 0")
+
+    def test_created_bounds(self):
+        cases = [
+            ({"created_after": "2024-01-02"}, ["note 1", "note 2", "note 3"]),
+            ({"created_before": "2024-01-02"}, ["note 0"]),
+            ({"created_after": "2024-01-02", "created_before": "2024-01-03"}, ["note 1", "note 2"]),
+            ({"created_after": "2024-01-02T12:00:00+00:00"}, ["note 2", "note 3"]),
+            ({"created_after": "2024-01-04"}, []),
+        ]
+        for params, titles in cases:
+            with self.subTest(params=params):
+                self.assertEqual([note["title"] for note in self.export(**params)], titles)
+        response = self.client.get(reverse("export_notes"), {"created_after": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_gzip(self):
+        with mock.patch.object(export, "BUFFER_SIZE", 10):
+            response = self.client.get(reverse("export_notes"), {"gzip": "1"})
+            chunks = list(response.streaming_content)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertGreater(len(chunks), 1)
+        lines = gzip.decompress(b"".join(chunks)).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], self.export())
+
+    def test_admins_only(self):
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse("export_notes")).status_code, 403)
+
+
+class ImportNotesTests(TestCase):
+    def setUp(self):
+        self.user = create_user("importer")
+
+    def run_import(self, lines, *args, suffix=".jsonl"):
+        with tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False, encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        self.addCleanup(os.remove, f.name)
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command("import_notes", f.name, *args, stdout=stdout, stderr=stderr)
+        return stderr.getvalue()
+
+    def record(self, title, **fields):
+        return json.dumps({"email": "importer@example.com", "title": title, "body": "b", **fields})
+
+    def test_records(self):
+        errors = self.run_import([
+            self.record("first", tags=["a", "b", "a"], public="yes", created="2024-01-01"),
+            "not json",
+            self.record("no author", email="nobody@example.com"),
+            self.record("bad date", created="someday"),
+            self.record("string tags", tags="work"),
+            json.dumps({"email": "importer@example.com", "title": "no body"}),
+            self.record("last"),
+        ], "--batch-size", "3")
+        notes = {note.title: note for note in Note.objects.filter(author=self.user)}
+        self.assertEqual(set(notes), {"first", "last"})
+        first = notes["first"]
+        self.assertEqual(sorted(first.tags.values_list("name", flat=True)), ["a", "b"])
+        self.assertTrue(first.public)
+        self.assertEqual(first.created.date(), datetime.date(2024, 1, 1))
+        self.assertFalse(Tag.objects.filter(name__in=["w", "o", "r", "k"]).exists())
+        for offset in range(1, 6):
+            self.assertIn(f"record {offset}: ", errors)
+        self.assertIn("resume with --skip 3", errors)
+
+    def test_resume(self):
+        lines = [self.record(f"note {i}") for i in range(5)]
+        errors = self.run_import(lines[:3] + ["not json"], "--batch-size", "2")
+        self.assertIn("resume with --skip 2", errors)
+        self.run_import(lines, "--skip", "3")
+        self.assertEqual(sorted(Note.objects.values_list("title", flat=True)),
+                         [f"note {i}" for i in range(5)])
+
+    def test_csv(self):
+        self.run_import(["email,title,body,tags,public",
+                         "importer@example.com,from csv,b,x; y,true"], suffix=".csv")
+        note = Note.objects.get()
+        self.assertEqual((note.title, note.public), ("from csv", True))
+        self.assertEqual(sorted(note.tags.values_list("name", flat=True)), ["x", "y"])
+
+
+class RequestTimingTests(NoteTestCase):
+    def setUp(self):
+        super().setUp()
+        create_note(self.user, "note")
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse("list_notes"))
+        metrics = {part.split(";")[0].strip(): part for part in response["Server-Timing"].split(",")}
+        self.assertEqual(set(metrics), {"db", "serialize", "auth", "view"})
+        self.assertIn('desc="2 queries"', metrics["db"])
+
+    @override_settings(REQUEST_TIMING={"SLOW_REQUEST_MS": 0})
+    def test_slow_request_log(self):
+        with self.assertLogs("simplenote.requests", "WARNING") as logs:
+            self.client.get(reverse("list_notes"))
+        record = logs.records[0].request_timings
+        self.assertEqual(record["view"], "list_notes")
+        self.assertEqual(record["sql_queries"], 2)
+
+    @override_settings(REQUEST_TIMING={"ENABLED": False})
+    def test_disabled(self):
+        response = self.client.get(reverse("list_notes"))
+        self.assertNotIn("Server-Timing", response)
+
+
+class AsyncReadViewTests(TestCase):
+    """The async read views must answer exactly like the sync ones"""
+
+    def setUp(self):
+        self.user = create_user("async")
+        self.other = create_user("other")
+        for i in range(3):
+            create_note(self.user, f"note {i}", "async body", ["shared"], public=i == 0)
+        self.private = create_note(self.other, "private", "hidden")
+        self.token = create_jwt_pair_for_user(self.user)["access"]
+        self.factory = AsyncRequestFactory()
+
+    def call(self, view, path, token=True, **kwargs):
+        # the async request factory adds the HTTP_ prefix itself
+        headers = {"AUTHORIZATION": f"Bearer {self.token}"} if token else {}
+        response = async_to_sync(view)(self.factory.get(path, **headers), **kwargs)
+        return response.status_code, json.loads(response.content)
+
+    def sync_get(self, path, token=True):
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {self.token}"} if token else {}
+        cache.clear()
+        return self.client.get(path, HTTP_ACCEPT="application/json", **headers)
+
+    def test_same_responses(self):
+        note = Note.objects.filter(author=self.user, public=True).get()
+        cases = [
+            (async_views.list_notes, reverse("list_notes") + "?page_size=2", {}),
+            (async_views.list_notes, reverse("list_notes") + "?view=summary&fields=title,preview", {}),
+            (async_views.note_detail, reverse("note_detail", kwargs={"pk": note.pk}),
+             {"pk": note.pk}),
+            (async_views.current_user, reverse("current_user"), {}),
+            (async_views.filter_tag, reverse("filter_tag", kwargs={"tag": "shared"}),
+             {"tag": "shared"}),
+            (async_views.search_keyword, reverse("search_keyword", kwargs={"keyword": "async"}),
+             {"keyword": "async"}),
+        ]
+        for view, path, kwargs in cases:
+            with self.subTest(path=path):
+                expected = self.sync_get(path)
+                cache.clear()
+                status_code, data = self.call(view, path, **kwargs)
+                self.assertEqual(status_code, expected.status_code)
+                self.assertEqual(data, expected.json())
+
+    def test_errors(self):
+        path = reverse("note_detail", kwargs={"pk": self.private.pk})
+        for token, status_code in ((True, 403), (False, 401)):
+            with self.subTest(token=token):
+                response = self.call(
+                    async_views.note_detail, path, token=token, pk=self.private.pk)
+                expected = self.sync_get(path, token=token)
+                self.assertEqual(response, (status_code, expected.json()))
+                self.assertEqual(expected.status_code, status_code)
+        self.assertEqual(self.call(async_views.note_detail, "/notes/0/", pk=0)[0], 404)
+
+
+class SQLiteBackendTests(TestCase):
+    """The OPTIONS of simplenote.sqlite3, on connections of their own to a file database"""
+
+    def database(self, **options):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        db = SQLiteDatabaseWrapper(
+            {**connection.settings_dict, "NAME": os.path.join(directory, "db.sqlite3"),
+             "OPTIONS": options}, alias="tuned")
+        self.addCleanup(db.close)
+        return db
+
+    def pragma(self, db, name):
+        with db.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas_and_functions(self):
+        db = self.database(pragmas={"journal_mode": "WAL", "busy_timeout": 1234},
+                           functions={"note_body": "notes.bodies.text"})
+        self.assertEqual(self.pragma(db, "journal_mode"), "wal")
+        self.assertEqual(self.pragma(db, "busy_timeout"), 1234)
+        with db.cursor() as cursor:
+            cursor.execute("SELECT note_body(%s)", [bodies.MARKER + zlib.compress(b"text")])
+            self.assertEqual(cursor.fetchone()[0], "text")
+        # and again on a new connection
+        db.close()
+        self.assertEqual(self.pragma(db, "busy_timeout"), 1234)
+
+    def test_transaction_mode(self):
+        db = self.database(transaction_mode="immediate", pragmas={"journal_mode": "WAL"})
+        db.ensure_connection()
+        with CaptureQueriesContext(db) as queries:
+            db._start_transaction_under_autocommit()
+        self.assertEqual([query["sql"] for query in queries], ["BEGIN IMMEDIATE"])
+        # the write lock is taken before anything is written
+        other = sqlite3.connect(db.settings_dict["NAME"], timeout=0)
+        self.addCleanup(other.close)
+        with self.assertRaisesMessage(sqlite3.OperationalError, "database is locked"):
+            other.execute("CREATE TABLE blocked (id INTEGER)")
+        db.connection.rollback()
+
+        db = self.database(transaction_mode="eventually")
+        db.ensure_connection()
+        with self.assertRaisesMessage(ValueError, "Unknown SQLite transaction_mode 'EVENTUALLY'"):
+            db._start_transaction_under_autocommit()
+
+
+class QueryPlanTests(NoteTestCase):
+    """
+        The queries of every notes endpoint must be answered from indexes:
+        no full table scan and no temporary B-tree to sort rows.
+
+        Each endpoint is requested, and every SELECT, UPDATE and DELETE it
+        ran is explained with EXPLAIN QUERY PLAN.
+    """
+    # endpoint name -> (method, url kwargs, query params, data, plan steps allowed for it)
+    ENDPOINTS = {
+        "list_notes": ("get", {}, {}, None, ()),
+        "list_notes (next page)": ("get", {}, {"cursor": None}, None, ()),
+        "note_detail": ("get", {"pk": None}, {}, None, ()),
+        "current_user": ("get", {}, {}, None, ()),
+        "all_notes": ("get", {}, {}, None, ()),
+        "export_notes": ("get", {}, {"created_after": "2020-01-01"}, None, ()),
+        "filter_tag": ("get", {"tag": "shared"}, {}, None, ()),
+        # the notes of a rare tag are sorted, and facets of several tags
+        # are counted over the matching notes
+        "filter_tags": ("get", {}, {"all": "shared"}, None, ("USE TEMP B-TREE FOR ORDER BY",)),
+        "filter_tags (several)": ("get", {}, {"all": "shared", "any": "tag 1,tag 2", "not": "tag 3"}, None,
+                                  ("USE TEMP B-TREE FOR ORDER BY", "USE TEMP B-TREE FOR GROUP BY")),
+        # matches are ranked by relevance, which no index can be ordered by
+        "search_keyword": ("get", {"keyword": "shared"}, {}, None, ("USE TEMP B-TREE FOR ORDER BY",)),
+        "note_changes": ("get", {}, {"since": "1", "page_size": "10"}, None, ()),
+        "add_tag": ("post", {"pk": None}, {}, {"tag": "added"}, ()),
+        "remove_tag": ("delete", {"pk": None}, {}, {"tag": "shared"}, ()),
+    }
+    EXPLAINED = ("SELECT", "UPDATE", "DELETE")
+
+    username, is_staff = "plan", True
+
+    def setUp(self):
+        super().setUp()
+        for author in (self.user, create_user("other")):
+            for i in range(30):
+                create_note(author, f"note {i}", "shared body", ["shared", f"tag {i}"],
+                            public=i % 2 == 0)
+        self.note = Note.objects.filter(author=self.user).first()
+
+    def cursor(self):
+        response = self.client.get(reverse("list_notes"), {"page_size": 5})
+        return parse_qs(urlsplit(response.data["next"]).query)["cursor"][0]
+
+    def bad_steps(self, sql, allowed):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            steps = [row[-1] for row in cursor.fetchall()]
+        bad = []
+        for step in steps:
+            if step in allowed:
+                continue
+            full_scan = step.startswith("SCAN ") and " USING " not in step and "VIRTUAL TABLE" not in step
+            if full_scan or "TEMP B-TREE" in step:
+                bad.append(step)
+        return bad
+
+    def test_query_plans(self):
+        for name, (method, kwargs, params, data, allowed) in self.ENDPOINTS.items():
+            with self.subTest(endpoint=name):
+                kwargs = {key: self.note.pk if value is None else value
+                          for key, value in kwargs.items()}
+                params = {key: self.cursor() if value is None else value
+                          for key, value in params.items()}
+                url = reverse(name.split(" ")[0], kwargs=kwargs)
+                if params:
+                    url += "?" + urlencode(params)
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    response = getattr(self.client, method)(url, data, format="json")
+                    if response.streaming:
+                        b"".join(response.streaming_content)
+                self.assertLess(response.status_code, 300, name)
+                for query in queries:
+                    if query["sql"].lstrip().upper().startswith(self.EXPLAINED):
+                        self.assertEqual(self.bad_steps(query["sql"], allowed), [], query["sql"])
+
+
+class SparseFieldsTests(NoteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.note = create_note(self.user, "sparse", "word " * 50, ["shared"])
+
+    def get(self, query):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"{reverse('list_notes')}?{query}")
+        self.assertEqual(response.status_code, 200, response.content)
+        note_queries = [query["sql"] for query in queries if 'FROM "notes_note"' in query["sql"]]
+        return response.json()["results"][0], len(queries), note_queries[0]
+
+    def test_fields(self):
+        note, queries, sql = self.get("fields=title,created")
+        self.assertEqual(list(note), ["id", "title", "created"])
+        self.assertNotIn('"notes_note"."body"', sql)
+        self.assertNotIn("accounts_user", sql)
+        # no prefetch of the tags
+        self.assertEqual(queries, 1)
+
+    def test_summary(self):
+        note, _, sql = self.get("view=summary")
+        self.assertEqual(
+            list(note), ["id", "title", "author", "tags", "preview", "created", "public"])
+        self.assertEqual(note["preview"], self.note.body[:sparse.PREVIEW_LENGTH])
+        self.assertEqual(note["tags"], ["shared"])
+        self.assertNotIn('"notes_note"."body"', sql.replace('SUBSTR(note_body("notes_note"."body")', ""))
+
+    def test_invalid(self):
+        for query in ("fields=title,secret", "view=compact"):
+            with self.subTest(query=query):
+                response = self.client.get(f"{reverse('list_notes')}?{query}")
+                self.assertEqual(response.status_code, 400)
+
+
+class FastReadPathTests(NoteTestCase):
+    """note_dicts() and FastJSONRenderer must render notes like NoteSerializer and JSONRenderer"""
+    username = "fäst"
+
+    def setUp(self):
+        super().setUp()
+        bodies = ["plain", "ünïcode \u2028 \u2029 \x00\x1f\x7f \"quoted\" \\ 😀", ""]
+        for i, body in enumerate(bodies):
+            create_note(self.user, f"note {i}", body,
+                        [f"tag {(i + n) % 4}" for n in range(i)] + ["shared"], public=i == 0)
+        create_note(self.user, "untagged", "no tags")
+        # DRF cuts microseconds off datetimes it encodes, but not off serializer fields
+        Note.objects.filter(title="note 1").update(
+            created=datetime.datetime(2024, 3, 1, 12, 0, 0, 123456, tzinfo=datetime.timezone.utc))
+
+    def render(self, fields):
+        notes = Note.objects.filter(author=self.user).order_by("-created", "-id")
+        expected = JSONRenderer().render(
+            NoteSerializer(notes.with_relations(), many=True, fields=fields).data)
+        rows = list(fast.note_rows(notes, fields))
+        tags = fast.tags_by_note(fast.tag_rows([row["id"] for row in rows]))
+        return expected, FastJSONRenderer().render(fast.note_dicts(rows, fields, tags))
+
+    def test_same_bytes(self):
+        for fields in (set(fast.field_order()), {"id", "tags", "created"}, {"id", "body"}):
+            with self.subTest(fields=fields):
+                expected, actual = self.render(fields)
+                self.assertEqual(actual, expected)
+
+    def test_list_endpoint(self):
+        response = self.client.get(reverse("list_notes"), HTTP_ACCEPT="application/json")
+        notes = Note.objects.filter(author=self.user).with_relations().order_by("-created", "-id")
+        self.assertEqual(response.json()["results"], NoteSerializer(notes, many=True).data)
+
+    def test_renderer_fallbacks(self):
+        data = {"when": datetime.datetime(2024, 1, 1, 0, 0, 0, 1000, tzinfo=datetime.timezone.utc),
+                "amount": decimal.Decimal("1.50"), 1: "key"}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class BinaryFormatTests(NoteTestCase):
+    """MessagePack and CBOR carry the same data as JSON, both ways"""
+    FORMATS = {
+        "application/msgpack": (msgpack.packb, lambda content: msgpack.unpackb(content)),
+        "application/cbor": (cbor2.dumps, cbor2.loads),
+    }
+
+    def setUp(self):
+        super().setUp()
+        create_note(self.user, "binary", "packed", ["shared"])
+
+    def test_responses(self):
+        for media_type, (_, decode) in self.FORMATS.items():
+            for name in ("list_notes", "current_user"):
+                with self.subTest(media_type=media_type, endpoint=name):
+                    expected = self.client.get(reverse(name), HTTP_ACCEPT="application/json").json()
+                    response = self.client.get(reverse(name), HTTP_ACCEPT=media_type)
+                    self.assertEqual(response["Content-Type"], media_type)
+                    self.assertEqual(decode(response.content), expected)
+
+    def test_async_responses(self):
+        token = create_jwt_pair_for_user(self.user)["access"]
+        request = AsyncRequestFactory().get(
+            reverse("list_notes"), AUTHORIZATION=f"Bearer {token}", ACCEPT="application/msgpack")
+        response = async_to_sync(async_views.list_notes)(request)
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(response.content)["results"][0]["title"], "binary")
+
+    def test_requests(self):
+        operations = [{"op": "create", "title": "bulk", "body": "from a binary body", "tags": ["x"]}]
+        for media_type, (encode, decode) in self.FORMATS.items():
+            with self.subTest(media_type=media_type):
+                response = self.client.post(
+                    reverse("bulk_notes"), encode({"operations": operations}),
+                    content_type=media_type, HTTP_ACCEPT=media_type)
+                self.assertEqual(response.status_code, 200, response.content)
+                self.assertEqual(decode(response.content)["results"][0]["status"], 201)
+
+                response = self.client.post(
+                    reverse("bulk_notes"), b"\xc1\xff", content_type=media_type)
+                self.assertEqual(response.status_code, 400)
+
+
+class CompressionTests(NoteTestCase):
+    username, is_staff = "compress", True
+
+    def setUp(self):
+        super().setUp()
+        for i in range(30):
+            create_note(self.user, f"note {i}", "repetitive body " * 20, public=True)
+
+    def get(self, path, encoding, **headers):
+        cache.clear()
+        return self.client.get(path, HTTP_ACCEPT_ENCODING=encoding, **headers)
+
+    def test_negotiated_encodings(self):
+        path = reverse("list_notes")
+        plain = self.get(path, "")
+        self.assertNotIn("Content-Encoding", plain)
+        decompress = {"gzip": gzip.decompress, "br": brotli.decompress,
+                      "zstd": zstandard.ZstdDecompressor().decompressobj().decompress}
+        for header, encoding in (("gzip", "gzip"), ("gzip, deflate, br", "br"), ("zstd", "zstd"),
+                                 ("br;q=0.5, gzip", "gzip"), ("*", "br")):
+            with self.subTest(header=header):
+                response = self.get(path, header)
+                self.assertEqual(response["Content-Encoding"], encoding)
+                self.assertIn("Accept-Encoding", response["Vary"])
+                self.assertEqual(decompress[encoding](response.content), plain.content)
+                self.assertEqual(int(response["Content-Length"]), len(response.content))
+        for header in ("identity", "deflate", "br;q=0, gzip;q=0"):
+            with self.subTest(header=header):
+                self.assertNotIn("Content-Encoding", self.get(path, header))
+
+    def test_small_responses(self):
+        response = self.client.get(reverse("health"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertNotIn("Content-Encoding", response)
+
+    def test_streaming(self):
+        path = reverse("export_notes")
+        plain = b"".join(self.get(path, "").streaming_content)
+        response = self.get(path, "br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(b"".join(response.streaming_content)), plain)
+        # compressed by the view already
+        response = self.get(path + "?gzip=1", "br")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), plain)
+
+    def test_etag(self):
+        note = Note.objects.first()
+        note.body = "long body " * 200
+        note.save()
+        path = reverse("note_detail", kwargs={"pk": note.pk})
+        response = self.get(path, "gzip")
+        self.assertTrue(response["ETag"].startswith('W/"'))
+        response = self.get(path, "gzip", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+
+class NoteChangesTests(NoteTestCase):
+    username = "sync"
+
+    def setUp(self):
+        super().setUp()
+        create_note(create_user("other"), "not mine", "other body")
+        self.note = create_note(self.user, "first", "first body", ["kept", "dropped"])
+
+    def sync(self, since=None, **params):
+        if since is not None:
+            params["since"] = since
+        response = self.client.get(reverse("note_changes"), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_full_and_delta_sync(self):
+        first = self.sync()
+        self.assertEqual([note["title"] for note in first["notes"]], ["first"])
+        self.assertEqual(first["notes"][0]["tags"], ["kept", "dropped"])
+        self.assertEqual({tag["name"] for tag in first["tags"]}, {"kept", "dropped"})
+        self.assertEqual(self.sync(first["token"])["notes"], [])
+
+        self.client.put(reverse("note_detail", kwargs={"pk": self.note.pk}),
+                        {"title": "edited", "body": "first body"}, format="json")
+        doomed = Note.objects.create(author=self.user, title="doomed", body="soon gone")
+        self.client.post(reverse("bulk_notes"), {"operations": [
+            {"op": "update", "id": self.note.pk, "title": "bulk edited"},
+            {"op": "create", "title": "created", "body": "in bulk"},
+        ]}, format="json")
+        self.client.delete(reverse("note_detail", kwargs={"pk": doomed.pk}))
+        self.client.delete(reverse("remove_tag", kwargs={"pk": self.note.pk}),
+                           {"tag": "dropped"}, format="json")
+        Tag.objects.filter(name="dropped").delete()
+
+        delta = self.sync(first["token"])
+        # one entry per note, in the order of its last change
+        self.assertEqual([note["title"] for note in delta["notes"]], ["created", "bulk edited"])
+        self.assertEqual(delta["notes"][1]["tags"], ["kept"])
+        self.assertEqual(delta["deleted"]["notes"], [doomed.pk])
+        self.assertEqual(len(delta["deleted"]["tags"]), 1)
+        self.assertFalse(delta["more"])
+        self.assertEqual(self.sync(delta["token"])["deleted"], {"notes": [], "tags": []})
+
+    def test_tagging(self):
+        since = self.sync()["token"]
+        other = create_note(self.user, "second", "second body")
+        since = self.sync(since)["token"]
+        # add_tags() inserts with INSERT OR IGNORE, which must not keep the
+        # triggers from recording the notes again
+        response = self.client.post(reverse("add_tag", kwargs={"pk": self.note.pk}),
+                                    {"tag": "new"}, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+        other.add_tags(["kept"])
+        delta = self.sync(since)
+        self.assertEqual([(note["title"], note["tags"]) for note in delta["notes"]],
+                         [("first", ["kept", "dropped", "new"]), ("second", ["kept"])])
+        self.assertEqual([tag["name"] for tag in delta["tags"]], ["new"])
+
+    def test_triggers_need_the_table(self):
+        # post_migrate after migrating back to before notes_change
+        changes.drop_triggers()
+        with mock.patch.object(connection.introspection, "table_names", return_value=["notes_note"]):
+            self.assertFalse(changes.ensure_triggers())
+        self.assertEqual(changes.missing_triggers(), set(changes.TRIGGERS))
+        self.assertTrue(changes.ensure_triggers())
+
+    def test_pages(self):
+        since = self.sync()["token"]
+        created = [Note.objects.create(author=self.user, title=f"note {i}", body="paged").pk
+                   for i in range(4)]
+        deleted = self.note.pk
+        self.note.delete()
+        seen, data = [], {"next": True}
+        while data["next"]:
+            data = self.sync(since, page_size=2)
+            self.assertEqual(data["more"], data["next"] is not None)
+            seen += [note["id"] for note in data["notes"]] + data["deleted"]["notes"]
+            since = data["token"]
+        self.assertEqual(seen, created + [deleted])
+
+    def test_deleted_user(self):
+        user_id = self.user.pk
+        self.assertTrue(Change.objects.filter(owner_id=user_id).exists())
+        self.user.delete()
+        self.assertFalse(Change.objects.filter(owner_id=user_id).exists())
+
+    def test_invalid_token(self):
+        for since in ("yesterday", "-1", "\u00b2", "\u0663"):
+            response = self.client.get(reverse("note_changes"), {"since": since})
+            self.assertEqual(response.status_code, 400, since)
+
+
+class TagFilterTests(NoteTestCase):
+    username = "facets"
+
+    def setUp(self):
+        super().setUp()
+        create_note(create_user("other"), "not mine", "b", tags=["work", "home"])
+        tags = {
+            "report": ["work", "urgent"],
+            "budget": ["work", "money"],
+            "garden": ["home"],
+            "repairs": ["home", "urgent", "money"],
+            "untagged": [],
+        }
+        self.notes = {}
+        for title, names in tags.items():
+            self.notes[title] = create_note(self.user, title, "b", tags=names)
+
+    def filter(self, **params):
+        cache.clear()
+        response = self.client.get(reverse("filter_tags"), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        return {note["title"] for note in data["results"]}, data["facets"]
+
+    def test_filters(self):
+        cases = [
+            ({}, {"report", "budget", "garden", "repairs", "untagged"},
+             {"home": 2, "money": 2, "urgent": 2, "work": 2}),
+            ({"all": "work"}, {"report", "budget"}, {"money": 1, "urgent": 1}),
+            ({"all": "home,urgent"}, {"repairs"}, {"money": 1}),
+            ({"any": "urgent,money"}, {"report", "budget", "repairs"}, {"work": 2, "home": 1}),
+            ({"not": "work"}, {"garden", "repairs", "untagged"}, {"home": 2, "money": 1, "urgent": 1}),
+            ({"any": "work,home", "not": "money"}, {"report", "garden"}, {"urgent": 1}),
+            ({"all": "work,missing"}, set(), {}),
+            ({"not": "missing"}, {"report", "budget", "garden", "repairs", "untagged"},
+             {"home": 2, "money": 2, "urgent": 2, "work": 2}),
+        ]
+        # with the notes of the rarest tag leading and with the notes scanned
+        for drive_limit in (facets.DRIVE_LIMIT, 0):
+            with mock.patch.object(facets, "DRIVE_LIMIT", drive_limit):
+                for params, titles, expected in cases:
+                    with self.subTest(params=params, drive_limit=drive_limit):
+                        self.assertEqual(self.filter(**params), (titles, expected))
+
+    def test_pairs_follow_writes(self):
+        self.notes["garden"].add_tags(["work", "urgent"])
+        self.notes["report"].remove_tag("urgent")
+        self.notes["budget"].delete()
+        Tag.objects.filter(owner=self.user, name="money").delete()
+        self.client.post(reverse("bulk_notes"), {"operations": [
+            {"op": "create", "title": "batch", "body": "b", "tags": ["home", "work"]},
+            {"op": "update", "id": self.notes["repairs"].pk, "tags": ["urgent"]},
+        ]}, format="json")
+        maintained = sorted(TagPair.objects.values_list("tag_id", "other_id", "notes"))
+        facets.count_pairs()
+        self.assertEqual(maintained, sorted(TagPair.objects.values_list("tag_id", "other_id", "notes")))
+        self.assertEqual(self.filter(all="work")[1], {"home": 2, "urgent": 1})
+
+    def test_too_many_tags(self):
+        response = self.client.get(reverse("filter_tags"), {"all": ",".join(f"t{i}" for i in range(30))})
+        self.assertEqual(response.status_code, 400)
+
+
+class NotePatchTests(NoteTestCase):
+    username = "patch"
+
+    def setUp(self):
+        super().setUp()
+        self.note = create_note(self.user, "draft", "one\ntwo\nthree\n" * 1000)
+        self.url = reverse("note_detail", kwargs={"pk": self.note.pk})
+
+    def patch(self, data, status_code=200):
+        response = self.client.patch(self.url, data, format="json")
+        self.assertEqual(response.status_code, status_code, response.content)
+        return response.json()
+
+    def test_edits(self):
+        original = self.note.body
+        data = self.patch({"version": 1, "title": "final", "edits": [
+            {"offset": 0, "delete": 3, "insert": "ONE"},
+            {"offset": 8, "insert": "and a half "},
+            {"offset": len(self.note.body) - 1, "delete": 1},
+        ]})
+        self.assertNotIn("body", data)
+        self.assertEqual((data["title"], data["version"]), ("final", 2))
+        self.note.refresh_from_db()
+        expected = "ONE\ntwo\nand a half " + original[8:-1]
+        self.assertEqual(self.note.body, expected)
+
+        self.patch({"version": 2, "edits": [{"offset": 5, "insert": "x"}, {"offset": 4, "insert": "y"}]}, 400)
+        self.patch({"version": 2, "edits": [{"offset": len(expected), "delete": 1}]}, 400)
+        self.patch({"edits": [{"offset": 0, "insert": "x"}]}, 400)
+
+    def test_diff(self):
+        old = self.note.body
+        new = old.replace("two\n", "2\n", 1).replace("three\n", "3\n", 1) + "four\n"
+        diff = "".join(difflib.unified_diff(
+            old.splitlines(keepends=True), new.splitlines(keepends=True), "a", "b"))
+        self.assertEqual(self.patch({"version": 1, "diff": diff})["version"], 2)
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.body, new)
+
+        no_newline = "@@ -3001 +3001,2 @@\n-four\n+four\n+five\n\\ No newline at end of file\n"
+        self.patch({"version": 2, "diff": no_newline})
+        self.note.refresh_from_db()
+        self.assertTrue(self.note.body.endswith("four\nfive"))
+
+        mismatch = "@@ -1 +1 @@\n-zero\n+0\n"
+        data = self.patch({"version": 3, "diff": mismatch}, 400)
+        self.assertIn("diff", data)
+
+    def test_version_conflict(self):
+        self.client.put(self.url, {"title": "elsewhere", "body": "rewritten"}, format="json")
+        self.client.post(reverse("bulk_notes"), {"operations": [
+            {"op": "update", "id": self.note.pk, "public": True}]}, format="json")
+        data = self.patch({"version": 1, "edits": [{"offset": 0, "insert": "x"}]}, 409)
+        self.assertEqual(data["version"], 3)
+        self.note.refresh_from_db()
+        self.assertEqual(self.note.body, "rewritten")
+        self.assertEqual(self.patch({"public": False})["version"], 4)
+
+    def test_racing_saves(self):
+        # two writers that read the note at the same version
+        first, second = Note.objects.get(pk=self.note.pk), Note.objects.get(pk=self.note.pk)
+        first.title = "first"
+        first.save()
+        second.public = True
+        second.save()
+        self.assertEqual((first.version, second.version), (2, 3))
+        # an edit made on the first write's version has missed the second
+        data = self.patch({"version": 2, "edits": [{"offset": 0, "insert": "x"}]}, 409)
+        self.assertEqual(data["version"], 3)
+
+
+class BodyCompressionTests(NoteTestCase):
+    username = "long"
+
+    def setUp(self):
+        super().setUp()
+        self.body = "Minutes of the quarterly planning meeting. " * 200 + "zeppelin"
+
+    def stored(self, note_id):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT body FROM notes_note WHERE id = %s", [note_id])
+            return cursor.fetchone()[0]
+
+    def test_round_trip(self):
+        response = self.client.post(
+            reverse("list_notes"), {"title": "long", "body": self.body}, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+        note_id = response.json()["id"]
+        short = create_note(self.user, "short", "a short body")
+        stored = self.stored(note_id)
+        self.assertTrue(stored.startswith(bodies.MARKER))
+        self.assertLess(len(stored), len(self.body) / 10)
+        self.assertEqual(self.stored(short.pk), "a short body")
+
+        detail = self.client.get(reverse("note_detail", kwargs={"pk": note_id})).json()
+        self.assertEqual(detail["body"], self.body)
+        notes = self.client.get(reverse("list_notes")).json()["results"]
+        self.assertEqual([note["body"] for note in notes], ["a short body", self.body])
+        summary = self.client.get(reverse("list_notes"), {"view": "summary"}).json()["results"]
+        self.assertEqual(summary[1]["preview"], self.body[:sparse.PREVIEW_LENGTH])
+        found = self.client.get(reverse("search_keyword", kwargs={"keyword": "zeppelin"})).json()
+        self.assertEqual([note["id"] for note in found["results"]], [note_id])
+
+    def test_lazy(self):
+        note_id = Note.objects.create(author=self.user, title="long", body=self.body).pk
+        note = Note.objects.get(pk=note_id)
+        self.assertIsInstance(note.__dict__["body"], bytes)
+        self.assertEqual(note.body, self.body)
+        self.assertEqual(note.__dict__["body"], self.body)
+
+    def test_compress_stored(self):
+        with override_settings(NOTE_BODY_COMPRESSION={"MIN_SIZE": None}):
+            note = Note.objects.create(author=self.user, title="long", body=self.body)
+        self.assertEqual(self.stored(note.pk), self.body)
+        report = bodies.compress_stored(connection, batch_size=1)
+        self.assertEqual((report["rows"], report["compressed"]), (1, 1))
+        self.assertLess(report["bytes_after"], report["bytes_before"])
+        self.assertTrue(self.stored(note.pk).startswith(bodies.MARKER))
+        found = self.client.get(reverse("search_keyword", kwargs={"keyword": "zeppelin"})).json()
+        self.assertEqual(found["count"], 1)
+
+
+@override_settings(READ_REPLICAS={"ALIASES": ["replica"], "STICKY_SECONDS": 5})
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.user = create_user("replica")
+        self.router = ReplicaRouter()
+        cache.clear()
+
+    def request(self, method, write=False):
+        """The database the reads of a request go to, after it wrote if write"""
+        def view(request):
+            # DRF sets the authenticated user while the view runs
+            request.user = self.user
+            if write:
+                self.router.db_for_write(Note)
+            view.alias = self.router.db_for_read(Note)
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(getattr(RequestFactory(), method)("/notes/"))
+        return view.alias
+
+    def test_reads_of_safe_requests_go_to_replica(self):
+        self.assertEqual(self.request("get"), "replica")
+        self.assertEqual(self.request("post"), "default")
+        self.assertEqual(self.router.db_for_read(Note), "default")
+        self.assertEqual(self.router.db_for_write(Note), "default")
+
+    def test_reads_stick_to_primary_after_a_write(self):
+        self.assertEqual(self.request("post", write=True), "default")
+        self.assertEqual(self.request("get"), "default")
+        cache.clear()
+        self.assertEqual(self.request("get"), "replica")
+
+    def test_caches_are_not_filled_from_replica(self):
+        note = create_note(self.user, "note", public=True)
+        key = note_cache.list_key(self.user.pk, "http://testserver/notes/")
+
+        def view(request):
+            note_cache.set_public_note(note.pk, {"id": note.pk})
+            note_cache.set_list_page(key, {"results": []})
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(RequestFactory().get("/notes/"))
+        self.assertIsNone(cache.get(note_cache.DETAIL_KEY.format(note.pk)))
+        self.assertIsNone(cache.get(key))
+        # read from the primary after a write
+        ReplicaRoutingMiddleware(view)(RequestFactory().post("/notes/"))
+        self.assertIsNotNone(cache.get(key))
+
+    @override_settings(READ_REPLICAS={"ALIASES": ["default"], "STICKY_SECONDS": 5})
+    def test_session_requests(self):
+        # "default" stands in for a replica, so the session and user lookups
+        # of Django's lazy request.user are routed like replica reads
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        client = Client()
+        client.force_login(self.user)
+        self.assertNotEqual(client.get(reverse("list_notes")).status_code, 500)
+        self.assertEqual(client.get("/admin/").status_code, 200)
@@ -1,16 +1,38 @@
 from . import views
+from django.conf import settings
 from django.urls import path
 
+# the read endpoints can run as async views under ASGI, see notes/async_views.py
+if getattr(settings, "ASYNC_NOTE_VIEWS", False):
+    from . import async_views
+    list_notes_view = async_views.list_notes
+    note_detail_view = async_views.note_detail
+    current_user_view = async_views.current_user
+    filter_tag_view = async_views.filter_tag
+    search_keyword_view = async_views.search_keyword
+else:
+    list_notes_view = views.NoteListCreateView.as_view()
+    note_detail_view = views.NoteRetrieveUpdateDeleteView.as_view()
+    current_user_view = views.get_notes_for_current_user
+    filter_tag_view = views.ListNotesByTagFilter.as_view()
+    search_keyword_view = views.ListSearchNotesByKeyWord.as_view()
+
 urlpatterns = [
     path("homepage/", views.homepage, name="notes_home"),
-    path("", views.NoteListCreateView.as_view(), name="list_notes"),
-    path("<int:pk>/", views.NoteRetrieveUpdateDeleteView.as_view(), name="note_detail"),
-    path("current_user/", views.get_notes_for_current_user, name="current_user"),
+    path("", list_notes_view, name="list_notes"),
+    path("<int:pk>/", note_detail_view, name="note_detail"),
+    path("bulk/", views.NoteBulkView.as_view(), name="bulk_notes"),
+    path("current_user/", current_user_view, name="current_user"),
+    path("changes/", views.note_changes, name="note_changes"),
     path("all_notes/", views.ListNotesForAdmin.as_view(),
          name="all_notes"),
-    path("filter/<tag>", views.ListNotesByTagFilter.as_view(),
+    path("all_notes/export/", views.export_notes_for_admin,
+         name="export_notes"),
+    path("cache_stats/", views.note_cache_stats, name="note_cache_stats"),
+    path("filter/", views.ListNotesByTags.as_view(), name="filter_tags"),
+    path("filter/<tag>", filter_tag_view,
          name="filter_tag"),
-    path("search/<keyword>", views.ListSearchNotesByKeyWord.as_view(),
+    path("search/<keyword>", search_keyword_view,
          name="search_keyword"),
     path("add_tag/<int:pk>/", views.add_tag_to_note, name="add_tag"),
     path("remove_tag/<int:pk>/", views.remove_tag_from_note, name="remove_tag"),
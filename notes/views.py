@@ -4,10 +4,19 @@ from rest_framework.permissions import IsAuthenticated, AllowAny, IsAuthenticate
 from rest_framework import status, generics, mixins
 from rest_framework.decorators import api_view, APIView, permission_classes
 from .models import Note, Tag
-from .serializers import NoteSerializer, TagSerializer
+from .serializers import NoteSerializer, NotePatchSerializer, TagSerializer, BulkNoteSerializer
 from django.shortcuts import get_object_or_404
 from accounts.serializers import CurrentUserNotesSerializer
 from .permissions import ReadOnly, AuthorOrReadOnly, IsAuthor, AuthorOrPublic
+from .pagination import NoteCursorPagination, SearchResultsPagination
+from .search import search_notes
+from .bulk import apply_operations, unique_names
+from . import cache as note_cache
+from .sparse import SparseFieldsMixin
+from .fast import FastListMixin, field_order
+from .patches import VersionConflict, patch_note
+from django.http import StreamingHttpResponse
+from . import changes, export, facets
 from django.core.exceptions import ObjectDoesNotExist
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework.validators import ValidationError
@@ -26,18 +35,19 @@ def homepage(request: Request):
     return Response(data=response, status=status.HTTP_200_OK)
 
 
-class NoteListCreateView(generics.GenericAPIView, mixins.ListModelMixin, mixins.CreateModelMixin):
+class NoteListCreateView(note_cache.CachedListMixin, FastListMixin, SparseFieldsMixin, generics.GenericAPIView, mixins.ListModelMixin, mixins.CreateModelMixin):
     """
         View for creating and listing Notes
     """
     serializer_class = NoteSerializer
+    pagination_class = NoteCursorPagination
     permission_classes = [IsAuthenticated]
     queryset = Note.objects.all()
 
     # modify the default queryset
     def get_queryset(self):
         user = self.request.user
-        return Note.objects.filter(author=user)
+        return Note.objects.filter(author=user).with_relations()
 
     # using mixin perform-hook to attach note to current user
     def perform_create(self, serializer):
@@ -45,15 +55,12 @@ class NoteListCreateView(generics.GenericAPIView, mixins.ListModelMixin, mixins.
         note = serializer.save(author=user)
         tags = self.request.data.get('tags')
         if tags:
-            for tag in tags:
-                if note.tag_not_exists(tag):
-                    Tag.objects.create(note=note, name=tag)
-
-        return super().perform_create(serializer)
+            note.add_tags(unique_names(tags))
 
     @swagger_auto_schema(
         operation_summary="List user notes",
-        operation_description="This returns all notes for the current user"
+        operation_description="This returns the notes of the current user, newest first, one page at a time. "
+        "?fields= picks the fields of each note and ?view=summary sends a preview instead of the body"
     )
     def get(self, request: Request, *args, **kwargs):
 
@@ -69,7 +76,7 @@ class NoteListCreateView(generics.GenericAPIView, mixins.ListModelMixin, mixins.
 
 class NoteRetrieveUpdateDeleteView(generics.GenericAPIView, mixins.RetrieveModelMixin, mixins.UpdateModelMixin, mixins.DestroyModelMixin):
     serializer_class = NoteSerializer
-    queryset = Note.objects.all()
+    queryset = Note.objects.with_relations()
     permission_classes = [AuthorOrPublic]
 
     @swagger_auto_schema(
@@ -77,7 +84,25 @@ class NoteRetrieveUpdateDeleteView(generics.GenericAPIView, mixins.RetrieveModel
         operation_description="This retrieves a note by an id"
     )
     def get(self, request: Request, *args, **kwargs):
-        return self.retrieve(request, *args, **kwargs)
+        # public notes are readable by anyone, so a cached public note can be
+        # served without loading it to check permissions
+        entry = note_cache.get_public_note(kwargs["pk"])
+        hit = entry is not None
+        if not hit:
+            note = self.get_object()
+            data = self.get_serializer(note).data
+            if not note.public:
+                return Response(data)
+            entry = note_cache.set_public_note(note.pk, data)
+
+        data, digest = entry
+        # one etag per representation, e.g. json and the browsable api
+        etag = f'"{digest}-{request.accepted_renderer.format}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache",
+                   "X-Cache": "HIT" if hit else "MISS"}
+        if note_cache.etag_matches(etag, request.headers.get("If-None-Match")):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(data, headers=headers)
 
     @swagger_auto_schema(
         operation_summary="Update note by id",
@@ -86,6 +111,26 @@ class NoteRetrieveUpdateDeleteView(generics.GenericAPIView, mixins.RetrieveModel
     def put(self, request: Request, *args, **kwargs):
         return self.update(request, *args, **kwargs)
 
+    @swagger_auto_schema(
+        request_body=NotePatchSerializer,
+        operation_summary="Edit note by id",
+        operation_description="This changes some fields of a note. The body can be sent whole, as edits "
+        '({"offset", "delete", "insert"} on the body at "version") or as a unified diff against it; '
+        "the note is written only if it is still at that version, 409 otherwise. "
+        "The response leaves out the body"
+    )
+    def patch(self, request: Request, *args, **kwargs):
+        note = self.get_object()
+        serializer = NotePatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            note = patch_note(note, serializer.validated_data)
+        except VersionConflict as conflict:
+            return Response(data={"detail": str(conflict), "version": conflict.version},
+                            status=status.HTTP_409_CONFLICT)
+        fields = set(field_order()) - {"body"}
+        return Response(data=NoteSerializer(note, fields=fields).data, status=status.HTTP_200_OK)
+
     @swagger_auto_schema(
         operation_summary="Delete note by id",
         operation_description="This deletes a note by an id"
@@ -94,6 +139,26 @@ class NoteRetrieveUpdateDeleteView(generics.GenericAPIView, mixins.RetrieveModel
         return self.destroy(request, *args, **kwargs)
 
 
+class NoteBulkView(generics.GenericAPIView):
+    """Create, update and delete many notes in one request"""
+    serializer_class = BulkNoteSerializer
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_summary="Bulk create, update and delete notes",
+        operation_description="Takes a list of operations "
+        '({"op": "create"|"update"|"delete", "id", "title", "body", "public", "tags"}) '
+        "and applies them in one transaction. Tags given with an update replace the note's tags. "
+        "Returns one result per operation, in order, with its own status code"
+    )
+    def post(self, request: Request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = apply_operations(
+            request.user, serializer.validated_data["operations"])
+        return Response(data={"results": results}, status=status.HTTP_200_OK)
+
+
 @api_view(http_method_names=['GET'])
 @permission_classes([IsAuthenticated])
 def get_notes_for_current_user(request: Request):
@@ -106,55 +171,161 @@ def get_notes_for_current_user(request: Request):
     )
 
 
-class ListNotesForAdmin(generics.GenericAPIView, mixins.ListModelMixin):
+@api_view(http_method_names=['GET'])
+@permission_classes([IsAdminUser])
+def note_cache_stats(request: Request):
+    return Response(data=note_cache.stats(), status=status.HTTP_200_OK)
+
+
+class ListNotesForAdmin(FastListMixin, SparseFieldsMixin, generics.GenericAPIView, mixins.ListModelMixin):
     """Admin can see all notes"""
-    queryset = Note.objects.all()
+    queryset = Note.objects.with_relations()
     serializer_class = NoteSerializer
+    pagination_class = NoteCursorPagination
     permission_classes = [IsAdminUser]
 
     @swagger_auto_schema(
         operation_summary="List all notes for admin",
-        operation_description="This lists all public and private notes. Must have admin privilege"
+        operation_description="This lists all public and private notes. Must have admin privilege. "
+        "Takes ?fields= and ?view=summary like the note list"
     )
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
 
 
-class ListNotesByTagFilter(generics.GenericAPIView, mixins.ListModelMixin):
+@swagger_auto_schema(
+    method="GET",
+    operation_summary="Export all notes for admin",
+    operation_description="Streams every note as newline-delimited JSON, oldest first. "
+    "Optional query parameters: created_after and created_before (ISO 8601 date or datetime) "
+    "and gzip=1 to compress the stream. Must have admin privilege"
+)
+@api_view(http_method_names=['GET'])
+@permission_classes([IsAdminUser])
+def export_notes_for_admin(request: Request):
+    bounds = {}
+    for name in ("created_after", "created_before"):
+        value = request.query_params.get(name)
+        if value:
+            bounds[name] = export.parse_bound(value)
+            if bounds[name] is None:
+                raise ValidationError({name: "Enter a valid ISO 8601 date or datetime."})
+    compress = request.query_params.get("gzip") in ("1", "true")
+
+    notes = export.export_notes(**bounds)
+    response = StreamingHttpResponse(
+        export.buffered(export.ndjson_lines(notes), compress=compress),
+        content_type="application/x-ndjson")
+    response["Content-Disposition"] = 'attachment; filename="notes.ndjson"'
+    if compress:
+        response["Content-Encoding"] = "gzip"
+    return response
+
+
+def query_number(request, name, default) -> int:
+    value = request.query_params.get(name)
+    if not value:
+        return default
+    if not (value.isascii() and value.isdigit()):
+        raise ValidationError({name: "Enter a whole number."})
+    return int(value)
+
+
+@swagger_auto_schema(
+    method="GET",
+    operation_summary="Notes and tags changed since a sync",
+    operation_description="Returns the notes and tags of the current user that were created or changed "
+    "after the given since token, oldest change first, and the ids of the ones that were deleted. "
+    "Leave since out, or pass 0, for everything. Sync again from the returned token; while more is true "
+    "there are further changes waiting, at the next link. Optional: page_size (default 100, max 1000)"
+)
+@api_view(http_method_names=['GET'])
+@permission_classes([IsAuthenticated])
+def note_changes(request: Request):
+    if not changes.is_supported():
+        return Response(data={"detail": "Change tracking needs SQLite."},
+                        status=status.HTTP_501_NOT_IMPLEMENTED)
+    since = query_number(request, "since", 0)
+    page_size = min(query_number(request, "page_size", 100), 1000) or 100
+
+    data = changes.changes_since(request.user, since, page_size)
+    data["next"] = None
+    if data["more"]:
+        query = request.query_params.copy()
+        query["since"] = data["token"]
+        data["next"] = request.build_absolute_uri(f"{request.path}?{query.urlencode()}")
+    return Response(data=data, status=status.HTTP_200_OK)
+
+
+class ListNotesByTagFilter(note_cache.CachedListMixin, FastListMixin, SparseFieldsMixin, generics.GenericAPIView, mixins.ListModelMixin):
     """Filter note by tag"""
     queryset = Note.objects.all()
     serializer_class = NoteSerializer
+    pagination_class = NoteCursorPagination
     permission_classes = [IsAuthor]
 
     # we can accept the tags as part of the request.
     def get_queryset(self):
         user = self.request.user
-        notes = user.notes.all()
         tag = self.kwargs.get("tag")
-        return user.notes.filter(tags__name=tag)
+        return user.notes.filter(tags__owner=user, tags__name=tag).with_relations()
 
     @swagger_auto_schema(
         operation_summary="Filter note by tag name",
-        operation_description="This filters notes by a given tag for current user "
+        operation_description="This filters notes by a given tag for current user. "
+        "Takes ?fields= and ?view=summary like the note list"
     )
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
 
 
-class ListSearchNotesByKeyWord(generics.GenericAPIView, mixins.ListModelMixin):
+class ListNotesByTags(note_cache.CachedListMixin, FastListMixin, SparseFieldsMixin, generics.GenericAPIView, mixins.ListModelMixin):
+    """Filter notes by several tags, with facet counts"""
+    queryset = Note.objects.all()
+    serializer_class = NoteSerializer
+    pagination_class = NoteCursorPagination
+    permission_classes = [IsAuthenticated]
+
+    def get_tag_filter(self):
+        if not hasattr(self, "_tag_filter"):
+            self._tag_filter = facets.tag_filter(self.request.user, self.request.query_params)
+        return self._tag_filter
+
+    def get_queryset(self):
+        return facets.filter_notes(self.request.user.notes.with_relations(), self.get_tag_filter())
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data["facets"] = facets.facet_counts(self.request.user, self.get_tag_filter())
+        return response
+
+    @swagger_auto_schema(
+        operation_summary="Filter notes by tags",
+        operation_description="This returns notes of the current user that have all tags of ?all=, "
+        "at least one of ?any= and none of ?not= (comma-separated names), and under facets how many "
+        "of those notes carry each other tag. Takes ?fields= and ?view=summary like the note list"
+    )
+    def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
+
+
+class ListSearchNotesByKeyWord(note_cache.CachedListMixin, SparseFieldsMixin, generics.GenericAPIView, mixins.ListModelMixin):
     """Search note by keyword"""
     queryset = Note.objects.all()
     serializer_class = NoteSerializer
+    pagination_class = SearchResultsPagination
     permission_classes = [IsAuthor]
 
     def get_queryset(self):
         keyword = self.kwargs.get("keyword")
         user = self.request.user
-        return user.notes.filter(body__icontains=keyword)
+        return search_notes(user, keyword).with_relations()
 
     @swagger_auto_schema(
         operation_summary="Search note by keyword",
-        operation_description="This returns notes that contain a given keyword for current user "
+        operation_description="This returns notes of the current user whose title or body contains all of the "
+        "given words, best match first. End a word with * to match any word starting with it. "
+        "Takes ?fields= and ?view=summary like the note list"
     )
     def get(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
@@ -171,9 +342,9 @@ class TagCreateDeleteView(generics.GenericAPIView, mixins.CreateModelMixin, mixi
         note = Note.objects.get(pk=self.kwargs.get('note_id'))
         if note:
             if note.author == user:
-
-                serializer.save(note=note)
-                return super().perform_create(serializer)
+                tag_name = serializer.validated_data["name"]
+                note.add_tags([tag_name])
+                serializer.instance = Tag.objects.get(owner=user, name=tag_name)
             else:
                 return Response(data={"error": "you do not have"})
 
@@ -191,7 +362,7 @@ def add_tag_to_note(request: Request, pk):
     if user == note.author:
         # check if tag exists in note
         if note.tag_not_exists(tag_name):
-            tag = Tag.objects.create(note=note, name=tag_name)
+            note.add_tags([tag_name])
             serializer = NoteSerializer(note)
             return Response(data=serializer.data, status=status.HTTP_201_CREATED)
         return Response(data={"message": "Tag already exists"}, status=status.HTTP_400_BAD_REQUEST)
@@ -206,9 +377,7 @@ def remove_tag_from_note(request: Request, pk):
     user = request.user
     tag_name = request.data.get('tag')
     if note.author == user:
-        tag = Tag.objects.filter(name=tag_name)
-        if tag:
-            tag[0].delete()
+        if note.remove_tag(tag_name):
             serializer = NoteSerializer(note)
             return Response({
                 "message": f"tag {tag_name} deleted successfully",
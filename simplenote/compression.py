@@ -0,0 +1,147 @@
+"""
+Response compression: gzip, brotli and zstd.
+
+CompressionMiddleware in simplenote/middleware.py compresses response
+bodies in the encoding the client prefers in its Accept-Encoding header.
+gzip is always available, brotli needs the brotli package and zstd the
+zstandard package; encodings whose package is not installed are not
+offered.
+
+Streaming responses are compressed chunk by chunk, and every chunk is
+flushed, so a client receives each one as soon as the view yields it.
+"""
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULTS = {
+    "ENABLED": True,
+    # in order of preference, when the client accepts several equally
+    "ENCODINGS": ["br", "zstd", "gzip"],
+    "LEVELS": {"br": 4, "zstd": 3, "gzip": 6},
+    "MIN_SIZE": 1024,
+}
+
+# bodies that are compressed already, or nearly incompressible
+COMPRESSED_TYPES = (
+    "image/", "video/", "audio/", "font/woff", "application/zip",
+    "application/gzip", "application/x-gzip", "application/zstd", "application/pdf",
+)
+COMPRESSIBLE_IMAGES = ("image/svg+xml",)
+
+
+class GzipCompressor:
+    def __init__(self, level):
+        # a gzip header with no file name and no timestamp, so the same body
+        # always compresses to the same bytes
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self, level):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+COMPRESSORS = {
+    "gzip": GzipCompressor,
+    "br": BrotliCompressor if brotli else None,
+    "zstd": ZstdCompressor if zstandard else None,
+}
+
+
+def available(encoding) -> bool:
+    return COMPRESSORS.get(encoding) is not None
+
+
+def choose(accept_encoding, encodings):
+    """
+        The encoding of encodings that the Accept-Encoding header prefers,
+        or None to send the body as it is.
+
+        Higher q-values win, and the earlier of encodings among equal ones.
+    """
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, *params = part.split(";")
+        q = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name.strip().lower()] = q
+
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compressible(response) -> bool:
+    """Whether the body of response may be compressed at all"""
+    if response.has_header("Content-Encoding") or response.status_code == 206:
+        return False
+    content_type = response.get("Content-Type", "").lower()
+    return (not content_type.startswith(COMPRESSED_TYPES)
+            or content_type.startswith(COMPRESSIBLE_IMAGES))
+
+
+def compress(data, encoding, level) -> bytes:
+    compressor = COMPRESSORS[encoding](level)
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_stream(chunks, encoding, level):
+    """Compress an iterable of chunks, yielding every chunk as soon as it is compressed"""
+    compressor = COMPRESSORS[encoding](level)
+    for chunk in chunks:
+        if not chunk:
+            continue
+        data = compressor.compress(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
@@ -0,0 +1,274 @@
+"""
+Per-request instrumentation and database routing.
+
+RequestTimingMiddleware measures where the time of a request goes: the
+number and total duration of SQL queries, the time spent turning objects
+into data in serializers, authentication, and the whole view. They are
+sent back in a Server-Timing header, which browser dev tools display, and
+requests slower than a threshold are logged as one JSON object.
+
+The measurements hook into every database connection and into DRF once,
+when the middleware is loaded. With REQUEST_TIMING["ENABLED"] off the
+middleware removes itself and nothing is hooked at all.
+
+ReplicaRoutingMiddleware marks the start and end of each request for the
+read-replica router in simplenote/routers.py.
+
+CompressionMiddleware compresses response bodies with the encodings of
+simplenote/compression.py.
+"""
+import json
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.cache import patch_vary_headers
+
+logger = logging.getLogger("simplenote.requests")
+
+DEFAULTS = {
+    "ENABLED": True,
+    "SERVER_TIMING_HEADER": True,
+    "SLOW_REQUEST_MS": 500,
+}
+
+# timings of the request being handled, None outside of one
+current = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    __slots__ = ("queries", "sql", "serialize", "auth", "active")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql = self.serialize = self.auth = 0.0
+        # sections being measured, so nested calls are only counted once
+        self.active = set()
+
+
+def timing_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "REQUEST_TIMING", {})}
+
+
+def record_query(execute, sql, params, many, context):
+    timings = current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.sql += time.perf_counter() - start
+        timings.queries += 1
+
+
+def measured(section, fn):
+    """Wrap fn so that its duration is added to the section of the current request"""
+    def wrapper(*args, **kwargs):
+        timings = current.get()
+        if timings is None or section in timings.active:
+            return fn(*args, **kwargs)
+        timings.active.add(section)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            setattr(timings, section, getattr(timings, section) + time.perf_counter() - start)
+            timings.active.discard(section)
+    return wrapper
+
+
+def add_query_hook(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+_installed = False
+
+
+def install():
+    """Hook the measurements into the database connections and DRF, once per process"""
+    global _installed
+    if _installed:
+        return
+    from rest_framework.serializers import BaseSerializer
+    from rest_framework.views import APIView
+
+    connection_created.connect(add_query_hook)
+    for connection in connections.all(initialized_only=True):
+        add_query_hook(connection)
+    # Serializer.data and ListSerializer.data both end up in BaseSerializer.data
+    BaseSerializer.data = property(measured("serialize", BaseSerializer.data.fget))
+    APIView.perform_authentication = measured("auth", APIView.perform_authentication)
+    _installed = True
+
+
+class RequestTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = timing_settings()
+        if not config["ENABLED"]:
+            raise MiddlewareNotUsed
+        self.header = config["SERVER_TIMING_HEADER"]
+        self.slow = config["SLOW_REQUEST_MS"]
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            # so that Django awaits it under ASGI instead of running it in a thread
+            markcoroutinefunction(self)
+        install()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.report(request, response, timings, start)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = current.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.report(request, response, timings, start)
+
+    def report(self, request, response, timings, start):
+        total_ms = (time.perf_counter() - start) * 1000
+        if self.header:
+            response["Server-Timing"] = ", ".join([
+                f'db;dur={timings.sql * 1000:.1f};desc="{timings.queries} queries"',
+                f"serialize;dur={timings.serialize * 1000:.1f}",
+                f"auth;dur={timings.auth * 1000:.1f}",
+                f"view;dur={total_ms:.1f}",
+            ])
+        if self.slow is not None and total_ms >= self.slow:
+            match = request.resolver_match
+            record = {
+                "method": request.method,
+                "path": request.path,
+                "view": match.view_name if match else None,
+                "status": response.status_code,
+                "total_ms": round(total_ms, 1),
+                "sql_queries": timings.queries,
+                "sql_ms": round(timings.sql * 1000, 1),
+                "serialize_ms": round(timings.serialize * 1000, 1),
+                "auth_ms": round(timings.auth * 1000, 1),
+            }
+            logger.warning("slow request %s", json.dumps(record), extra={"request_timings": record})
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """Lets simplenote.routers.ReplicaRouter route the queries of each request"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        from . import routers
+
+        if not routers.replica_settings()["ALIASES"]:
+            raise MiddlewareNotUsed
+        self.routers = routers
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = self.routers.start_request(request)
+        try:
+            return self.get_response(request)
+        finally:
+            self.routers.end_request(token)
+
+    async def __acall__(self, request):
+        token = self.routers.start_request(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            self.routers.end_request(token)
+
+
+class CompressionMiddleware:
+    """
+        Compress responses with gzip, brotli or zstd, as the client's
+        Accept-Encoding header asks.
+
+        Bodies smaller than RESPONSE_COMPRESSION["MIN_SIZE"] are sent as they
+        are, as are responses that already have a Content-Encoding and types
+        that are compressed already. Streaming responses are always compressed.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        from . import compression
+
+        config = {**compression.DEFAULTS, **getattr(settings, "RESPONSE_COMPRESSION", {})}
+        self.encodings = [encoding for encoding in config["ENCODINGS"]
+                          if compression.available(encoding)]
+        if not config["ENABLED"] or not self.encodings:
+            raise MiddlewareNotUsed
+        self.levels = {**compression.DEFAULTS["LEVELS"], **config["LEVELS"]}
+        self.min_size = config["MIN_SIZE"]
+        self.compression = compression
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        compression = self.compression
+        if not compression.compressible(response):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = compression.choose(request.headers.get("Accept-Encoding", ""), self.encodings)
+        if encoding is None:
+            return response
+        level = self.levels[encoding]
+
+        if response.streaming:
+            response.streaming_content = compression.compress_stream(
+                response.streaming_content, encoding, level)
+            del response["Content-Length"]
+        else:
+            content = compression.compress(response.content, encoding, level)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response["Content-Length"] = str(len(content))
+
+        # the encoded bytes differ from the ones a strong ETag was made for
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response["Content-Encoding"] = encoding
+        return response
@@ -0,0 +1,132 @@
+"""
+Read replicas with read-your-writes.
+
+ReplicaRouter sends the reads of GET, HEAD and OPTIONS requests to one of
+the aliases in READ_REPLICAS["ALIASES"], picked once per request, and every
+other query to the primary ("default"). Reads outside of a request, e.g. in
+management commands, stay on the primary too.
+
+A user who has written is pinned to the primary for
+READ_REPLICAS["STICKY_SECONDS"], so a GET right after a POST sees the POST
+even if the replicas lag behind. The pin is kept in the Django cache, which
+has to be shared by all processes for it to hold across them: Redis when
+REDIS_URL is set, otherwise it only holds within one process.
+
+ReplicaRoutingMiddleware in simplenote/middleware.py tells the router which
+request it is serving.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.functional import SimpleLazyObject, empty
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+PIN_KEY = "db:primary-until:{}"
+
+DEFAULTS = {
+    "ALIASES": [],
+    "STICKY_SECONDS": 5,
+}
+
+# routing state of the request being handled, None outside of one
+current = ContextVar("db_routing", default=None)
+
+
+def replica_settings() -> dict:
+    return {**DEFAULTS, **getattr(settings, "READ_REPLICAS", {})}
+
+
+class RoutingState:
+    __slots__ = ("request", "replica", "pinned", "wrote")
+
+    def __init__(self, request, replica):
+        self.request = request
+        # None when the request reads from the primary
+        self.replica = replica
+        # whether the request's user is pinned, None until the user is known
+        self.pinned = None
+        self.wrote = False
+
+
+def start_request(request):
+    """Pick where the reads of request go, returns a token for end_request"""
+    aliases = replica_settings()["ALIASES"]
+    replica = random.choice(aliases) if aliases and request.method in SAFE_METHODS else None
+    return current.set(RoutingState(request, replica))
+
+
+def end_request(token):
+    state = current.get()
+    current.reset(token)
+    if state is not None and state.wrote:
+        user_id = request_user_id(state.request)
+        if user_id is not None:
+            pin_to_primary(user_id)
+
+
+def request_user_id(request):
+    # DRF sets the authenticated user on the underlying request as well
+    user = getattr(request, "user", None)
+    if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        # AuthenticationMiddleware's user, not loaded yet: loading it here
+        # would read the session and the user, which are routed here again
+        return None
+    if user is None or not user.is_authenticated:
+        return None
+    return user.pk
+
+
+def pin_to_primary(user_id):
+    seconds = replica_settings()["STICKY_SECONDS"]
+    if seconds > 0:
+        cache.set(PIN_KEY.format(user_id), time.time() + seconds, seconds)
+
+
+def is_pinned(user_id) -> bool:
+    until = cache.get(PIN_KEY.format(user_id))
+    return until is not None and until > time.time()
+
+
+def reading_from_replica() -> bool:
+    """Whether reads may currently be served by a replica that lags behind"""
+    state = current.get()
+    return state is not None and read_alias(state) != DEFAULT_DB_ALIAS
+
+
+def read_alias(state) -> str:
+    if state.replica is None or state.wrote:
+        return DEFAULT_DB_ALIAS
+    if state.pinned is None:
+        # reads made before authentication, e.g. the user lookup itself,
+        # may use the replica; the pin is checked once the user is known
+        user_id = request_user_id(state.request)
+        if user_id is None:
+            return state.replica
+        state.pinned = is_pinned(user_id)
+    return DEFAULT_DB_ALIAS if state.pinned else state.replica
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = current.get()
+        if state is None:
+            return DEFAULT_DB_ALIAS
+        return read_alias(state)
+
+    def db_for_write(self, model, **hints):
+        state = current.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas are copies of the primary and are never migrated themselves
+        return db == DEFAULT_DB_ALIAS
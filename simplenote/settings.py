@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
+from importlib.util import find_spec
 from pathlib import Path
 from datetime import timedelta
 
@@ -24,9 +26,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-_e+#fte8chyc-)hco(t-xy=5-(260=jhlw)mo)^s-4(pypru#5'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') == '1'
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
 
 
 # Application definition
@@ -49,6 +51,9 @@ INSTALLED_APPS = [
 
 AUTH_USER_MODEL = "accounts.User"
 MIDDLEWARE = [
+    'simplenote.middleware.RequestTimingMiddleware',
+    'simplenote.middleware.ReplicaRoutingMiddleware',
+    'simplenote.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,18 +63,41 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# gunicorn serves the collected static files itself, for the admin and
+# swagger, when whitenoise is installed
+if find_spec('whitenoise'):
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+        'whitenoise.middleware.WhiteNoiseMiddleware')
+
 ROOT_URLCONF = 'simplenote.urls'
 
 REST_FRAMEWORK = {
     "NON_FIELD_ERRORS_KEY": "errors",
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "accounts.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
-    )
+    ),
+    "DEFAULT_RENDERER_CLASSES": (
+        "notes.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "rest_framework.parsers.JSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
 }
 
+# MessagePack and CBOR, for clients that send Accept: application/msgpack or
+# application/cbor, when their packages are installed
+for package, name in (("msgpack", "MessagePack"), ("cbor2", "CBOR")):
+    if find_spec(package):
+        REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"] += (f"notes.renderers.{name}Renderer",)
+        REST_FRAMEWORK["DEFAULT_PARSER_CLASSES"] += (f"notes.parsers.{name}Parser",)
+
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
         'Bearer': {
@@ -87,6 +115,61 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# verified tokens and their users are cached per process,
+# see accounts/authentication.py
+JWT_AUTH_CACHE = {
+    'TOKEN_CACHE_SIZE': 10000,
+    'USER_CACHE_SIZE': 10000,
+    # seconds before a cached user is read from the database again
+    'USER_TTL': 60,
+}
+
+# serve the note read endpoints with the async views in notes/async_views.py,
+# for ASGI servers such as uvicorn
+ASYNC_NOTE_VIEWS = False
+
+# per-request SQL, serializer and auth timings, see simplenote/middleware.py
+REQUEST_TIMING = {
+    'ENABLED': True,
+    # send the timings to the client in a Server-Timing header
+    'SERVER_TIMING_HEADER': True,
+    # requests that take longer are logged to simplenote.requests, None to turn off
+    'SLOW_REQUEST_MS': 500,
+}
+
+# gzip, brotli and zstd response bodies, see simplenote/compression.py
+RESPONSE_COMPRESSION = {
+    'ENABLED': True,
+    # preferred first; zstd is used when the zstandard package is installed
+    'ENCODINGS': ['br', 'zstd', 'gzip'],
+    'LEVELS': {'br': 4, 'zstd': 3, 'gzip': 6},
+    # smaller bodies are sent as they are
+    'MIN_SIZE': 1024,
+}
+
+# note bodies stored zlib-compressed, see notes/bodies.py
+NOTE_BODY_COMPRESSION = {
+    # bodies of at least this many bytes, None to store every body as it is
+    'MIN_SIZE': 4096,
+    'LEVEL': 6,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'simplenote.requests': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+    },
+}
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -111,11 +194,83 @@ WSGI_APPLICATION = 'simplenote.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # django.db.backends.sqlite3 plus the pragmas, transaction_mode and
+        # functions options, see simplenote/sqlite3/base.py
+        'ENGINE': 'simplenote.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # keep connections open between requests, checked before reuse
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                # readers and the writer no longer block each other
+                'journal_mode': 'WAL',
+                # with WAL, only a power loss can drop the last commits
+                'synchronous': 'NORMAL',
+                # milliseconds a statement waits for a lock before "database is locked"
+                'busy_timeout': 10000,
+                # 64 MiB of page cache and 256 MiB of memory-mapped reads
+                'cache_size': -64000,
+                'mmap_size': 268435456,
+                'temp_store': 'MEMORY',
+            },
+            # the text of compressed note bodies in SQL, see notes/bodies.py
+            'functions': {
+                'note_body': 'notes.bodies.text',
+            },
+        },
     }
 }
 
+# Read replicas: SQLite copies of the primary, refreshed with
+# `manage.py sync_replicas`, listed in SIMPLENOTE_SQLITE_REPLICAS
+replica_files = [path for path in os.environ.get('SIMPLENOTE_SQLITE_REPLICAS', '').split(',') if path]
+for number, path in enumerate(replica_files, 1):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'NAME': path,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['simplenote.routers.ReplicaRouter']
+
+# see simplenote/routers.py
+READ_REPLICAS = {
+    'ALIASES': [alias for alias in DATABASES if alias != 'default'],
+    # seconds a user's reads stay on the primary after they wrote
+    'STICKY_SECONDS': 5,
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+# The note caches, their generation counters and the replica pins are only
+# correct when every process sees the same cache. Set REDIS_URL, e.g.
+# redis://redis:6379/0 as in docker-compose.yml, to share one; without it the
+# cache is local to the process and gunicorn.conf.py runs a single worker.
+REDIS_URL = os.environ.get('REDIS_URL', '')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'simplenote',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'simplenote',
+        }
+    }
+
+# seconds a public note stays in the response cache
+NOTE_CACHE_TIMEOUT = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -153,6 +308,9 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# collectstatic puts the files here, WhiteNoiseMiddleware serves them
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -0,0 +1,44 @@
+"""
+SQLite backend with per-connection tuning.
+
+Django's SQLite backend opens connections with the library defaults, which
+suit a single writer. This one takes three more OPTIONS:
+
+    "pragmas": {"journal_mode": "WAL", "synchronous": "NORMAL", ...}
+        run as PRAGMA statements on every new connection
+    "transaction_mode": "IMMEDIATE"
+        how atomic() begins its transactions. A deferred transaction that
+        reads before it writes cannot wait for the write lock and fails at
+        once with "database is locked"; an immediate one takes the lock
+        up front and waits for it like any other statement.
+    "functions": {"note_body": "notes.bodies.text", ...}
+        one-argument Python functions registered as SQL functions on every
+        new connection, by dotted path
+"""
+from django.db.backends.sqlite3 import base
+from django.utils.module_loading import import_string
+
+TRANSACTION_MODES = {"DEFERRED", "IMMEDIATE", "EXCLUSIVE"}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop("pragmas", None)
+        params.pop("transaction_mode", None)
+        params.pop("functions", None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict["OPTIONS"].get("pragmas", {}).items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        for name, path in self.settings_dict["OPTIONS"].get("functions", {}).items():
+            conn.create_function(name, 1, import_string(path), deterministic=True)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict["OPTIONS"].get("transaction_mode", "DEFERRED").upper()
+        if mode not in TRANSACTION_MODES:
+            raise ValueError(f"Unknown SQLite transaction_mode {mode!r}")
+        self.cursor().execute(f"BEGIN {mode}")
@@ -5,6 +5,8 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from . import views
+
 schema_view = get_schema_view(
     openapi.Info(
         title="Notes API",
@@ -18,6 +20,7 @@ schema_view = get_schema_view(
 
 
 urlpatterns = [
+    path("healthz/", views.health, name="health"),
     re_path(r'^swagger(?P<format>\.json|\.yaml)$',
             schema_view.without_ui(cache_timeout=0), name='schema-json'),
     path('', schema_view.with_ui('swagger', cache_timeout=0),
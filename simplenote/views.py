@@ -0,0 +1,11 @@
+from django.http import JsonResponse
+
+
+def health(request):
+    """
+        Liveness and readiness check for load balancers and orchestrators.
+
+        Plain Django, so no authentication runs, and it never queries the
+        database: a worker that can answer is ready to take requests.
+    """
+    return JsonResponse({"status": "ok"})